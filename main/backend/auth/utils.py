@@ -3,8 +3,8 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
 from typing import Optional
-from sqlmodel import Session, select
-from main.backend.db import engine
+from sqlmodel import select
+from main.backend.db import new_session
 from main.backend.models import User
 from dotenv import load_dotenv
 import os
@@ -32,8 +32,12 @@ def get_current_user_optional(token: Optional[str] = Depends(oauth2_scheme)) ->
         email = payload.get("sub")
         if email is None:
             return None
-        with Session(engine) as session:
+        # Own short session: a request-scoped one would stay open for the whole upload
+        with new_session() as session:
             return session.exec(select(User).where(User.email == email)).first()
     except JWTError:
         # header was present but token invalid → reject
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+
+def get_current_user_id_optional(user: Optional[User] = Depends(get_current_user_optional)) -> Optional[int]:
+    return user.id if user else None
@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.schedules import crontab
 import os
 
 REDIS_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
@@ -7,7 +8,47 @@ celery_app = Celery(
     "worker",
     broker=REDIS_URL,
     backend=REDIS_URL,
+    include=[
+        "main.backend.services.llm",
+        "main.backend.services.rollups",
+        "main.backend.services.reports",
+    ],
 )
 
 celery_app.conf.task_track_started = True
 celery_app.conf.result_expires = 3600
+
+# LLM questions from people and scheduled reports get their own queues. With
+# the priority strategy a worker started as
+#   celery -A main.backend.celery_worker worker --pool threads -Q llm_interactive,llm_scheduled,celery
+# always drains them in that order. Thread pool so LLMExecutor can coalesce
+# identical prompts and bound Ollama concurrency across tasks.
+LLM_INTERACTIVE_QUEUE = "llm_interactive"
+LLM_SCHEDULED_QUEUE = "llm_scheduled"
+celery_app.conf.task_routes = {
+    "main.backend.services.llm.run_llm_task": {"queue": LLM_INTERACTIVE_QUEUE},
+    "main.backend.services.reports.refresh_reports": {"queue": LLM_SCHEDULED_QUEUE},
+}
+celery_app.conf.broker_transport_options = {"queue_order_strategy": "priority"}
+
+# Run with `celery -A main.backend.celery_worker beat` next to the worker
+ROLLUP_REFRESH_SECONDS = int(os.getenv("ROLLUP_REFRESH_SECONDS", "3600"))
+# Today's report goes stale quickly; the longer ranges are rebuilt nightly
+REPORT_DAILY_REFRESH_SECONDS = int(os.getenv("REPORT_DAILY_REFRESH_SECONDS", "900"))
+REPORT_NIGHTLY_HOUR = int(os.getenv("REPORT_NIGHTLY_HOUR", "2"))
+celery_app.conf.beat_schedule = {
+    "refresh-rollups": {
+        "task": "main.backend.services.rollups.refresh_rollups",
+        "schedule": ROLLUP_REFRESH_SECONDS,
+    },
+    "refresh-daily-report": {
+        "task": "main.backend.services.reports.refresh_reports",
+        "schedule": REPORT_DAILY_REFRESH_SECONDS,
+        "kwargs": {"ranges": ["daily"]},
+    },
+    "refresh-nightly-reports": {
+        "task": "main.backend.services.reports.refresh_reports",
+        "schedule": crontab(hour=REPORT_NIGHTLY_HOUR, minute=0),
+        "kwargs": {"ranges": ["weekly", "monthly", "yearly"]},
+    },
+}
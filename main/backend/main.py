@@ -3,7 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from sqlmodel import SQLModel
 from pathlib import Path
-from main.backend.db import engine
+from main.backend import db
+from main.backend.migrations import locked_transaction, run_migrations
 from main.backend.auth.routes import router as auth_router
 from main.backend.routes.detection import router as detection_router
 from main.backend.routes import llm, analytics
@@ -28,4 +29,10 @@ app.include_router(detection_router, tags=["Detection"])
 app.include_router(llm.router, prefix="/llm", tags=["LLM"])
 app.include_router(analytics.router, prefix="/analytics", tags=["Analytics"])
 
-SQLModel.metadata.create_all(engine)
+@app.on_event("startup")
+def migrate_database():
+    # Not at import: workers start together and take turns through the
+    # migration lock. `python -m main.backend.migrations` migrates by hand
+    with locked_transaction(db.engine) as connection:
+        SQLModel.metadata.create_all(connection)
+    run_migrations(db.engine)
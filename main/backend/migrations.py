@@ -0,0 +1,222 @@
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, text
+
+
+def add_character_plate_id(connection):
+    """Add characterbox.plate_id and link existing characters to their plate.
+
+    Old rows only carry detection_id. The previous save path inserted each
+    plate's characters in order right after the plate, and the plate string
+    has one letter per character ("UNKNOWN" meaning none), so characters
+    ordered by id can be handed out to the detection's plates in order.
+    Detections where the counts don't add up are left unlinked.
+    """
+    columns = {c["name"] for c in inspect(connection).get_columns("characterbox")}
+    if "plate_id" not in columns:
+        connection.execute(text(
+            "ALTER TABLE characterbox ADD COLUMN plate_id INTEGER REFERENCES plateinfo (id)"
+        ))
+
+    plates_by_detection = {}
+    for plate_id, detection_id, plate_string in connection.execute(text(
+        "SELECT id, detection_id, plate_string FROM plateinfo ORDER BY detection_id, id"
+    )):
+        n_chars = 0 if plate_string == "UNKNOWN" else len(plate_string)
+        plates_by_detection.setdefault(detection_id, []).append((plate_id, n_chars))
+
+    chars_by_detection = {}
+    for char_id, detection_id in connection.execute(text(
+        "SELECT id, detection_id FROM characterbox WHERE plate_id IS NULL ORDER BY detection_id, id"
+    )):
+        chars_by_detection.setdefault(detection_id, []).append(char_id)
+
+    updates = []
+    for detection_id, char_ids in chars_by_detection.items():
+        plates = plates_by_detection.get(detection_id, [])
+        if sum(n for _, n in plates) != len(char_ids):
+            continue
+        start = 0
+        for plate_id, n_chars in plates:
+            updates.extend(
+                {"plate_id": plate_id, "id": char_id}
+                for char_id in char_ids[start:start + n_chars]
+            )
+            start += n_chars
+
+    if updates:
+        connection.execute(
+            text("UPDATE characterbox SET plate_id = :plate_id WHERE id = :id"),
+            updates,
+        )
+
+
+INDEXES = [
+    ("ix_user_email", "user", "email"),
+    ("ix_detectionrecord_timestamp", "detectionrecord", "timestamp"),
+    ("ix_detectionrecord_user_id", "detectionrecord", "user_id"),
+    ("ix_plateinfo_detection_id", "plateinfo", "detection_id"),
+    ("ix_plateinfo_plate_string", "plateinfo", "plate_string"),
+    ("ix_characterbox_detection_id", "characterbox", "detection_id"),
+    ("ix_characterbox_plate_id", "characterbox", "plate_id"),
+]
+
+
+def add_detection_indexes(connection):
+    # Same names SQLModel gives Field(index=True), so fresh databases are a no-op
+    for name, table, column in INDEXES:
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({column})'))
+
+
+def add_search_keyset_index(connection):
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_detectionrecord_timestamp_id ON detectionrecord (timestamp, id)"
+    ))
+
+
+def add_plate_search_index(connection):
+    """Add plateinfo.plate_key and build the plate trigram index for existing plates."""
+    from main.backend.models import PlateTrigram
+    from main.backend.services.plate_index import normalize_plate, trigram_rows
+
+    columns = {c["name"] for c in inspect(connection).get_columns("plateinfo")}
+    if "plate_key" not in columns:
+        connection.execute(text("ALTER TABLE plateinfo ADD COLUMN plate_key VARCHAR"))
+    PlateTrigram.__table__.create(connection, checkfirst=True)
+
+    keys = []
+    grams = []
+    for plate_id, plate_string in connection.execute(text(
+        "SELECT id, plate_string FROM plateinfo WHERE plate_key IS NULL"
+    )):
+        key = normalize_plate(plate_string)
+        keys.append({"plate_key": key, "id": plate_id})
+        grams.extend(trigram_rows(plate_id, key))
+
+    if keys:
+        connection.execute(text("UPDATE plateinfo SET plate_key = :plate_key WHERE id = :id"), keys)
+    if grams:
+        connection.execute(
+            text("INSERT INTO platetrigram (trigram, plate_id) VALUES (:trigram, :plate_id)"),
+            grams,
+        )
+
+
+def add_rollup_tables(connection):
+    """Create the hourly/daily rollup tables and fill them from existing detections."""
+    from sqlmodel import Session
+    from main.backend.models import DetectionRollup, PlateRollup
+    from main.backend.services.rollups import rebuild_rollups
+
+    DetectionRollup.__table__.create(connection, checkfirst=True)
+    PlateRollup.__table__.create(connection, checkfirst=True)
+    rebuild_rollups(Session(bind=connection))
+
+
+def add_report_snapshots(connection):
+    from main.backend.models import ReportSnapshot
+
+    ReportSnapshot.__table__.create(connection, checkfirst=True)
+
+
+def add_content_hash(connection):
+    columns = {c["name"] for c in inspect(connection).get_columns("detectionrecord")}
+    if "content_hash" not in columns:
+        connection.execute(text("ALTER TABLE detectionrecord ADD COLUMN content_hash VARCHAR"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_detectionrecord_content_hash ON detectionrecord (content_hash)"
+    ))
+
+
+def add_plate_boxes(connection):
+    columns = {c["name"] for c in inspect(connection).get_columns("plateinfo")}
+    for column in ("x1", "y1", "x2", "y2"):
+        if column not in columns:
+            connection.execute(text(f"ALTER TABLE plateinfo ADD COLUMN {column} INTEGER"))
+
+
+def add_plate_distance(connection):
+    # Fuzzy plate search calls levenshtein() on Postgres; SQLite gets a
+    # Python function on connect instead (see services/plate_index.py)
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS fuzzystrmatch"))
+
+
+# Append only: (version, name, migration). Applied versions are recorded in
+# schema_version and never re-run.
+MIGRATIONS = [
+    (1, "add_character_plate_id", add_character_plate_id),
+    (2, "add_detection_indexes", add_detection_indexes),
+    (3, "add_search_keyset_index", add_search_keyset_index),
+    (4, "add_plate_search_index", add_plate_search_index),
+    (5, "add_rollup_tables", add_rollup_tables),
+    (6, "add_report_snapshots", add_report_snapshots),
+    (7, "add_content_hash", add_content_hash),
+    (8, "add_plate_boxes", add_plate_boxes),
+    (9, "add_plate_distance", add_plate_distance),
+]
+
+
+# pg_advisory_xact_lock key shared by every process migrating the same database
+MIGRATION_LOCK_KEY = 8_140_227
+
+
+@contextmanager
+def locked_transaction(engine):
+    """A transaction that holds the migration lock until it commits.
+
+    Processes started together (``uvicorn --workers N``) queue here instead
+    of applying the same migration at once. SQLite takes its write lock up
+    front with ``BEGIN IMMEDIATE``; Postgres uses an advisory lock.
+    """
+    with engine.connect() as connection:
+        if connection.dialect.name == "sqlite":
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        elif connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        yield connection
+        connection.commit()
+
+
+def applied_versions(connection) -> set:
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    return set(connection.execute(text("SELECT version FROM schema_version")).scalars())
+
+
+def run_migrations(engine, migrations=MIGRATIONS) -> list:
+    """Apply pending migrations in version order, one locked transaction each.
+
+    Safe to run from several processes at once. Returns the versions that
+    this call applied.
+    """
+    with locked_transaction(engine) as connection:
+        done = applied_versions(connection)
+
+    applied = []
+    for version, name, migrate in sorted(migrations, key=lambda m: m[0]):
+        if version in done:
+            continue
+        with locked_transaction(engine) as connection:
+            # Another process may have applied it while this one waited
+            if version in applied_versions(connection):
+                continue
+            migrate(connection)
+            connection.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow()},
+            )
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    # python -m main.backend.migrations [DATABASE_URL]
+    from main.backend.db import DATABASE_URL
+
+    url = sys.argv[1] if len(sys.argv) > 1 else DATABASE_URL
+    print("Applied migrations:", run_migrations(create_engine(url)) or "none")
@@ -1,20 +1,24 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Column, Index, JSON
 from typing import Optional, List
 from passlib.hash import bcrypt
 from datetime import datetime
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    email: str
+    email: str = Field(index=True)
 
     uploads: List["DetectionRecord"] = Relationship(back_populates="user")
 
 class DetectionRecord(SQLModel, table=True):
+    # Keyset pagination in /search walks (timestamp, id)
+    __table_args__ = (Index("ix_detectionrecord_timestamp_id", "timestamp", "id"),)
+
     id: int | None = Field(default=None, primary_key=True)
     filename: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=datetime.utcnow, index=True)
     annotated_image: str
-    user_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id", index=True)
     user: Optional[User] = Relationship(back_populates="uploads")
 
     plates: List["PlateInfo"] = Relationship(back_populates="detection")
@@ -23,25 +27,73 @@ class DetectionRecord(SQLModel, table=True):
     feedback: Optional[str] = None  
     model_version: Optional[str] = None 
     confidence_threshold: Optional[float] = None
+    # sha256 of the uploaded file (see services/ingest.py)
+    content_hash: Optional[str] = Field(default=None, index=True)
 
 
 class PlateInfo(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    detection_id: int = Field(foreign_key="detectionrecord.id")
+    detection_id: int = Field(foreign_key="detectionrecord.id", index=True)
     detection: "DetectionRecord" = Relationship(back_populates="plates")
     plate_crop_path: str
     annotated_crop_path: Optional[str] = None
-    plate_string: str
+    plate_string: str = Field(index=True)
+    # plate_string normalised for search (see services/plate_index.py)
+    plate_key: Optional[str] = None
     plate_confidence: float
+    # Plate box on the original image; annotated images are rendered from it
+    x1: Optional[int] = None
+    y1: Optional[int] = None
+    x2: Optional[int] = None
+    y2: Optional[int] = None
+
+    characters: List["CharacterBox"] = Relationship(back_populates="plate")
 
 
 class CharacterBox(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    detection_id: int = Field(foreign_key="detectionrecord.id")
+    detection_id: int = Field(foreign_key="detectionrecord.id", index=True)
     detection: Optional["DetectionRecord"] = Relationship(back_populates="characters")
+    plate_id: Optional[int] = Field(default=None, foreign_key="plateinfo.id", index=True)
+    plate: Optional["PlateInfo"] = Relationship(back_populates="characters")
     class_id: int
     confidence: float
     x1: int
     y1: int
     x2: int
     y2: int
+
+
+class PlateTrigram(SQLModel, table=True):
+    trigram: str = Field(primary_key=True)
+    plate_id: int = Field(foreign_key="plateinfo.id", primary_key=True, index=True)
+
+
+# Incremental aggregates kept up to date on ingest (see services/rollups.py);
+# period is "hour" or "day" and bucket the start of that hour/day
+class DetectionRollup(SQLModel, table=True):
+    period: str = Field(primary_key=True)
+    bucket: datetime = Field(primary_key=True)
+    detection_count: int = 0
+    plate_count: int = 0
+    confidence_sum: float = 0.0
+
+
+class PlateRollup(SQLModel, table=True):
+    period: str = Field(primary_key=True)
+    bucket: datetime = Field(primary_key=True)
+    plate_string: str = Field(primary_key=True)
+    count: int = 0
+
+
+# Precomputed /analytics/report payloads (see services/reports.py); version
+# counts up per range
+class ReportSnapshot(SQLModel, table=True):
+    __table_args__ = (Index("ix_reportsnapshot_range_version", "range", "version"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    range: str
+    version: int
+    generated_at: datetime = Field(default_factory=datetime.utcnow)
+    data: dict = Field(default_factory=dict, sa_column=Column(JSON))
+    narrative: Optional[str] = None
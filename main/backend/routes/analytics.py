@@ -1,62 +1,36 @@
-from collections import Counter, defaultdict
-from fastapi import APIRouter, Query
-from main.backend.services.llm import (
-    generate_daily_summary,
-    generate_weekly_summary,
-    generate_monthly_summary,
-    generate_yearly_summary,
-    generate_trend_summary,
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from main.backend.services.reports import (
+    build_report,
+    latest_snapshot,
+    refresh_snapshot,
+    snapshot_response,
 )
-from main.backend.models import PlateInfo, DetectionRecord
-from sqlmodel import Session, select
-from main.backend.db import engine
+from sqlmodel import Session
+from main.backend.db import get_session
 
 router = APIRouter()
 
 @router.get("/report")
 def get_report(
     range: str = Query("daily", regex="^(daily|weekly|monthly|yearly)$"),
-    rich: bool = False
+    rich: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    top_n: Optional[int] = Query(None, ge=1),
+    refresh: bool = False,
+    session: Session = Depends(get_session),
 ):
-
-    if range == "weekly":
-        base_summary = generate_weekly_summary()
-    elif range == "monthly":
-        base_summary = generate_monthly_summary()
-    elif range == "yearly":
-        base_summary = generate_yearly_summary()
-    else:
-        base_summary = generate_daily_summary()
-
-    response = {"summary": base_summary}
-
-    if rich:
-        trends = generate_trend_summary(range)
-        response["trends"] = trends
-
-        # Extra analytics: plate frequency and accuracy trends
-        with Session(engine) as session:
-            plates = session.exec(select(PlateInfo.plate_string)).all()
-            valid_plates = [p for p in plates if p and p.strip()]
-            counter = Counter(valid_plates)
-            response["plate_frequency"] = sorted(
-                [{"plate": plate, "count": count} for plate, count in counter.items()],
-                key=lambda x: x["count"],
-                reverse=True
-            )
-            # Accuracy trends
-            records = session.exec(
-                select(PlateInfo, DetectionRecord)
-                .join(DetectionRecord, PlateInfo.detection_id == DetectionRecord.id)
-            ).all()
-            trends_map = defaultdict(list)
-            for plate, record in records:
-                day = str(record.timestamp).split("T")[0]
-                trends_map[day].append(plate.plate_confidence)
-
-            response["accuracy_trends"] = [
-                {"date": date, "avg_confidence": round(sum(confs) / len(confs), 4)}
-                for date, confs in sorted(trends_map.items())
-            ]
-
-    return response
+    # Custom analytics windows aren't precomputed
+    if rich and (start or end or top_n):
+        response = build_report(session, range, start, end, top_n)
+        response["generated_at"] = datetime.utcnow().isoformat()
+        return response
+
+    # Served from the latest snapshot the beat jobs stored (see services/reports.py);
+    # refresh=true, or no snapshot yet, builds and stores a new one first
+    snapshot = None if refresh else latest_snapshot(session, range)
+    if snapshot is None:
+        snapshot = refresh_snapshot(session, range)
+    return snapshot_response(snapshot, rich)
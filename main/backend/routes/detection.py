@@ -1,222 +1,547 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Path, Query, Request
-from fastapi.responses import JSONResponse, FileResponse
-from sqlmodel import Session, select, delete
-from datetime import datetime
+from fastapi import APIRouter, Body, UploadFile, File, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select, delete, func, and_, or_
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from typing import List, Optional
-from collections import defaultdict, Counter
-import shutil, os, tempfile, zipfile
-
-from main.backend.db import engine, get_session
-from main.backend.models import DetectionRecord, PlateInfo, CharacterBox, User
-from main.backend.services.yolo import detect_plates_and_characters
-from main.backend.services.save import save_detection_to_db
-from main.backend.auth.utils import get_current_user_optional
-from main.backend.services.llm import run_llm_task
+import asyncio, base64, copy, json, os
+import cv2
+import numpy as np
+
+from main.backend.db import get_session, new_session
+from main.backend.models import DetectionRecord, PlateInfo, CharacterBox, PlateTrigram
+from main.backend.services.yolo import detect_batch, detection_cache, static_file, wait_for_artifacts
+from main.backend.services.registry import registry
+from main.backend.services.jobs import (
+    DetectionJob, DETECTION_CHUNK_SIZE, VIDEO_RESULTS_KEPT, chunked, create_job, detection_pool, get_job,
+    video_pool,
+)
+from main.backend.services.save import save_detections_bulk
+from main.backend.services.plate_index import plate_exists, search_plates
+from main.backend.services.analytics import plate_frequency, accuracy_trends
+from main.backend.services.export import stream_zip, zip_entries
+from main.backend.services.ingest import StoredUpload, UploadRejected, previous_result, store_upload
+from main.backend.services.render import (
+    PERSIST_ARTIFACTS, RENDER_KINDS, crop_render, detection_render, plate_render, record_render,
+)
+from main.backend.services.rollups import bucket_start, rebuild_rollups
+from main.backend.services.video import VideoPipeline
+from main.backend.auth.utils import get_current_user_id_optional
+from main.backend.services.llm import run_llm_task, replay_cached_answer, make_scope
 
 router = APIRouter()
-UPLOAD_DIR = "../data/"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+ARTIFACT_WAIT_SECONDS = float(os.getenv("ARTIFACT_WAIT_SECONDS", "10"))
 
 def to_static_path(local_path: str) -> str:
     # local_path like 'runs/results/annotated_x.jpg' → '/static/results/annotated_x.jpg'
+    if local_path.startswith("/"):
+        return local_path                            # already a URL (/static/, /render/)
     rel = os.path.relpath(local_path, "runs")        # strip the leading 'runs/'
     return f"/static/{rel}"
 
-@router.post("/upload")
-async def upload(files: List[UploadFile] = File(...), user: Optional[User] = Depends(get_current_user_optional)):
-    results = []
-    for file in files:
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        result = detect_plates_and_characters(file_path)
+async def _stage_uploads(files: List[UploadFile], kind: str = "image"):
+    entries = []
+    for index, file in enumerate(files):
+        try:
+            upload = await store_upload(file, kind)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        entries.append((index, file.filename, upload))
+    return entries
+
+def _decode(upload: StoredUpload):
+    frame = cv2.imdecode(np.frombuffer(upload.data, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError(f"Could not decode {upload.filename}")
+    return frame
+
+def _detect_and_save(entries, user_id: Optional[int]):
+    # Runs on the detection pool, never on the event loop
+    model_version = registry.model_version()
+    # Saved uploads are rendered on request from the original and the stored
+    # boxes; unsaved ones only exist as files
+    artifacts = PERSIST_ARTIFACTS or user_id is None
+
+    # Content seen before (gateway retries, re-uploads) reuses its stored
+    # result; repeats within this batch are detected once
+    by_hash = {}
+    with new_session() as session:
+        for _, _, upload in entries:
+            if upload.content_hash not in by_hash:
+                previous = previous_result(session, upload.content_hash, model_version) if upload.duplicate else None
+                if previous is not None and artifacts and previous["annotated_image"] is None:
+                    previous = None
+                by_hash[upload.content_hash] = previous
+    pending = {}
+    for _, _, upload in entries:
+        if by_hash[upload.content_hash] is None:
+            pending.setdefault(upload.content_hash, upload)
+    if pending:
+        detected = detect_batch(
+            [_decode(upload) for upload in pending.values()], content_hashes=list(pending), artifacts=artifacts
+        )
+        by_hash.update(zip(pending, detected))
+
+    results = [copy.deepcopy(by_hash[upload.content_hash]) for _, _, upload in entries]
+    for (_, _, upload), result in zip(entries, results):
         result["annotated_image_path"] = result["annotated_image"]
-            
-        if user:
-            with Session(engine) as session:
-                record = save_detection_to_db(session, file.filename, result, user_id=user.id)
-        else:
-            record = None
-
+        result["content_hash"] = upload.content_hash
+
+    if user_id is not None:
+        with new_session() as session:
+            save_detections_bulk(
+                session,
+                [(filename, result) for (_, filename, _), result in zip(entries, results)],
+                user_id=user_id, model_version=model_version
+            )
+
+    items = []
+    for (index, filename, _), result in zip(entries, results):
         static_annotated = to_static_path(result["annotated_image"])
         result["annotated_image"] = static_annotated
         for det in result["detections"]:
             det["plate_crop_path"] = to_static_path(det["plate_crop_path"])
 
-        results.append({
-            "filename": file.filename,
+        items.append({
+            "index": index,
+            "filename": filename,
             "timestamp": datetime.now().isoformat(),
             "annotated_image": result["annotated_image"],
             "detections": result["detections"],
-            "saved": user is not None
+            "saved": user_id is not None
         })
+    return items
+
+async def _run_detection_job(job: DetectionJob, entries, user_id: Optional[int]):
+    loop = asyncio.get_running_loop()
+
+    async def run_chunk(chunk):
+        items = await loop.run_in_executor(detection_pool, _detect_and_save, chunk, user_id)
+        # Artifacts are written in the background; results only go out once their images exist
+        await loop.run_in_executor(None, wait_for_artifacts, items, ARTIFACT_WAIT_SECONDS)
+        for item in items:
+            job.add_result(item)
+
+    job.status = "running"
+    # Finish only once every chunk has stopped, so no result lands after the final status
+    outcomes = await asyncio.gather(
+        *(run_chunk(c) for c in chunked(entries, DETECTION_CHUNK_SIZE)), return_exceptions=True
+    )
+    errors = [str(o) for o in outcomes if isinstance(o, Exception)]
+    job.finish(error=errors[0] if errors else None)
 
+@router.post("/upload")
+async def upload(files: List[UploadFile] = File(...), user_id: Optional[int] = Depends(get_current_user_id_optional)):
+    entries = await _stage_uploads(files)
+    job = DetectionJob(len(entries))
+    await _run_detection_job(job, entries, user_id)
+    if job.error:
+        raise HTTPException(status_code=500, detail=job.error)
+
+    results = job.to_dict()["results"]
+    for item in results:
+        item.pop("index")
     return results
 
+@router.post("/upload/async")
+async def upload_async(files: List[UploadFile] = File(...), user_id: Optional[int] = Depends(get_current_user_id_optional)):
+    entries = await _stage_uploads(files)
+    job = create_job(len(entries))
+    job.task = asyncio.create_task(_run_detection_job(job, entries, user_id))
+    return {"job_id": job.id}
+
+def _run_video(job: DetectionJob, pipeline: VideoPipeline, loop):
+    for item in pipeline.run():
+        loop.call_soon_threadsafe(job.add_result, item)
+
+async def _run_video_job(job: DetectionJob, pipeline: VideoPipeline):
+    loop = asyncio.get_running_loop()
+    job.status = "running"
+    error = None
+    try:
+        await loop.run_in_executor(video_pool, _run_video, job, pipeline, loop)
+    except Exception as e:
+        error = str(e)
+    job.stats = pipeline.stats
+    job.finish(error=error)
+
+@router.post("/upload/video")
+async def upload_video(file: UploadFile = File(...), user_id: Optional[int] = Depends(get_current_user_id_optional)):
+    # Frames stream out through /upload/stream/{job_id}; total is unknown up front
+    (_, _, upload), = await _stage_uploads([file], kind="video")
+    pipeline = VideoPipeline(
+        upload.path,
+        user_id=user_id,
+        persist=user_id is not None,
+        drop_when_full=False,
+        model_version=registry.model_version(),
+    )
+    job = create_job(total=None, max_results=VIDEO_RESULTS_KEPT)
+    job.task = asyncio.create_task(_run_video_job(job, pipeline))
+    return {"job_id": job.id}
+
+@router.get("/upload/result/{job_id}")
+def get_upload_result(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
+@router.get("/upload/stream/{job_id}")
+async def stream_upload_result(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def event_stream():
+        # One JSON line per image as it finishes, then a final status line
+        sent = 0
+        while True:
+            while sent < job.completed:
+                # Results trimmed before this client read them are skipped
+                sent = max(sent, job.dropped)
+                yield json.dumps(job.results[sent - job.dropped]) + "\n"
+                sent += 1
+            if job.done:
+                yield json.dumps({"status": job.status, "error": job.error, "stats": job.stats}) + "\n"
+                return
+            await job.wait_for_change(timeout=15)
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
+@router.get("/models/health")
+def models_health():
+    return registry.health()
+
+@router.get("/models/cache")
+def models_cache():
+    return detection_cache.stats()
 
 @router.get("/history")
-def get_history():
-    with Session(engine) as session:
-        records = session.exec(select(DetectionRecord).order_by(DetectionRecord.id.desc())).all()
-        return records
+def get_history(session: Session = Depends(get_session)):
+    records = session.exec(select(DetectionRecord).order_by(DetectionRecord.id.desc())).all()
+    return records
+
+def _encode_cursor(value, record_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps({"v": value, "id": record_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _decode_cursor(cursor: str, sort_by: str):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = data["v"]
+        if sort_by != "filename":
+            value = datetime.fromisoformat(value)
+        return value, int(data["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+PLATE_MODES = ("substring", "prefix", "fuzzy")
+
+def _plate_filter(plate_query: str, plate_mode: str, max_distance: int):
+    if plate_mode not in PLATE_MODES:
+        raise HTTPException(status_code=400, detail=f"plate_mode must be one of {', '.join(PLATE_MODES)}.")
+    return plate_exists(plate_query, plate_mode, max_distance)
+
+@router.get("/plates/search")
+def plate_search(
+    q: str = Query(..., min_length=1),
+    mode: str = Query("substring"),
+    max_distance: int = Query(1, ge=0, le=3),
+    limit: int = Query(50, ge=1, le=500),
+    session: Session = Depends(get_session),
+):
+    """Plate lookup through the trigram index.
+
+    Matching ignores case, punctuation and OCR look-alikes (0/O, 8/B, ...);
+    ``fuzzy`` also allows up to ``max_distance`` edits, fewer on plates
+    too short for the index to narrow (see plate_index.fuzzy_distance_bound).
+    """
+    if mode not in PLATE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(PLATE_MODES)}.")
+    plates = search_plates(session, q, mode, max_distance, limit)
+    return [
+        {
+            "plate_id": p.id,
+            "detection_id": p.detection_id,
+            "plate_string": p.plate_string,
+            "plate_confidence": p.plate_confidence,
+        }
+        for p in plates
+    ]
 
 @router.get("/search")
 def search(
     plate_query: str = Query(None),
+    plate_mode: str = Query("substring"),
+    max_distance: int = Query(1, ge=0, le=3),
     filename_query: str = Query(None),
-    limit: int = Query(10),
-    offset: int = Query(0),
+    limit: int = Query(10, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     sort_by: str = Query("timestamp"),
-    order: str = Query("desc")
+    order: str = Query("desc"),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(True),
+    session: Session = Depends(get_session),
 ):
-    with Session(engine) as session:
-        query = select(DetectionRecord)
-
-        if filename_query:
-            query = query.where(DetectionRecord.filename.contains(filename_query))
-
-        if plate_query:
-            detection_ids = session.exec(
-                select(PlateInfo.detection_id).where(PlateInfo.plate_string.contains(plate_query))
-            ).all()
-            query = query.where(DetectionRecord.id.in_(detection_ids))
-
-        sort_column = DetectionRecord.timestamp if sort_by != "filename" else DetectionRecord.filename
-        query = query.order_by(sort_column.asc() if order == "asc" else sort_column.desc())
-
-        all_results = session.exec(query).all()
-        total = len(all_results)
-        results = all_results[offset : offset + limit]
-
-        return {"results": results, "total": total}
+    """Paginated search, pushed down to SQL.
+
+    Pass ``next_cursor`` from a previous page as ``cursor`` for keyset
+    pagination on ``(sort column, id)``; ``offset`` is ignored then.
+    ``include_total=false`` skips the COUNT query. Plate matching goes
+    through the plate index (``plate_mode``: substring, prefix or fuzzy).
+    """
+    filters = []
+    if filename_query:
+        filters.append(DetectionRecord.filename.contains(filename_query))
+
+    if plate_query:
+        filters.append(_plate_filter(plate_query, plate_mode, max_distance))
+
+    sort_column = DetectionRecord.timestamp if sort_by != "filename" else DetectionRecord.filename
+    ascending = order == "asc"
+
+    query = select(DetectionRecord).where(*filters)
+    if cursor:
+        value, last_id = _decode_cursor(cursor, sort_by)
+        if ascending:
+            query = query.where(or_(
+                sort_column > value,
+                and_(sort_column == value, DetectionRecord.id > last_id),
+            ))
+        else:
+            query = query.where(or_(
+                sort_column < value,
+                and_(sort_column == value, DetectionRecord.id < last_id),
+            ))
+    else:
+        query = query.offset(offset)
+
+    if ascending:
+        query = query.order_by(sort_column.asc(), DetectionRecord.id.asc())
+    else:
+        query = query.order_by(sort_column.desc(), DetectionRecord.id.desc())
+
+    # One extra row tells us whether there is a next page
+    rows = session.exec(query.limit(limit + 1)).all()
+    results = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = results[-1]
+        next_cursor = _encode_cursor(getattr(last, sort_column.key), last.id)
+
+    total = None
+    if include_total:
+        total = session.exec(
+            select(func.count()).select_from(DetectionRecord).where(*filters)
+        ).one()
+
+    return {"results": results, "total": total, "next_cursor": next_cursor}
 
 @router.get("/result/{detection_id}")
-def get_full_result(detection_id: int = Path(...)):
-    with Session(engine) as session:
-        record = session.get(DetectionRecord, detection_id)
-        if not record:
-            raise HTTPException(status_code=404, detail="Detection not found.")
-
-        plates = session.exec(select(PlateInfo).where(PlateInfo.detection_id == detection_id)).all()
-        char_map = {}
-        for c in session.exec(select(CharacterBox).where(CharacterBox.detection_id == detection_id)).all():
-            char_map.setdefault(c.detection_id, []).append({
-                "box": [c.x1, c.y1, c.x2, c.y2],
-                "class_id": c.class_id,
-                "confidence": c.confidence,
-            })
-
-        detections = []
-        for p in plates:
-            detections.append({
+def get_full_result(detection_id: int = Path(...), session: Session = Depends(get_session)):
+    record = session.get(DetectionRecord, detection_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Detection not found.")
+
+    rows = session.exec(
+        select(PlateInfo, CharacterBox)
+        .outerjoin(CharacterBox, CharacterBox.plate_id == PlateInfo.id)
+        .where(PlateInfo.detection_id == detection_id)
+        .order_by(PlateInfo.id, CharacterBox.id)
+    ).all()
+
+    detections = {}
+    for p, c in rows:
+        if p.id not in detections:
+            detections[p.id] = {
                 "plate_string": p.plate_string,
                 "plate_confidence": p.plate_confidence,
                 "plate_crop_path": p.plate_crop_path,
-                "characters": char_map.get(p.detection_id, [])
+                "characters": []
+            }
+        if c is not None:
+            detections[p.id]["characters"].append({
+                "box": [c.x1, c.y1, c.x2, c.y2],
+                "class_id": c.class_id,
+                "confidence": c.confidence,
             })
+    detections = list(detections.values())
 
-        return JSONResponse({
-            "filename": record.filename,
-            "timestamp": record.timestamp.isoformat() if record.timestamp else None,
-            "annotated_image": record.annotated_image,
-            "detections": detections
-        })
+    return JSONResponse({
+        "filename": record.filename,
+        "timestamp": record.timestamp.isoformat() if record.timestamp else None,
+        "annotated_image": record.annotated_image,
+        "detections": detections
+    })
 
 @router.get("/download/{filename}")
 def download_file(filename: str):
     file_path = os.path.join("runs", "results", filename)
     return FileResponse(path=file_path, filename=filename, media_type='application/octet-stream')
 
+RENDER_MAX_AGE = int(os.getenv("RENDER_MAX_AGE", "86400"))
+
+def _render_response(request: Request, load):
+    try:
+        render = load()
+        etag = f'"{render.etag}"'
+        last_modified = render.last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": format_datetime(last_modified, usegmt=True),
+            "Cache-Control": f"private, max-age={RENDER_MAX_AGE}",
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+                return Response(status_code=304, headers=headers)
+        elif request.headers.get("if-modified-since"):
+            try:
+                if parsedate_to_datetime(request.headers["if-modified-since"]) >= last_modified:
+                    return Response(status_code=304, headers=headers)
+            except (TypeError, ValueError):
+                pass
+
+        return Response(render.encode(), media_type="image/jpeg", headers=headers)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/render/detections/{record_id}/annotated.jpg")
+def render_detection(request: Request, record_id: int = Path(...), session: Session = Depends(get_session)):
+    return _render_response(request, lambda: detection_render(session, record_id))
+
+@router.get("/render/plates/{plate_id}/{kind}.jpg")
+def render_plate(request: Request, plate_id: int = Path(...), kind: str = Path(...),
+                 session: Session = Depends(get_session)):
+    if kind not in RENDER_KINDS:
+        raise HTTPException(status_code=404, detail="Unknown image.")
+    return _render_response(request, lambda: plate_render(session, plate_id, kind))
+
+def _rendered(build, *args):
+    # Drawn while the archive streams, from rows the export query loaded
+    return lambda: build(*args).encode()
+
 @router.get("/download-all")
-def download_all_results(plate_query: str = "", filename_query: str = ""):
-    with Session(engine) as session:
-        statement = select(DetectionRecord).order_by(DetectionRecord.timestamp.desc())
-        all_sessions = session.exec(statement).all()
-
-    filtered_sessions = []
-    for record in all_sessions:
-        if filename_query and filename_query.lower() not in record.filename.lower():
-            continue
-        if plate_query:
-            matching_plates = session.exec(
-                select(PlateInfo).where(PlateInfo.detection_id == record.id)
-            ).all()
-            if not any(plate_query.lower() in p.plate_string.lower() for p in matching_plates):
-                continue
-        filtered_sessions.append(record)
-
-    if not filtered_sessions:
+def download_all_results(plate_query: str = "", filename_query: str = "",
+                         plate_mode: str = "substring", max_distance: int = 1,
+                         session: Session = Depends(get_session)):
+    # One query for every record and plate; the archive streams while it's built.
+    # Aliased so the plate filter's EXISTS still correlates on the record only
+    crops = aliased(PlateInfo)
+    statement = (
+        select(DetectionRecord, crops)
+        .outerjoin(crops, crops.detection_id == DetectionRecord.id)
+        .order_by(DetectionRecord.timestamp.desc(), DetectionRecord.id, crops.id)
+    )
+    if plate_query:
+        statement = statement.where(_plate_filter(plate_query, plate_mode, max_distance))
+    if filename_query:
+        statement = statement.where(func.lower(DetectionRecord.filename).contains(filename_query.lower()))
+    rows = session.exec(statement).all()
+
+    if not rows:
         raise HTTPException(status_code=404, detail="No matching results found.")
 
-    tmp_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-    with zipfile.ZipFile(tmp_zip.name, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for record in filtered_sessions:
-            if record.annotated_image and os.path.exists(record.annotated_image):
-                zipf.write(record.annotated_image, arcname=os.path.basename(record.annotated_image))
-
-            with Session(engine) as session:
-                plates = session.exec(select(PlateInfo).where(PlateInfo.detection_id == record.id)).all()
-                for p in plates:
-                    if p.plate_crop_path and os.path.exists(p.plate_crop_path):
-                        zipf.write(p.plate_crop_path, arcname=os.path.basename(p.plate_crop_path))
+    plates_by_record = {}
+    for record, plate in rows:
+        plates = plates_by_record.setdefault(record.id, [])
+        if plate is not None:
+            plates.append(plate)
+
+    items = []
+    for record, plate in rows:
+        # Images rendered on request are rendered into the archive; written
+        # ones are stored as /static/ URLs and read from where /static serves them
+        if record.annotated_image.startswith("/render/"):
+            items.append((_rendered(record_render, record, plates_by_record[record.id]),
+                          f"annotated_{record.id}.jpg"))
+        else:
+            items.append(static_file(record.annotated_image))
+        if plate is None:
+            continue
+        if plate.plate_crop_path and plate.plate_crop_path.startswith("/render/"):
+            items.append((_rendered(crop_render, record, plate), f"plate_{plate.id}.jpg"))
+        else:
+            items.append(static_file(plate.plate_crop_path))
 
     zip_filename = f"all_results_{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
-    return FileResponse(tmp_zip.name, media_type="application/zip", filename=zip_filename)
+    return StreamingResponse(
+        stream_zip(zip_entries(items)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{zip_filename}"'},
+    )
 
 @router.delete("/delete/{record_id}")
-def delete_record(record_id: int = Path(...)):
-    with Session(engine) as session:
-        record = session.get(DetectionRecord, record_id)
-        if not record:
-            raise HTTPException(status_code=404, detail="Record not found")
-
-        session.exec(delete(PlateInfo).where(PlateInfo.detection_id == record_id))
-        session.exec(delete(CharacterBox).where(CharacterBox.detection_id == record_id))
-        session.delete(record)
-        session.commit()
+def delete_record(record_id: int = Path(...), session: Session = Depends(get_session)):
+    record = session.get(DetectionRecord, record_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+
+    session.exec(delete(CharacterBox).where(CharacterBox.detection_id == record_id))
+    session.exec(delete(PlateTrigram).where(PlateTrigram.plate_id.in_(
+        select(PlateInfo.id).where(PlateInfo.detection_id == record_id)
+    )))
+    session.exec(delete(PlateInfo).where(PlateInfo.detection_id == record_id))
+    session.delete(record)
+    session.flush()
+    # Rollups only ever add; recount the record's day
+    day = bucket_start(record.timestamp, "day")
+    rebuild_rollups(session, day, day + timedelta(days=1))
+    session.commit()
     return {"message": "Record deleted"}
 
 @router.get("/plate-frequency")
-def plate_frequency():
-    with Session(engine) as session:
-        plates = session.exec(select(PlateInfo.plate_string)).all()
-        counter = Counter(plates)
-        return [{"plate": plate, "count": count} for plate, count in counter.items()]
+def get_plate_frequency(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    top_n: Optional[int] = Query(None, ge=1),
+    session: Session = Depends(get_session),
+):
+    return plate_frequency(session, start, end, top_n)
 
 @router.get("/detection-accuracy-trends")
-def detection_accuracy_trends():
-    with Session(engine) as session:
-        records = session.exec(
-            select(PlateInfo, DetectionRecord)
-            .join(DetectionRecord, PlateInfo.detection_id == DetectionRecord.id)
-        ).all()
-
-        trends = defaultdict(list)
-        for plate, record in records:
-            ts = record.timestamp
-            if isinstance(ts, str):
-                ts = datetime.fromisoformat(ts)
-            key = ts.strftime("%Y-%m-%d")
-            trends[key].append(plate.plate_confidence)
-
-        return JSONResponse(content=[
-            {"date": date, "avg_confidence": round(sum(confs) / len(confs), 4)}
-            for date, confs in sorted(trends.items())
-        ])
+def detection_accuracy_trends(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    session: Session = Depends(get_session),
+):
+    return JSONResponse(content=accuracy_trends(session, start, end))
 
 @router.post("/ask")
-async def ask_question(req: Request):
-    body = await req.json()
+def ask_question(body: dict = Body(...)):
+    """Ask about stored detections.
+
+    Optional body fields ``start``/``end`` (ISO timestamps), ``min_id``/``max_id``,
+    ``plate_query`` and ``filename_query`` narrow what the worker loads; only
+    this description goes through the broker. Sync so the cache lookup (a
+    query over the scope, Redis round-trips) runs on the threadpool.
+    """
     question = body.get("question")
-
-    session = next(get_session())  
-    detections = session.exec(select(DetectionRecord)).all()
-    records = [d.model_dump() for d in detections]
-    session.close()
-
-    task = run_llm_task.apply_async(args=[question, {"detections": records}])
-    return {"task_id": task.id, "message": "LLM processing started"}
+    if not question:
+        raise HTTPException(status_code=400, detail="question is required.")
+
+    try:
+        scope = make_scope(
+            start=datetime.fromisoformat(body["start"]) if body.get("start") else None,
+            end=datetime.fromisoformat(body["end"]) if body.get("end") else None,
+            min_id=int(body["min_id"]) if body.get("min_id") is not None else None,
+            max_id=int(body["max_id"]) if body.get("max_id") is not None else None,
+            plate_query=body.get("plate_query"),
+            filename_query=body.get("filename_query"),
+        )
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid scope.")
+
+    task_id = replay_cached_answer(question, scope=scope)
+    if task_id is None:
+        task_id = run_llm_task.apply_async(args=[question], kwargs={"scope": scope}).id
+    return {"task_id": task_id, "message": "LLM processing started"}
 
 @router.post("/feedback/{upload_id}")
 def save_feedback(upload_id: int, feedback: str, session: Session = Depends(get_session)):
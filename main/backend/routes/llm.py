@@ -1,44 +1,57 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from celery.result import AsyncResult
 import redis
+import redis.asyncio
 
 from main.backend.celery_worker import celery_app
-from main.backend.services.llm import run_llm_task
+from main.backend.services.llm import run_llm_task, replay_cached_answer
+from main.backend.services import llm_stream
 
 router = APIRouter()
 r = redis.Redis(host="localhost", port=6379, db=0)
+# Async client for the SSE endpoint; a blocked XREAD holds no thread
+aredis = redis.asyncio.Redis(host="localhost", port=6379, db=0, decode_responses=True)
 
 @router.post("/ask")
 def ask_llm(question: str, metadata: dict = None):
-    task = run_llm_task.delay(question, metadata)
-    return {"task_id": task.id}
+    # A cached answer for the same question and data is replayed into the stream
+    task_id = replay_cached_answer(question, metadata)
+    if task_id is None:
+        task_id = run_llm_task.delay(question, metadata).id
+    return {"task_id": task_id}
 
 @router.get("/result/{task_id}")
 def get_llm_result(task_id: str):
+    cached = r.get(f"llm_result:{task_id}")
+    if cached is not None:
+        return {"status": "done", "result": cached.decode()}
     task_result = AsyncResult(task_id, app=celery_app)
     if task_result.ready():
         return {"status": "done", "result": task_result.get()}
     return {"status": "pending"}
 
 @router.get("/stream/{task_id}")
-def stream_llm_result(task_id: str):
-    key = f"llm_stream:{task_id}"
+async def stream_llm_result(task_id: str, request: Request, last_id: str = Query(None)):
+    """Server-sent events for an LLM task (see services/llm_stream.py).
 
-    def event_stream():
-        last_index = 0
-        while True:
-            chunks = r.lrange(key, last_index, -1)
-            if not chunks:
-                # wait a short time to avoid busy-looping
-                import time
-                time.sleep(0.5)
-                continue
-            for c in chunks:
-                text = c.decode()
-                if text == "[[END]]":
-                    return
-                yield text
-            last_index += len(chunks)
+    Resume after a disconnect with the ``Last-Event-ID`` header or ``last_id``.
+    """
+    async def is_dead():
+        if task_id.startswith("cached-"):
+            return False
+        state = await run_in_threadpool(lambda: AsyncResult(task_id, app=celery_app).state)
+        return state in ("FAILURE", "REVOKED")
 
-    return StreamingResponse(event_stream(), media_type="text/plain")
+    events = llm_stream.sse_events(
+        aredis,
+        task_id,
+        last_id=request.headers.get("last-event-id") or last_id or "0-0",
+        is_dead=is_dead,
+    )
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
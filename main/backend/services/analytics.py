@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Session, select, func
+
+from main.backend.models import DetectionRecord, PlateInfo
+
+
+def _in_range(query, start: Optional[datetime], end: Optional[datetime]):
+    if start is not None:
+        query = query.where(DetectionRecord.timestamp >= start)
+    if end is not None:
+        query = query.where(DetectionRecord.timestamp < end)
+    return query
+
+
+def plate_frequency(session: Session,
+                    start: Optional[datetime] = None,
+                    end: Optional[datetime] = None,
+                    top_n: Optional[int] = None) -> list:
+    """Sightings per plate string, most frequent first, counted in SQL."""
+    count = func.count(PlateInfo.id).label("count")
+    query = select(PlateInfo.plate_string, count).where(func.trim(PlateInfo.plate_string) != "")
+    if start is not None or end is not None:
+        query = _in_range(query.join(DetectionRecord, PlateInfo.detection_id == DetectionRecord.id), start, end)
+    query = query.group_by(PlateInfo.plate_string).order_by(count.desc(), PlateInfo.plate_string)
+    if top_n is not None:
+        query = query.limit(top_n)
+    return [{"plate": plate, "count": n} for plate, n in session.exec(query).all()]
+
+
+def accuracy_trends(session: Session,
+                    start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> list:
+    """Average plate confidence per day, averaged in SQL."""
+    day = func.date(DetectionRecord.timestamp).label("day")
+    query = _in_range(
+        select(day, func.avg(PlateInfo.plate_confidence))
+        .join(DetectionRecord, PlateInfo.detection_id == DetectionRecord.id),
+        start, end,
+    ).group_by(day).order_by(day)
+    return [
+        {"date": str(date), "avg_confidence": round(float(avg), 4)}
+        for date, avg in session.exec(query).all()
+    ]
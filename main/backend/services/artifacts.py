@@ -0,0 +1,102 @@
+import os
+import queue
+import threading
+from collections import Counter
+
+import cv2
+
+# "async" encodes and writes result images on a background thread; "sync"
+# writes them before detect_batch returns
+ARTIFACT_WRITE_MODE = os.getenv("ARTIFACT_WRITE_MODE", "async")
+ARTIFACT_JPEG_QUALITY = int(os.getenv("ARTIFACT_JPEG_QUALITY", "90"))
+# Writes waiting for the thread; submit blocks past this so memory stays bounded
+ARTIFACT_QUEUE_SIZE = int(os.getenv("ARTIFACT_QUEUE_SIZE", "256"))
+
+
+PLATE_COLOR = (255, 42, 4)
+
+
+def draw_plates(image, plates):
+    """Draw ``(box, label)`` plate boxes on a copy of ``image``."""
+    image = image.copy()
+    for (x1, y1, x2, y2), label in plates:
+        cv2.rectangle(image, (x1, y1), (x2, y2), PLATE_COLOR, 2)
+        cv2.putText(image, label, (x1, max(y1 - 6, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, PLATE_COLOR, 2)
+    return image
+
+
+def draw_characters(crop_resized, characters):
+    """Draw ``(box, label)`` character boxes on a 640x640 plate crop, in place."""
+    for (cx1, cy1, cx2, cy2), label in characters:
+        cv2.rectangle(crop_resized, (cx1, cy1), (cx2, cy2), (0, 255, 0), 1)
+        cv2.putText(crop_resized, label, (cx1, cy1 - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 0, 0), 1)
+    return crop_resized
+
+
+class ArtifactWriter:
+    """Writes crops and annotated images off the detection path.
+
+    ``submit`` takes a BGR array, or a callable returning one so rendering
+    happens on the writer thread too. Paths stay ``pending`` until written;
+    ``wait`` blocks until given paths (or everything) are on disk. A failed
+    write is counted in ``stats`` and otherwise ignored.
+    """
+
+    def __init__(self, mode: str = ARTIFACT_WRITE_MODE, quality: int = ARTIFACT_JPEG_QUALITY,
+                 queue_size: int = ARTIFACT_QUEUE_SIZE):
+        self.mode = mode
+        self.quality = quality
+        self.stats = {"written": 0, "failed": 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = Counter()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, path, image):
+        path = str(path)
+        if self.mode == "sync":
+            self._write(path, image)
+            return
+
+        with self._cond:
+            self._pending[path] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="artifact-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((path, image))
+
+    def _write(self, path: str, image):
+        try:
+            if callable(image):
+                image = image()
+            ok = cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        except Exception:
+            ok = False
+        with self._cond:
+            self.stats["written" if ok else "failed"] += 1
+
+    def _run(self):
+        while True:
+            path, image = self._queue.get()
+            try:
+                self._write(path, image)
+            finally:
+                with self._cond:
+                    self._pending[path] -= 1
+                    if self._pending[path] <= 0:
+                        del self._pending[path]
+                    self._cond.notify_all()
+
+    def is_pending(self, path) -> bool:
+        with self._cond:
+            return str(path) in self._pending
+
+    def wait(self, paths=None, timeout: float = None) -> bool:
+        """Block until ``paths`` (all pending writes if None) are written; False on timeout."""
+        paths = None if paths is None else [str(p) for p in paths]
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending if paths is None else not any(p in self._pending for p in paths),
+                timeout,
+            )
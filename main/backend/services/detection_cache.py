@@ -0,0 +1,176 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import redis
+
+# Results kept in memory; 0 turns the cache off
+DETECTION_CACHE_SIZE = int(os.getenv("DETECTION_CACHE_SIZE", "1024"))
+# Optional second tier shared across workers and restarts: "redis" or "disk"
+DETECTION_CACHE_TIER = os.getenv("DETECTION_CACHE_TIER", "")
+DETECTION_CACHE_TTL = int(os.getenv("DETECTION_CACHE_TTL", str(7 * 24 * 3600)))
+DETECTION_CACHE_DIR = os.getenv("DETECTION_CACHE_DIR", "runs/cache")
+DETECTION_CACHE_REDIS_URL = os.getenv("DETECTION_CACHE_REDIS_URL", "redis://localhost:6379/1")
+
+
+def image_hash(image) -> Optional[str]:
+    """sha256 of a file's bytes, raw bytes, or a decoded frame's pixels and shape.
+
+    None when there is nothing to hash (a missing file, anything else).
+    """
+    hasher = hashlib.sha256()
+    if isinstance(image, (str, Path)):
+        try:
+            with open(image, "rb") as f:
+                while block := f.read(1024 * 1024):
+                    hasher.update(block)
+        except OSError:
+            return None
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        hasher.update(image)
+    elif isinstance(image, np.ndarray):
+        hasher.update(str(image.shape).encode())
+        hasher.update(np.ascontiguousarray(image).data)
+    else:
+        return None
+    return hasher.hexdigest()
+
+
+class RedisTier:
+    def __init__(self, client, ttl: int = DETECTION_CACHE_TTL, prefix: str = "detection_cache:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[dict]:
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, result: dict):
+        self.client.set(self.prefix + key, json.dumps(result), ex=self.ttl)
+
+
+class DiskTier:
+    def __init__(self, directory: str = DETECTION_CACHE_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self.directory / f"{key}.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def set(self, key: str, result: dict):
+        # Write then rename so readers never see half a file
+        part = self.directory / f".{key}.{threading.get_ident()}.part"
+        part.write_text(json.dumps(result))
+        os.replace(part, self.directory / f"{key}.json")
+
+
+def make_tier(name: str = DETECTION_CACHE_TIER):
+    if name == "redis":
+        return RedisTier(redis.Redis.from_url(DETECTION_CACHE_REDIS_URL))
+    if name == "disk":
+        return DiskTier()
+    return None
+
+
+class DetectionCache:
+    """Detection results by image content, model version and thresholds.
+
+    A bounded in-memory LRU in front of an optional ``tier`` (Redis or disk)
+    with ``get``/``set``. A hit only counts if the artifacts it points at
+    still exist (``is_valid``); results are copied in and out, so callers may
+    mutate what they get. Tier errors count as misses.
+    """
+
+    def __init__(self, max_entries: int = DETECTION_CACHE_SIZE, tier=None, is_valid=None):
+        self.max_entries = max_entries
+        self.tier = tier
+        self.is_valid = is_valid or (lambda result: True)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "memory_hits": 0, "tier_hits": 0, "misses": 0, "stale": 0, "tier_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(content_hash: str, model_version: str, plate_conf_thresh: float, char_conf_thresh: float,
+            artifacts: bool = True) -> str:
+        raw = f"{content_hash}|{model_version}|{float(plate_conf_thresh)}|{float(char_conf_thresh)}"
+        if not artifacts:
+            # Box-only results have no artifact paths to hand back
+            raw += "|boxes"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _count(self, *names):
+        with self._lock:
+            for name in names:
+                self._stats[name] += 1
+
+    def _remember(self, key: str, result: dict):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+        tier = "memory_hits"
+
+        if result is None and self.tier is not None:
+            tier = "tier_hits"
+            try:
+                result = self.tier.get(key)
+            except (redis.RedisError, OSError, ValueError):
+                self._count("tier_errors")
+                result = None
+            if result is not None:
+                self._remember(key, result)
+
+        if result is None:
+            self._count("misses")
+            return None
+        if not self.is_valid(result):
+            with self._lock:
+                self._entries.pop(key, None)
+            self._count("stale", "misses")
+            return None
+        self._count("hits", tier)
+        return copy.deepcopy(result)
+
+    def set(self, key: str, result: dict):
+        result = copy.deepcopy(result)
+        self._remember(key, result)
+        if self.tier is not None:
+            try:
+                self.tier.set(key, result)
+            except (redis.RedisError, OSError):
+                self._count("tier_errors")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["tier"] = type(self.tier).__name__ if self.tier is not None else None
+        return stats
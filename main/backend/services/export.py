@@ -0,0 +1,78 @@
+import os
+import time
+import zipfile
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", str(1024 * 1024)))
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to the generator.
+
+    No ``tell``/``seek``, so ``zipfile`` treats it as unseekable and writes a
+    data descriptor after each entry instead of going back to patch headers.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_entries(items):
+    """``(source, arcname)`` pairs for ``stream_zip``, first of each arcname wins.
+
+    Items are file paths, kept if the file exists, or ``(render, arcname)``
+    pairs whose callable returns the bytes when the entry is written.
+    """
+    seen = set()
+    for item in items:
+        if isinstance(item, tuple):
+            path, arcname = item
+        elif not item or not os.path.isfile(item):
+            continue
+        else:
+            path, arcname = item, os.path.basename(item)
+        if arcname in seen:
+            continue
+        seen.add(arcname)
+        yield path, arcname
+
+
+def stream_zip(entries, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield a ZIP archive of ``(path, arcname)`` entries as it is written.
+
+    Entries are stored, not deflated: the exports are JPEGs that don't
+    compress further. At most about ``chunk_size`` bytes of a file are held
+    at once. Rendered entries whose render raises ``LookupError`` are left out.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        for path, arcname in entries:
+            if callable(path):
+                try:
+                    data = path()
+                except LookupError:
+                    continue
+                zf.writestr(zipfile.ZipInfo(arcname, time.localtime()[:6]), data)
+                yield sink.drain()
+                continue
+
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, "rb") as src, zf.open(info, "w") as dest:
+                while block := src.read(chunk_size):
+                    dest.write(block)
+                    yield sink.drain()
+            yield sink.drain()
+    # Central directory
+    yield sink.drain()
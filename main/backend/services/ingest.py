@@ -0,0 +1,172 @@
+import hashlib
+import os
+import uuid
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
+
+from main.backend.models import DetectionRecord, PlateInfo
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "../data/")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_MAX_VIDEO_BYTES = int(os.getenv("UPLOAD_MAX_VIDEO_BYTES", str(2 * 1024 ** 3)))
+
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".webm"}
+IMAGE_EXTENSIONS = (".jpg", ".png", ".bmp", ".webp")
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class StoredUpload:
+    """An upload written to ``UPLOAD_DIR/<sha256><ext>``.
+
+    ``data`` keeps the bytes of images so the detector decodes them from
+    memory; it is None for videos, which are read back from ``path``.
+    ``duplicate`` is True when the same content was already stored.
+    """
+
+    def __init__(self, filename: str, path: str, content_hash: str, size: int,
+                 data: bytearray = None, duplicate: bool = False):
+        self.filename = filename
+        self.path = path
+        self.content_hash = content_hash
+        self.size = size
+        self.data = data
+        self.duplicate = duplicate
+
+
+def sniff_image(head: bytes):
+    """File extension for the image format ``head`` starts with, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head.startswith(b"BM"):
+        return ".bmp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def _upload_extension(file: UploadFile, head: bytes, kind: str) -> str:
+    if kind == "image":
+        ext = sniff_image(head)
+        if ext is None:
+            raise UploadRejected(415, f"{file.filename}: only JPEG, PNG, BMP and WebP images are accepted.")
+        return ext
+
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    if ext not in VIDEO_EXTENSIONS and not (file.content_type or "").startswith("video/"):
+        raise UploadRejected(415, f"{file.filename}: not a video.")
+    return ext if ext in VIDEO_EXTENSIONS else ""
+
+
+def _write_chunk(out, hasher, chunk: bytes):
+    hasher.update(chunk)
+    out.write(chunk)
+
+
+def _finalize(part_path: str, path: str) -> bool:
+    # Same content already stored: keep the existing file
+    if os.path.exists(path):
+        os.remove(part_path)
+        return True
+    os.replace(part_path, path)
+    return False
+
+
+def _discard(out, part_path: str):
+    out.close()
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+
+async def store_upload(file: UploadFile, kind: str = "image") -> StoredUpload:
+    """Stream ``file`` to content-addressed storage in ``UPLOAD_CHUNK_SIZE`` chunks.
+
+    Hashing and disk writes run on the threadpool. Raises ``UploadRejected``
+    for empty, oversized or unsupported uploads; nothing is left on disk.
+    """
+    limit = UPLOAD_MAX_BYTES if kind == "image" else UPLOAD_MAX_VIDEO_BYTES
+    part_path = os.path.join(UPLOAD_DIR, f".{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    data = bytearray() if kind == "image" else None
+    ext = None
+    size = 0
+
+    out = await run_in_threadpool(open, part_path, "wb")
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            if ext is None:
+                ext = _upload_extension(file, chunk, kind)
+            size += len(chunk)
+            if size > limit:
+                raise UploadRejected(413, f"{file.filename}: larger than {limit} bytes.")
+            await run_in_threadpool(_write_chunk, out, hasher, chunk)
+            if data is not None:
+                data += chunk
+        if size == 0:
+            raise UploadRejected(400, f"{file.filename}: empty upload.")
+    except BaseException:
+        await run_in_threadpool(_discard, out, part_path)
+        raise
+    await run_in_threadpool(out.close)
+
+    content_hash = hasher.hexdigest()
+    path = os.path.join(UPLOAD_DIR, content_hash + ext)
+    duplicate = await run_in_threadpool(_finalize, part_path, path)
+    return StoredUpload(file.filename, path, content_hash, size, data, duplicate)
+
+
+def find_upload(content_hash: str):
+    """Path of the stored image with this hash, or None."""
+    for ext in IMAGE_EXTENSIONS:
+        path = os.path.join(UPLOAD_DIR, content_hash + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def previous_result(session: Session, content_hash: str, model_version: str = None):
+    """Detection result stored for the same content and model, or None."""
+    record = session.exec(
+        select(DetectionRecord)
+        .where(DetectionRecord.content_hash == content_hash, DetectionRecord.model_version == model_version)
+        .options(selectinload(DetectionRecord.plates).selectinload(PlateInfo.characters))
+        .order_by(DetectionRecord.id.desc())
+        .limit(1)
+    ).first()
+    if record is None:
+        return None
+
+    # Rendered images belong to that record; the new one gets its own
+    def artifact(path):
+        return None if not path or path.startswith("/render/") else path
+
+    return {
+        "annotated_image": artifact(record.annotated_image),
+        "detections": [
+            {
+                "plate_box": [plate.x1, plate.y1, plate.x2, plate.y2] if plate.x1 is not None else None,
+                "plate_crop_path": artifact(plate.plate_crop_path),
+                "annotated_crop_path": artifact(plate.annotated_crop_path),
+                "plate_string": plate.plate_string,
+                "plate_confidence": plate.plate_confidence,
+                "characters": [
+                    {"box": [c.x1, c.y1, c.x2, c.y2], "class_id": c.class_id, "confidence": c.confidence}
+                    for c in sorted(plate.characters, key=lambda c: c.id)
+                ],
+            }
+            for plate in sorted(record.plates, key=lambda p: p.id)
+        ],
+    }
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from main.backend.services.registry import registry
+
+# Each worker thread loads its own copy of every model (see ModelRegistry), so
+# model memory per process is (DETECTION_WORKERS + VIDEO_WORKERS) x (plate + char model)
+DETECTION_WORKERS = int(os.getenv("DETECTION_WORKERS", "2"))
+# Videos run for their whole length; they get their own threads so they never
+# hold the image pool. Further videos queue behind these
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "1"))
+# Frame results a video job keeps for polling/streaming; older ones are dropped
+VIDEO_RESULTS_KEPT = int(os.getenv("VIDEO_RESULTS_KEPT", "500"))
+# Images per detect_batch call; chunks of one upload run concurrently on the pool
+DETECTION_CHUNK_SIZE = int(os.getenv("DETECTION_CHUNK_SIZE", "4"))
+# Finished jobs are kept this long for /upload/result polling
+JOB_TTL_SECONDS = int(os.getenv("DETECTION_JOB_TTL", "3600"))
+
+
+def _init_worker():
+    # Opt-in: each pool thread loads its models as it starts, before its first job
+    if os.getenv("WARM_UP_MODELS", "0") == "1":
+        registry.warm_up()
+
+
+# Inference and DB writes run here so the event loop is never blocked
+detection_pool = ThreadPoolExecutor(
+    max_workers=DETECTION_WORKERS,
+    thread_name_prefix="detection",
+    initializer=_init_worker,
+)
+video_pool = ThreadPoolExecutor(
+    max_workers=VIDEO_WORKERS,
+    thread_name_prefix="video",
+    initializer=_init_worker,
+)
+
+
+def chunked(items, size):
+    size = max(size, 1)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class DetectionJob:
+    """Progress of one upload. With ``max_results`` only the newest results
+    are kept; ``dropped`` counts the ones trimmed off the front."""
+
+    def __init__(self, total: Optional[int], max_results: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.status = "pending"
+        self.results = []
+        self.max_results = max_results
+        self.dropped = 0
+        self.error = None
+        self.stats = None
+        self.finished_at = None
+        self._changed = asyncio.Event()
+
+    def add_result(self, result: dict):
+        self.results.append(result)
+        if self.max_results is not None and len(self.results) > self.max_results:
+            overflow = len(self.results) - self.max_results
+            del self.results[:overflow]
+            self.dropped += overflow
+        self._notify()
+
+    def finish(self, error: str = None):
+        self.status = "failed" if error else "done"
+        self.error = error
+        self.finished_at = time.time()
+        self._notify()
+
+    def _notify(self):
+        # Wake current waiters and re-arm for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_change(self, timeout: float = None):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def completed(self) -> int:
+        return self.dropped + len(self.results)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "completed": self.completed,
+            "dropped": self.dropped,
+            "results": sorted(self.results, key=lambda r: r["index"]),
+            "error": self.error,
+            "stats": self.stats,
+        }
+
+
+# Jobs live in the process that runs them: /upload/result and /upload/stream
+# only find jobs started by the same process, so serve the upload API from a
+# single worker (uvicorn without --workers), or pin clients to one
+_jobs = {}
+
+
+def create_job(total: Optional[int], max_results: Optional[int] = None) -> DetectionJob:
+    _prune_jobs()
+    job = DetectionJob(total, max_results)
+    _jobs[job.id] = job
+    return job
+
+
+def get_job(job_id: str):
+    return _jobs.get(job_id)
+
+
+def _prune_jobs():
+    cutoff = time.time() - JOB_TTL_SECONDS
+    for job_id in [j.id for j in _jobs.values() if j.done and j.finished_at < cutoff]:
+        del _jobs[job_id]
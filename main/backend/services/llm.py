@@ -1,12 +1,23 @@
+import hashlib
+import json
+import math
+import re
+import uuid
 import redis
 from ollama import Client
 from main.backend.celery_worker import celery_app
 
-from sqlmodel import Session, select
-from main.backend.db import engine
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select, func
+from main.backend.db import new_session
 from main.backend.models import DetectionRecord, PlateInfo
-from collections import Counter, defaultdict
-from datetime import datetime, timedelta
+from main.backend.services import rollups
+from main.backend.services.plate_index import plate_exists
+from main.backend.services.prompt import ContextBuilder, LLM_CONTEXT_TOKENS, lines_tokens
+from main.backend.services.llm_cache import LLMCache
+from main.backend.services import llm_stream
+from main.backend.services.llm_pool import LLMExecutor, PRIORITY_INTERACTIVE, PRIORITY_SCHEDULED
+from datetime import datetime, time, timedelta
 from typing import Literal
 
 # Ollama client
@@ -14,6 +25,12 @@ client = Client()
 # Redis client (same DB as Celery broker)
 r = redis.Redis(host="localhost", port=6379, db=0)
 
+# Bump when prompt wording changes so cached answers built from the old prompts are ignored
+PROMPT_VERSION = "1"
+llm_cache = LLMCache(r)
+# Concurrency limits, priorities and coalescing of identical prompts
+executor = LLMExecutor(client)
+
 def build_prompt(question, metadata):
     detection_summary = "No metadata provided."
     if metadata:
@@ -37,145 +54,384 @@ def build_prompt(question, metadata):
     )
 
 
-def generate_context_from_db(question: str) -> str:
-    with Session(engine) as session:
-        # Get detections from the last 7 days (can adjust)
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        results = session.exec(
-            select(DetectionRecord)
-            .where(DetectionRecord.timestamp >= seven_days_ago)
-            .order_by(DetectionRecord.timestamp.desc())
-            .limit(200)
-        ).all()
-
-        lines = []
-        for record in results:
-            plates = session.exec(
-                select(PlateInfo).where(PlateInfo.detection_id == record.id)
-            ).all()
-            plate_list = ", ".join([f"{p.plate_string} ({p.plate_confidence:.2f})" for p in plates])
-            lines.append(f"{record.timestamp}: {record.filename} => {plate_list}")
-
-        if not lines:
+LOG_YIELD_PER = 500
+
+def _iter_detections(session: Session, query):
+    # Plates come from one extra IN query per batch (selectinload), and rows
+    # are streamed in batches of LOG_YIELD_PER instead of loaded all at once
+    query = query.options(selectinload(DetectionRecord.plates)).execution_options(yield_per=LOG_YIELD_PER)
+    yield from session.exec(query)
+
+
+# Rough token cost of one detection log line, for sizing the sample
+LOG_LINE_TOKENS = 20
+
+def _sample_records(session: Session, query, order_by, max_lines: int, line):
+    """Render every n-th record of ``query`` in ``order_by`` order, at most ``max_lines``.
+
+    The rows are picked in SQL (``row_number() % n``), so only the sample
+    and its plates are loaded. Returns ``(lines, total)``.
+    """
+    total = session.exec(select(func.count()).select_from(query.subquery())).one()
+    if not total or max_lines <= 0:
+        return [], total
+    stride = math.ceil(total / max_lines)
+    numbered = query.with_only_columns(
+        DetectionRecord.id,
+        func.row_number().over(order_by=order_by).label("n"),
+    ).subquery()
+    sample = (
+        select(DetectionRecord)
+        .where(DetectionRecord.id.in_(select(numbered.c.id).where((numbered.c.n - 1) % stride == 0)))
+        .order_by(*order_by)
+    )
+    return [line(record) for record in _iter_detections(session, sample)], total
+
+
+def _context_line(record) -> str:
+    plate_list = ", ".join([f"{p.plate_string} ({p.plate_confidence:.2f})" for p in record.plates])
+    return f"{record.timestamp}: {record.filename} => {plate_list}"
+
+
+SCOPE_FIELDS = ("start", "end", "min_id", "max_id", "plate_query", "filename_query")
+
+def make_scope(start=None, end=None, min_id=None, max_id=None,
+               plate_query=None, filename_query=None) -> dict:
+    """Small JSON-safe description of the detections a question is about.
+
+    This is what crosses the broker instead of the rows themselves; the
+    worker turns it back into a query with ``_scope_query``.
+    """
+    scope = {
+        "start": start.isoformat() if isinstance(start, datetime) else start,
+        "end": end.isoformat() if isinstance(end, datetime) else end,
+        "min_id": min_id,
+        "max_id": max_id,
+        "plate_query": plate_query or None,
+        "filename_query": filename_query or None,
+    }
+    return {k: v for k, v in scope.items() if v is not None}
+
+def _scope_window(scope: dict):
+    # No time or id bounds means the last 7 days
+    start = datetime.fromisoformat(scope["start"]) if "start" in scope else None
+    end = datetime.fromisoformat(scope["end"]) if "end" in scope else None
+    if not any(k in scope for k in ("start", "end", "min_id", "max_id")):
+        start = datetime.utcnow() - timedelta(days=7)
+    return start, end
+
+def _scope_query(scope: dict):
+    start, end = _scope_window(scope)
+    query = select(DetectionRecord)
+    if start is not None:
+        query = query.where(DetectionRecord.timestamp >= start)
+    if end is not None:
+        query = query.where(DetectionRecord.timestamp < end)
+    if "min_id" in scope:
+        query = query.where(DetectionRecord.id >= scope["min_id"])
+    if "max_id" in scope:
+        query = query.where(DetectionRecord.id <= scope["max_id"])
+    if "filename_query" in scope:
+        query = query.where(DetectionRecord.filename.contains(scope["filename_query"]))
+    if "plate_query" in scope:
+        query = query.where(plate_exists(scope["plate_query"]))
+    return query
+
+def _scope_overview(session: Session, query) -> list:
+    # Aggregates over an arbitrary filtered set, for scopes the rollups can't answer
+    ids = select(query.order_by(None).with_only_columns(DetectionRecord.id).subquery().c.id)
+    detections = session.exec(select(func.count()).where(DetectionRecord.id.in_(ids))).one()
+    plates, avg = session.exec(
+        select(func.count(PlateInfo.id), func.avg(PlateInfo.plate_confidence)).where(PlateInfo.detection_id.in_(ids))
+    ).one()
+    count = func.count(PlateInfo.id).label("count")
+    top = session.exec(
+        select(PlateInfo.plate_string, count)
+        .where(PlateInfo.detection_id.in_(ids))
+        .group_by(PlateInfo.plate_string)
+        .order_by(count.desc(), PlateInfo.plate_string)
+        .limit(rollups.ROLLUP_TOP_PLATES)
+    ).all()
+    avg = f"{avg:.2f}" if avg is not None else "n/a"
+    return [
+        f"Total: {detections} detections, {plates} plates, average confidence {avg}",
+        "Top plates: " + (", ".join(f"{plate} ({n})" for plate, n in top) or "none"),
+    ]
+
+def generate_context_from_db(question: str, budget: int = LLM_CONTEXT_TOKENS, scope: dict = None) -> str:
+    """Analytics context for the detections in ``scope`` (default: the last 7 days)."""
+    scope = scope or {}
+    with new_session() as session:
+        builder = ContextBuilder(budget)
+        query = _scope_query(scope)
+        start, end = _scope_window(scope)
+        if start is not None and not set(scope) - {"start", "end"}:
+            # Plain time range: the rollups already have the aggregates
+            _add_rollup_sections(builder, session, start, "day", end=end)
+        else:
+            builder.add("Overview", _scope_overview(session, query))
+
+        # Most recent first, thinned out evenly over the range if it doesn't fit
+        lines, total = _sample_records(
+            session, query, (DetectionRecord.timestamp.desc(), DetectionRecord.id.desc()),
+            builder.remaining // LOG_LINE_TOKENS, _context_line,
+        )
+        if not total:
             return "No detections found in the database."
+        builder.add("Detections log", lines, total=total)
+
+        return builder.render()
+
+
+RANGE_DAYS = {"weekly": 7, "monthly": 30, "yearly": 365}
+
+def _range_start(range: str) -> datetime:
+    now = datetime.utcnow()
+    if range in RANGE_DAYS:
+        return now - timedelta(days=RANGE_DAYS[range])
+    return datetime.combine(now.date(), time.min)
+
+def _merge_stats(stats: list, size: int) -> list:
+    # Coarser buckets for the prompt: size consecutive buckets become one
+    merged = []
+    for i in range(0, len(stats), size):
+        group = stats[i:i + size]
+        plates = sum(s["plates"] for s in group)
+        conf_sum = sum(s["avg_confidence"] * s["plates"] for s in group if s["plates"])
+        merged.append({
+            "bucket": group[0]["bucket"],
+            "until": group[-1]["bucket"] if size > 1 else None,
+            "detections": sum(s["detections"] for s in group),
+            "plates": plates,
+            "avg_confidence": conf_sum / plates if plates else None,
+        })
+    return merged
+
+def _overview(session: Session, start: datetime, period: str, stats: list, end: datetime = None) -> dict:
+    plates = sum(s["plates"] for s in stats)
+    conf_sum = sum(s["avg_confidence"] * s["plates"] for s in stats if s["plates"])
+    return {
+        "detections": sum(s["detections"] for s in stats),
+        "plates": plates,
+        "avg_confidence": round(conf_sum / plates, 4) if plates else None,
+        "top_plates": rollups.top_plates(session, start, end, period=period),
+    }
+
+def _overview_lines(session: Session, start: datetime, period: str, stats: list, end: datetime = None) -> list:
+    overview = _overview(session, start, period, stats, end)
+    avg = f"{overview['avg_confidence']:.2f}" if overview["avg_confidence"] is not None else "n/a"
+    return [
+        f"Total: {overview['detections']} detections, {overview['plates']} plates, average confidence {avg}",
+        "Top plates: " + (", ".join(f"{t['plate']} ({t['count']})" for t in overview["top_plates"]) or "none"),
+    ]
 
-        return "\n".join(lines)
+BUCKET_FORMATS = {"hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d"}
+
+def _bucket_lines(stats: list, period: str) -> list:
+    fmt = BUCKET_FORMATS[period]
+    lines = []
+    for s in stats:
+        label = s["bucket"].strftime(fmt)
+        if s.get("until"):
+            label += f" to {s['until'].strftime(fmt)}"
+        conf = f"{s['avg_confidence']:.2f}" if s["avg_confidence"] is not None else "n/a"
+        lines.append(f"{label}: {s['detections']} detections, {s['plates']} plates, average confidence {conf}")
+    return lines
 
+# Bucket sizes tried, finest first, when the per-hour/per-day lines don't fit
+MERGE_LEVELS = {"hour": (1, 3, 6, 24), "day": (1, 7, 30, 90)}
+
+def _add_rollup_sections(builder: ContextBuilder, session: Session, start: datetime, period: str,
+                         end: datetime = None):
+    """Overview and per-bucket trend from the rollups, coarsened to fit half the budget."""
+    stats = rollups.period_stats(session, start, end, period=period)
+    if not stats:
+        return
+    builder.add("Overview", _overview_lines(session, start, period, stats, end))
+
+    # Leave the other half for anything more detailed added afterwards
+    share = builder.remaining // 2
+    for size in MERGE_LEVELS[period]:
+        lines = _bucket_lines(_merge_stats(stats, size), period)
+        if lines_tokens(lines) <= share:
+            break
+    note = f"merged into {size}-{period} buckets" if size > 1 else None
+    builder.add(f"Per {period}", lines, note=note)
+
+def _rollup_summary(session: Session, start: datetime, period: str = "day") -> str:
+    # Reads the precomputed rollups, so cost depends on the number of buckets
+    # rather than the number of detections
+    stats = rollups.period_stats(session, start, period=period)
+    if not stats:
+        return "No detections for this period."
+    return "\n".join(_overview_lines(session, start, period, stats) + _bucket_lines(stats, period))
+
+def build_summary_context(range: str, budget: int = LLM_CONTEXT_TOKENS) -> str:
+    """Prompt context for a daily/weekly/monthly/yearly summary, within ``budget`` tokens."""
+    start = _range_start(range)
+    period = "hour" if range == "daily" else "day"
+    with new_session() as session:
+        builder = ContextBuilder(budget)
+        _add_rollup_sections(builder, session, start, period)
+        if not builder.sections:
+            return "No detections for this period."
+        if range == "daily":
+            query = select(DetectionRecord).where(DetectionRecord.timestamp >= start)
+            lines, total = _sample_records(
+                session, query, (DetectionRecord.timestamp, DetectionRecord.id),
+                builder.remaining // LOG_LINE_TOKENS, _summary_line,
+            )
+            builder.add("Detections", lines, total=total)
+        return builder.render()
 
 def generate_daily_summary():
-    today = datetime.utcnow().date()
-    with Session(engine) as session:
-        results = session.exec(
-            select(DetectionRecord).where(DetectionRecord.timestamp >= today)
-        ).all()
-        return _summarize_records(results, session)
+    today = _range_start("daily")
+    with new_session() as session:
+        overview = _rollup_summary(session, today, period="hour")
+        # Today's log is small enough to list in full
+        log = _summarize_records(session, select(DetectionRecord).where(DetectionRecord.timestamp >= today))
+        return f"{overview}\n\nDetections:\n{log}"
 
 def generate_weekly_summary():
-    one_week_ago = datetime.utcnow() - timedelta(days=7)
-    with Session(engine) as session:
-        results = session.exec(
-            select(DetectionRecord).where(DetectionRecord.timestamp >= one_week_ago)
-        ).all()
-        return _summarize_records(results, session)
+    with new_session() as session:
+        return _rollup_summary(session, _range_start("weekly"))
 
 def generate_monthly_summary():
-    one_month_ago = datetime.utcnow() - timedelta(days=30)
-    with Session(engine) as session:
-        results = session.exec(
-            select(DetectionRecord).where(DetectionRecord.timestamp >= one_month_ago)
-        ).all()
-        return _summarize_records(results, session)
-    
-def generate_yearly_summary():
-    one_year_ago = datetime.utcnow() - timedelta(days=365)
-    with Session(engine) as session:
-        results = session.exec(
-            select(DetectionRecord).where(DetectionRecord.timestamp >= one_year_ago)
-        ).all()
-        return _summarize_records(results, session)
-
-def _summarize_records(records, session: Session) -> str:
-    lines = []
-    for record in records:
-        plates = session.exec(
-            select(PlateInfo).where(PlateInfo.detection_id == record.id)
-        ).all()
-        plate_list = ", ".join([p.plate_string for p in plates]) or "No plates"
-        lines.append(f"{record.timestamp.date()} - {record.filename} -> {plate_list}")
-
-    return "\n".join(lines) if lines else "No detections for this period."
+    with new_session() as session:
+        return _rollup_summary(session, _range_start("monthly"))
 
-def generate_trend_summary(range: Literal["daily", "weekly", "monthly", "yearly"]):
-    now = datetime.utcnow()
-    if range == "weekly":
-        start_date = now - timedelta(days=7)
-    elif range == "monthly":
-        start_date = now - timedelta(days=30)
-    elif range == "yearly":
-        start_date = now - timedelta(days=365)
-    else:
-        start_date = now.date()
+def generate_yearly_summary():
+    with new_session() as session:
+        return _rollup_summary(session, _range_start("yearly"))
 
-    with Session(engine) as session:
-        results = session.exec(
-            select(DetectionRecord).where(DetectionRecord.timestamp >= start_date)
-        ).all()
+def _summary_line(record) -> str:
+    plate_list = ", ".join([p.plate_string for p in record.plates]) or "No plates"
+    return f"{record.timestamp.date()} - {record.filename} -> {plate_list}"
 
-        plate_counter = Counter()
-        detections_per_day = defaultdict(int)
+def _summarize_records(session: Session, query) -> str:
+    query = query.order_by(DetectionRecord.timestamp, DetectionRecord.id)
+    lines = [_summary_line(record) for record in _iter_detections(session, query)]
 
-        for record in results:
-            plates = session.exec(
-                select(PlateInfo).where(PlateInfo.detection_id == record.id)
-            ).all()
-            for p in plates:
-                plate_counter[p.plate_string] += 1
+    return "\n".join(lines) if lines else "No detections for this period."
 
-            # Count detections by day
-            day = record.timestamp.date()
-            detections_per_day[day] += len(plates)
+def generate_report_stats(range: Literal["daily", "weekly", "monthly", "yearly"]) -> dict:
+    """Totals and per-bucket rows behind the summary text, for tables and CSV export."""
+    start = _range_start(range)
+    period = "hour" if range == "daily" else "day"
+    with new_session() as session:
+        stats = rollups.period_stats(session, start, period=period)
+        return {
+            "overview": _overview(session, start, period, stats),
+            "periods": [
+                {
+                    "period": s["bucket"].strftime(BUCKET_FORMATS[period]),
+                    "detections": s["detections"],
+                    "plates": s["plates"],
+                    "avg_confidence": s["avg_confidence"],
+                }
+                for s in stats
+            ],
+        }
 
-        top_plates = plate_counter.most_common(5)
+def generate_trend_summary(range: Literal["daily", "weekly", "monthly", "yearly"]):
+    start_date = _range_start(range)
+    with new_session() as session:
+        top = rollups.top_plates(session, start_date)
         daily_counts = [
-            {"date": str(day), "count": count}
-            for day, count in sorted(detections_per_day.items())
+            {"date": str(s["bucket"].date()), "count": s["plates"]}
+            for s in rollups.period_stats(session, start_date)
         ]
 
     return {
-        "top_plates": [{"plate": plate, "count": count} for plate, count in top_plates],
+        "top_plates": top,
         "daily_counts": daily_counts,
     }
 
+def summary_prompt(range: str) -> str:
+    return f"Summarize the {range} summary detection log:\n{build_summary_context(range)}"
+
+# Keywords that ask for a canned summary, mapped to their range
+SUMMARY_MAP = {
+    "daily summary": "daily",
+    "weekly summary": "weekly",
+    "monthly summary": "monthly",
+    "yearly summary": "yearly",
+}
+
+def _normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip("?.! ")
+
+def _summary_keyword(question: str):
+    lower_q = _normalize_question(question)
+    for key in SUMMARY_MAP:
+        if lower_q.startswith(key):
+            return key
+    return None
+
+def cache_key(question: str, metadata: dict = None, scope: dict = None) -> str:
+    """Cache key for an answer: question, prompt template and the data it saw.
+
+    Analytics prompts are stamped with the count and max id of the detections
+    they cover, so new or deleted detections make it miss. Developer prompts
+    carry their data in ``metadata``, which is hashed instead.
+    """
+    if metadata:
+        template = kind = "developer"
+        data = hashlib.sha256(json.dumps(metadata, sort_keys=True, default=str).encode()).hexdigest()
+    else:
+        keyword = None if scope else _summary_keyword(question)
+        if keyword:
+            kind = "summary"
+            template = f"summary:{SUMMARY_MAP[keyword]}"
+            query = select(DetectionRecord).where(DetectionRecord.timestamp >= _range_start(SUMMARY_MAP[keyword]))
+        else:
+            kind = "analytics"
+            template = "analytics:" + json.dumps(scope or {}, sort_keys=True)
+            query = _scope_query(scope or {})
+        ids = query.with_only_columns(DetectionRecord.id).subquery()
+        with new_session() as session:
+            count, max_id = session.exec(select(func.count(), func.max(ids.c.id))).one()
+        data = f"{count}:{max_id}"
+
+    parts = [PROMPT_VERSION, executor.model_for(kind), template, _normalize_question(question), data]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+def replay_cached_answer(question: str, metadata: dict = None, scope: dict = None):
+    """Replay a cached answer under a new task id, or None on a miss."""
+    chunks = llm_cache.get(cache_key(question, metadata, scope))
+    if chunks is None:
+        return None
+    task_id = f"cached-{uuid.uuid4().hex}"
+    llm_cache.replay(task_id, chunks)
+    return task_id
+
 @celery_app.task(bind=True)
-def run_llm_task(self, question: str, metadata: dict = None):
+def run_llm_task(self, question: str, metadata: dict = None, scope: dict = None,
+                 interactive: bool = True):
+    """Answer ``question`` into ``llm_stream:{task_id}``.
+
+    ``scope`` (see ``make_scope``) limits an analytics question to some
+    detections; the worker loads them itself rather than receiving rows.
+    Scheduled work passes ``interactive=False`` and waits behind people.
+    """
+    # Keyed before the prompt is built, so the stamp never claims newer data than was used
+    answer_key = cache_key(question, metadata, scope)
     if metadata:
         # Developer assistant prompt
+        kind = "developer"
         prompt = build_prompt(question, metadata)
     else:
         # Analytics assistant
-        lower_q = question.lower()
-
-        # Map keywords to summary functions
-        summary_map = {
-            "daily summary": generate_daily_summary,
-            "weekly summary": generate_weekly_summary,
-            "monthly summary": generate_monthly_summary,
-            "yearly summary": generate_yearly_summary,
-        }
-
-        # Check for summary keywords
-        matched = None
-        for key, func in summary_map.items():
-            if lower_q.startswith(key):
-                matched = func
-                break
+        key = None if scope else _summary_keyword(question)
 
-        if matched:
-            context = matched()
-            prompt = f"Summarize the {key} detection log:\n{context}"
+        # Both contexts are built to fit LLM_CONTEXT_TOKENS, aggregates first
+        if key:
+            kind = "summary"
+            prompt = summary_prompt(SUMMARY_MAP[key])
         else:
             # General analytics
-            context = generate_context_from_db(question)
+            kind = "analytics"
+            context = generate_context_from_db(question, scope=scope)
             prompt = (
                 "You are a traffic analytics assistant. Use the following detection data to answer the question.\n\n"
                 f"Detections log:\n{context}\n\n"
@@ -183,19 +439,29 @@ def run_llm_task(self, question: str, metadata: dict = None):
                 "Base your answer strictly on the log data above. If the data is insufficient, say so."
             )
 
-    key = f"llm_stream:{self.request.id}"
-    r.delete(key)
+    task_id = self.request.id
+    llm_stream.reset(r, task_id)
+
+    chunks = []
+    def publish(chunk):
+        chunks.append(chunk)
+        llm_stream.publish_chunk(r, task_id, chunk)
 
-    response_text = ""
-    for part in client.chat(
-        model="gemma:2b",  # can change model
-        messages=[{"role": "user", "content": prompt}],
-        stream=True
-    ):
-        chunk = part["message"]["content"]
-        response_text += chunk
-        r.rpush(key, chunk)
+    try:
+        executor.generate(
+            executor.model_for(kind),
+            prompt,
+            on_chunk=publish,
+            priority=PRIORITY_INTERACTIVE if interactive else PRIORITY_SCHEDULED,
+        )
+    except Exception as exc:
+        # Let stream readers stop instead of waiting for an end that never comes
+        llm_stream.publish_end(r, task_id, error=str(exc))
+        raise
 
-    r.rpush(key, "[[END]]")
+    llm_stream.publish_end(r, task_id)
+    response_text = "".join(chunks)
+    if response_text:
+        llm_cache.set(answer_key, chunks)
     return response_text
 
@@ -0,0 +1,65 @@
+import json
+import os
+import time
+from typing import Optional
+
+import redis
+
+from main.backend.services import llm_stream
+
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500"))
+
+
+class LLMCache:
+    """Finished LLM answers in Redis, evicted by TTL and least-recently-used.
+
+    Answers are stored as the list of chunks the model streamed, so a hit
+    can be replayed through ``llm_stream:{task_id}`` exactly like a live
+    answer. Recency lives in a sorted set; past ``max_entries`` the least
+    recently used answers are dropped. Redis errors count as misses so the
+    cache never gets in the way of asking.
+    """
+
+    def __init__(self, client, ttl: int = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 prefix: str = "llm_cache:"):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.lru_key = prefix + "lru"
+
+    def get(self, key: str) -> Optional[list]:
+        try:
+            raw = self.client.get(self.prefix + key)
+            if raw is None:
+                return None
+            self.client.expire(self.prefix + key, self.ttl)
+            self.client.zadd(self.lru_key, {key: time.time()})
+        except redis.RedisError:
+            return None
+        return json.loads(raw)
+
+    def set(self, key: str, chunks: list):
+        try:
+            now = time.time()
+            self.client.set(self.prefix + key, json.dumps(chunks), ex=self.ttl)
+            self.client.zadd(self.lru_key, {key: now})
+            # Members not touched within the TTL have expired already
+            self.client.zremrangebyscore(self.lru_key, 0, now - self.ttl)
+            overflow = self.client.zcard(self.lru_key) - self.max_entries
+            if overflow > 0:
+                for member, _ in self.client.zpopmin(self.lru_key, overflow):
+                    member = member.decode() if isinstance(member, bytes) else member
+                    self.client.delete(self.prefix + member)
+        except redis.RedisError:
+            pass
+
+    def replay(self, task_id: str, chunks: list):
+        """Publish a cached answer as task ``task_id``, exactly as a live task would."""
+        llm_stream.reset(self.client, task_id)
+        for chunk in chunks:
+            llm_stream.publish_chunk(self.client, task_id, chunk)
+        llm_stream.publish_end(self.client, task_id)
+        # Served by /llm/result/{task_id}, since there is no Celery result
+        self.client.set(f"llm_result:{task_id}", "".join(chunks), ex=self.ttl)
@@ -0,0 +1,181 @@
+import heapq
+import itertools
+import os
+import threading
+from contextlib import contextmanager
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gemma:2b")
+# Per-kind model choice, e.g. "summary=llama3:8b,developer=codellama:7b";
+# kinds are developer, summary and analytics
+LLM_MODELS = os.getenv("LLM_MODELS", "")
+# Generations allowed at once per model, overridable per model in
+# LLM_MODEL_CONCURRENCY, e.g. "llama3:8b=1,gemma:2b=3"
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "2"))
+LLM_MODEL_CONCURRENCY = os.getenv("LLM_MODEL_CONCURRENCY", "")
+
+# Lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SCHEDULED = 10
+
+
+def parse_mapping(value: str) -> dict:
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {k.strip(): v.strip() for k, v in pairs}
+
+
+class PrioritySemaphore:
+    """Semaphore whose waiters are served by priority, then arrival order."""
+
+    def __init__(self, limit: int):
+        self.limit = max(limit, 1)
+        self.active = 0
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            while self._waiting[0] != ticket or self.active >= self.limit:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self.active += 1
+            # The next waiter may fit too
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_INTERACTIVE):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class Generation:
+    """One in-flight model call that any number of callers can follow."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self._cond = threading.Condition()
+
+    def append(self, chunk: str):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: BaseException = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def follow(self):
+        # Replays what was generated so far, then waits for the rest
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                new = self.chunks[index:]
+                done, error = self.done, self.error
+            for chunk in new:
+                yield chunk
+            index += len(new)
+            if done and index >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class LLMExecutor:
+    """Runs chat generations against Ollama with per-model limits.
+
+    Each model gets a ``PrioritySemaphore`` of its concurrency, so at most
+    that many prompts reach Ollama at once and interactive ones jump ahead
+    of scheduled ones. A prompt identical to one already in flight for the
+    same model doesn't start a second generation: the caller follows the
+    first one and gets every chunk, including those already produced.
+
+    Coalescing and limits are per process, so run the LLM worker with a
+    thread pool (``--pool threads``) to share them between tasks.
+    """
+
+    def __init__(self, client, default_model: str = LLM_MODEL, models: dict = None,
+                 concurrency: int = LLM_CONCURRENCY, model_concurrency: dict = None):
+        self.client = client
+        self.default_model = default_model
+        self.models = parse_mapping(LLM_MODELS) if models is None else models
+        self.concurrency = concurrency
+        self.model_concurrency = (
+            {k: int(v) for k, v in parse_mapping(LLM_MODEL_CONCURRENCY).items()}
+            if model_concurrency is None else model_concurrency
+        )
+        self.stats = {"generations": 0, "coalesced": 0}
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._inflight = {}
+
+    def model_for(self, kind: str) -> str:
+        return self.models.get(kind, self.default_model)
+
+    def _semaphore(self, model: str) -> PrioritySemaphore:
+        with self._lock:
+            if model not in self._slots:
+                self._slots[model] = PrioritySemaphore(self.model_concurrency.get(model, self.concurrency))
+            return self._slots[model]
+
+    def generate(self, model: str, prompt: str, on_chunk=None,
+                 priority: int = PRIORITY_INTERACTIVE) -> str:
+        """Stream ``prompt`` through ``model``, calling ``on_chunk`` per chunk; returns the text."""
+        key = (model, prompt)
+        with self._lock:
+            generation = self._inflight.get(key)
+            leader = generation is None
+            if leader:
+                generation = self._inflight[key] = Generation()
+                self.stats["generations"] += 1
+            else:
+                generation.followers += 1
+                self.stats["coalesced"] += 1
+
+        if leader:
+            worker = threading.Thread(
+                target=self._run, args=(generation, key, priority), name="llm-generate", daemon=True
+            )
+            worker.start()
+
+        chunks = []
+        for chunk in generation.follow():
+            chunks.append(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+        return "".join(chunks)
+
+    def _run(self, generation: Generation, key, priority: int):
+        model, prompt = key
+        error = None
+        try:
+            with self._semaphore(model).slot(priority):
+                for part in self.client.chat(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    stream=True,
+                ):
+                    generation.append(part["message"]["content"])
+        except Exception as exc:
+            error = exc
+        finally:
+            # Later identical prompts start afresh rather than join a finished one
+            with self._lock:
+                self._inflight.pop(key, None)
+            generation.finish(error)
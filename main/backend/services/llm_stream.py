@@ -0,0 +1,87 @@
+import os
+
+END_MARKER = "[[END]]"
+LLM_STREAM_TTL = int(os.getenv("LLM_STREAM_TTL", "3600"))
+LLM_SSE_HEARTBEAT = float(os.getenv("LLM_SSE_HEARTBEAT", "15"))
+LLM_SSE_IDLE_TIMEOUT = float(os.getenv("LLM_SSE_IDLE_TIMEOUT", "300"))
+
+
+def list_key(task_id: str) -> str:
+    return f"llm_stream:{task_id}"
+
+
+def events_key(task_id: str) -> str:
+    return f"llm_events:{task_id}"
+
+
+# Producers write every chunk twice: to the llm_stream:{task_id} list that
+# existing clients poll, and to the llm_events:{task_id} Redis Stream that
+# the SSE endpoint blocks on.
+
+def publish_chunk(client, task_id: str, chunk: str):
+    client.rpush(list_key(task_id), chunk)
+    client.xadd(events_key(task_id), {"chunk": chunk})
+
+
+def publish_end(client, task_id: str, error: str = None):
+    client.rpush(list_key(task_id), END_MARKER)
+    client.xadd(events_key(task_id), {"end": "1"} if error is None else {"error": error})
+    client.expire(list_key(task_id), LLM_STREAM_TTL)
+    client.expire(events_key(task_id), LLM_STREAM_TTL)
+
+
+def reset(client, task_id: str):
+    client.delete(list_key(task_id), events_key(task_id))
+
+
+def sse_event(data: str, event: str = None, event_id: str = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    # Multi-line payloads need one data: field per line
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+async def sse_events(client, task_id: str,
+                     last_id: str = "0-0",
+                     heartbeat: float = LLM_SSE_HEARTBEAT,
+                     idle_timeout: float = LLM_SSE_IDLE_TIMEOUT,
+                     is_dead=None):
+    """Server-sent events for one task, read with ``XREAD BLOCK``.
+
+    ``client`` is a ``redis.asyncio`` client with ``decode_responses=True``.
+    Each chunk is a ``chunk`` event whose id is its stream entry id, so a
+    reconnect with ``Last-Event-ID`` resumes where it stopped. The stream
+    closes with ``end``, ``error`` or ``timeout``; while waiting, a comment
+    line goes out every ``heartbeat`` seconds and the optional async
+    ``is_dead()`` is asked whether the task has died.
+    """
+    key = events_key(task_id)
+    idle = 0.0
+    while True:
+        response = await client.xread({key: last_id}, block=int(heartbeat * 1000), count=100)
+        if not response:
+            idle += heartbeat
+            if is_dead is not None and await is_dead():
+                yield sse_event("task failed", event="error")
+                return
+            if idle >= idle_timeout:
+                yield sse_event("no output", event="timeout")
+                return
+            yield ": keep-alive\n\n"
+            continue
+
+        idle = 0.0
+        for entry_id, fields in response[0][1]:
+            last_id = entry_id
+            if "chunk" in fields:
+                yield sse_event(fields["chunk"], event="chunk", event_id=entry_id)
+            elif "error" in fields:
+                yield sse_event(fields["error"], event="error", event_id=entry_id)
+                return
+            else:
+                yield sse_event("", event="end", event_id=entry_id)
+                return
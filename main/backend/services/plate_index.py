@@ -0,0 +1,143 @@
+import re
+import sqlite3
+
+from sqlalchemy import event, exists
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import GenericFunction
+from sqlalchemy.types import Integer
+from sqlmodel import Session, select, func
+
+from main.backend.models import DetectionRecord, PlateInfo, PlateTrigram
+
+# Characters OCR mixes up are folded onto one canonical symbol
+CONFUSABLES = str.maketrans({
+    "O": "0", "Q": "0", "D": "0",
+    "I": "1", "L": "1",
+    "B": "8",
+    "S": "5",
+    "Z": "2",
+    "G": "6",
+})
+
+
+def normalize_plate(plate_string: str) -> str:
+    return re.sub(r"[^A-Z0-9]", "", (plate_string or "").upper()).translate(CONFUSABLES)
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def plate_trigrams(plate_key: str) -> set:
+    # ^ and $ anchors make prefix and whole-plate queries selective too
+    return trigrams(f"^{plate_key}$")
+
+
+def trigram_rows(plate_id: int, plate_key: str) -> list:
+    return [{"trigram": g, "plate_id": plate_id} for g in sorted(plate_trigrams(plate_key))]
+
+
+def _candidate_ids(grams, min_shared: int):
+    return (
+        select(PlateTrigram.plate_id)
+        .where(PlateTrigram.trigram.in_(sorted(grams)))
+        .group_by(PlateTrigram.plate_id)
+        .having(func.count() >= min_shared)
+    )
+
+
+def edit_distance(a: str, b: str) -> int:
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        curr = [i]
+        for j, cb in enumerate(b, 1):
+            curr.append(min(prev[j] + 1, curr[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = curr
+    return prev[-1]
+
+
+class plate_distance(GenericFunction):
+    """Edit distance between two plate keys, computed by the database."""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(plate_distance, "postgresql")
+def _levenshtein(element, compiler, **kw):
+    # From fuzzystrmatch, see the add_plate_distance migration
+    return f"levenshtein({compiler.process(element.clauses, **kw)})"
+
+
+def _sqlite_plate_distance(a, b):
+    return None if a is None or b is None else edit_distance(a, b)
+
+
+@event.listens_for(Engine, "connect")
+def _register_plate_distance(dbapi_connection, connection_record):
+    # SQLite has no edit distance of its own
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function("plate_distance", 2, _sqlite_plate_distance, deterministic=True)
+
+
+def fuzzy_distance_bound(key: str, max_distance: int) -> int:
+    """``max_distance`` capped to what the trigram index can bound for ``key``.
+
+    An edit touches at most three trigrams, so a plate within ``d`` edits
+    shares all but ``3 * d`` of the key's trigrams. Distances that would
+    leave nothing to share can't be narrowed by the index and are lowered:
+    one edit for 4-6 character keys, two for 7-9, exact below four.
+    """
+    return max(0, min(max_distance, (len(plate_trigrams(key)) - 1) // 3))
+
+
+def plate_match_clause(query: str, mode: str = "substring", max_distance: int = 1):
+    """SQL condition on PlateInfo for a substring, prefix or fuzzy plate query.
+
+    Plates are narrowed through the trigram index, then confirmed against
+    plate_key. Substring and prefix queries shorter than one trigram fall
+    back to plate_key alone; fuzzy queries confirm with plate_distance.
+    """
+    key = normalize_plate(query)
+    if mode == "fuzzy":
+        grams = plate_trigrams(key)
+        max_distance = fuzzy_distance_bound(key, max_distance)
+        return (
+            PlateInfo.id.in_(_candidate_ids(grams, len(grams) - 3 * max_distance))
+            & (plate_distance(PlateInfo.plate_key, key) <= max_distance)
+        )
+    if mode == "prefix":
+        grams = trigrams(f"^{key}")
+        confirm = PlateInfo.plate_key.startswith(key)
+    else:
+        grams = trigrams(key)
+        confirm = PlateInfo.plate_key.contains(key)
+
+    if not grams:
+        return confirm
+    return PlateInfo.id.in_(_candidate_ids(grams, len(grams))) & confirm
+
+
+def plate_exists(query: str, mode: str = "substring", max_distance: int = 1):
+    # For filtering DetectionRecord queries by plate
+    return exists().where(
+        PlateInfo.detection_id == DetectionRecord.id,
+        plate_match_clause(query, mode, max_distance),
+    )
+
+
+def search_plates(session: Session, query: str, mode: str = "substring",
+                  max_distance: int = 1, limit: int = 50) -> list:
+    """Look up PlateInfo rows by plate string.
+
+    ``mode`` is ``substring``, ``prefix`` or ``fuzzy``. Fuzzy matches whole
+    plates within ``max_distance`` edits (see fuzzy_distance_bound), closest
+    first.
+    """
+    statement = select(PlateInfo).where(plate_match_clause(query, mode, max_distance))
+    if mode == "fuzzy":
+        distance = plate_distance(PlateInfo.plate_key, normalize_plate(query))
+        statement = statement.order_by(distance, PlateInfo.plate_confidence.desc(), PlateInfo.id.desc())
+    else:
+        statement = statement.order_by(PlateInfo.id.desc())
+    return session.exec(statement.limit(limit)).all()
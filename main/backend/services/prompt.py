@@ -0,0 +1,82 @@
+import math
+import os
+
+# Tokens of context handed to the model, on top of the question and instructions
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "3000"))
+# Rough tokenizer-free estimate; log lines of plates and dates average ~4 chars/token
+CHARS_PER_TOKEN = 4
+# Kept free for the note listing what was cut
+NOTE_TOKENS = 40
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def lines_tokens(lines) -> int:
+    # +1 per line for the newline
+    return sum(estimate_tokens(line) + 1 for line in lines)
+
+
+def sample_evenly(items: list, n: int) -> list:
+    if n >= len(items):
+        return list(items)
+    if n <= 0:
+        return []
+    step = len(items) / n
+    return [items[int(i * step)] for i in range(n)]
+
+
+class ContextBuilder:
+    """Assembles prompt context under a token budget.
+
+    Sections are added most important first (aggregates before raw rows).
+    A section that doesn't fit is sampled evenly down to what does, so it
+    still spans the whole range. Every cut is recorded in ``truncated`` and
+    listed in a note at the end of the rendered context.
+    """
+
+    def __init__(self, budget: int = LLM_CONTEXT_TOKENS):
+        self.budget = budget
+        self.used = 0
+        self.sections = []
+        self.notes = []
+        self.truncated = []
+
+    @property
+    def remaining(self) -> int:
+        return max(self.budget - self.used, 0)
+
+    def add(self, title: str, lines: list, total: int = None, note: str = None) -> int:
+        """Add ``lines`` under ``title``; returns how many were kept.
+
+        ``total`` is how many lines ``lines`` was drawn from when the caller
+        already sampled them.
+        """
+        total = len(lines) if total is None else total
+        available = self.remaining - estimate_tokens(title) - 1
+        if lines_tokens(lines) > available:
+            available -= NOTE_TOKENS
+            n = int(len(lines) * max(available, 0) / max(lines_tokens(lines), 1))
+            while n > 0 and lines_tokens(sample_evenly(lines, n)) > available:
+                n -= 1
+            lines = sample_evenly(lines, n)
+
+        if note:
+            self.notes.append(f"{title}: {note}")
+        if len(lines) < total:
+            self.truncated.append({"section": title, "kept": len(lines), "total": total})
+        if lines:
+            self.sections.append((title, lines))
+            self.used += estimate_tokens(title) + 1 + lines_tokens(lines)
+        return len(lines)
+
+    def render(self) -> str:
+        parts = [f"{title}:\n" + "\n".join(lines) for title, lines in self.sections]
+        notes = self.notes + [
+            f"{t['section']}: {t['kept']} of {t['total']} lines shown, evenly sampled"
+            for t in self.truncated
+        ]
+        if notes:
+            parts.append("Note: the data was shortened to fit. " + "; ".join(notes) + ".")
+        return "\n\n".join(parts)
@@ -0,0 +1,102 @@
+import os
+import threading
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent.parent.parent
+MODELS_DIR = REPO_DIR / "models"
+
+# name -> (path, version); paths and versions can be overridden per deployment
+MODEL_SPECS = {
+    "plate": (
+        os.getenv("PLATE_MODEL_PATH", str(MODELS_DIR / "License Plate Detection v4" / "runs" / "detect" / "train" / "weights" / "best.pt")),
+        os.getenv("PLATE_MODEL_VERSION", "plate-v4"),
+    ),
+    "char": (
+        os.getenv("CHAR_MODEL_PATH", str(MODELS_DIR / "License Plate Characters v5" / "weights.pt")),
+        os.getenv("CHAR_MODEL_VERSION", "char-v5"),
+    ),
+}
+
+
+class ModelRegistry:
+    """Loads YOLO weights on first use and keeps them warm for the life of the process.
+
+    Ultralytics predictors are not thread-safe, so each thread that runs
+    inference (e.g. the detection worker pool) gets its own instance, and
+    ``warm_up`` only warms the calling thread's.
+    """
+
+    def __init__(self, specs):
+        self._specs = dict(specs)
+        self._local = threading.local()
+        self._loaded = {name: 0 for name in self._specs}
+        self._lock = threading.Lock()
+
+    def _thread_models(self) -> dict:
+        models = getattr(self._local, "models", None)
+        if models is None:
+            models = self._local.models = {}
+        return models
+
+    def get(self, name: str):
+        models = self._thread_models()
+        model = models.get(name)
+        if model is None:
+            # Deferred so processes that never detect don't import torch
+            from ultralytics import YOLO
+
+            path, _ = self._specs[name]
+            model = models[name] = YOLO(path)
+            with self._lock:
+                self._loaded[name] += 1
+        return model
+
+    def version(self, name: str) -> str:
+        return self._specs[name][1]
+
+    def model_version(self) -> str:
+        # Stored on DetectionRecord.model_version
+        return "+".join(self.version(name) for name in self._specs)
+
+    def warm_up(self, names=None):
+        for name in names or self._specs:
+            self.get(name)
+
+    def unload(self, name: str = None):
+        # Drops the calling thread's instances
+        models = self._thread_models()
+        for key in ([name] if name else list(models)):
+            if models.pop(key, None) is not None:
+                with self._lock:
+                    self._loaded[key] -= 1
+
+    def health(self) -> dict:
+        return {
+            name: {
+                "path": path,
+                "version": version,
+                "exists": os.path.exists(path),
+                "loaded": self._loaded[name] > 0,
+                "instances": self._loaded[name],
+            }
+            for name, (path, version) in self._specs.items()
+        }
+
+
+class LazyModel:
+    """Callable stand-in for a YOLO model that resolves through the registry."""
+
+    def __init__(self, registry: ModelRegistry, name: str):
+        self._registry = registry
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        return self._registry.get(self._name)(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self._registry.get(self._name), attr)
+
+
+registry = ModelRegistry(MODEL_SPECS)
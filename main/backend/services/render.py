@@ -0,0 +1,157 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+from sqlmodel import Session, select
+
+from main.backend.models import DetectionRecord, PlateInfo, CharacterBox
+from main.backend.services.artifacts import ARTIFACT_JPEG_QUALITY, draw_characters, draw_plates
+from main.backend.services.ingest import find_upload
+from main.backend.services.yolo import char_map
+
+# Write crops and annotated images at detection time, as before. Off by
+# default: saved uploads are rendered from the original on request instead
+PERSIST_ARTIFACTS = os.getenv("PERSIST_ARTIFACTS", "0") == "1"
+# Encoded renders kept in memory
+RENDER_CACHE_BYTES = int(os.getenv("RENDER_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Bump when drawing changes so clients drop their copies
+RENDER_VERSION = "1"
+
+RENDER_KINDS = ("annotated", "crop")
+
+
+def detection_url(record_id: int) -> str:
+    return f"/render/detections/{record_id}/annotated.jpg"
+
+
+def plate_url(plate_id: int, kind: str) -> str:
+    return f"/render/plates/{plate_id}/{kind}.jpg"
+
+
+class RenderCache:
+    """Encoded images by ETag, least recently used evicted past ``max_bytes``."""
+
+    def __init__(self, max_bytes: int = RENDER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return data
+
+    def set(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+render_cache = RenderCache()
+
+
+class Render:
+    """What a render URL resolves to; ``draw`` produces the BGR image."""
+
+    def __init__(self, etag: str, last_modified, source: str, draw):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.source = source
+        self.draw = draw
+
+    def encode(self, quality: int = ARTIFACT_JPEG_QUALITY) -> bytes:
+        data = render_cache.get(self.etag)
+        if data is None:
+            image = cv2.imread(self.source)
+            if image is None:
+                raise LookupError("Original image is unreadable.")
+            _, buffer = cv2.imencode(".jpg", self.draw(image), [cv2.IMWRITE_JPEG_QUALITY, quality])
+            data = buffer.tobytes()
+            render_cache.set(self.etag, data)
+        return data
+
+
+def _etag(*parts) -> str:
+    return hashlib.sha256("|".join(map(str, (RENDER_VERSION,) + parts)).encode()).hexdigest()[:32]
+
+
+def _source(record: DetectionRecord) -> str:
+    source = find_upload(record.content_hash) if record.content_hash else None
+    if source is None:
+        raise LookupError("Original image is no longer stored.")
+    return source
+
+
+def _box(plate: PlateInfo):
+    if plate.x1 is None:
+        raise LookupError("Plate has no stored box.")
+    return plate.x1, plate.y1, plate.x2, plate.y2
+
+
+def _plate_labels(plates):
+    # Plate boxes labelled with their reading
+    return [(_box(p), f"{p.plate_string} {p.plate_confidence:.2f}") for p in plates]
+
+
+def record_render(record: DetectionRecord, plates: list) -> Render:
+    """Annotated image of ``record`` with its ``plates``, from rows already loaded."""
+    etag = _etag("detection", record.id, record.content_hash,
+                 [(p.plate_string, p.plate_confidence, _box(p)) for p in plates])
+    return Render(etag, record.timestamp, _source(record), lambda image: draw_plates(image, _plate_labels(plates)))
+
+
+def crop_render(record: DetectionRecord, plate: PlateInfo) -> Render:
+    """Crop of ``plate`` out of its record's original, from rows already loaded."""
+    x1, y1, x2, y2 = _box(plate)
+    etag = _etag("crop", plate.id, record.content_hash, (x1, y1, x2, y2))
+    return Render(etag, record.timestamp, _source(record), lambda image: image[y1:y2, x1:x2])
+
+
+def detection_render(session: Session, record_id: int) -> Render:
+    record = session.get(DetectionRecord, record_id)
+    if record is None:
+        raise LookupError("Detection not found.")
+    plates = session.exec(
+        select(PlateInfo).where(PlateInfo.detection_id == record_id).order_by(PlateInfo.id)
+    ).all()
+    return record_render(record, plates)
+
+
+def plate_render(session: Session, plate_id: int, kind: str) -> Render:
+    plate = session.get(PlateInfo, plate_id)
+    if plate is None:
+        raise LookupError("Plate not found.")
+    record = session.get(DetectionRecord, plate.detection_id)
+    if kind == "crop":
+        return crop_render(record, plate)
+    x1, y1, x2, y2 = _box(plate)
+
+    # Character boxes are stored in the 640x640 crop the character model saw
+    characters = [
+        ((c.x1, c.y1, c.x2, c.y2), char_map[c.class_id])
+        for c in session.exec(
+            select(CharacterBox).where(CharacterBox.plate_id == plate_id).order_by(CharacterBox.id)
+        ).all()
+    ]
+    etag = _etag("annotated", plate.id, record.content_hash, (x1, y1, x2, y2), characters)
+    return Render(
+        etag, record.timestamp, _source(record),
+        lambda image: draw_characters(cv2.resize(image[y1:y2, x1:x2], (640, 640)), characters),
+    )
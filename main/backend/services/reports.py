@@ -0,0 +1,97 @@
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Session, select, delete, func
+
+from main.backend.celery_worker import celery_app
+from main.backend.db import new_session
+from main.backend.models import ReportSnapshot
+from main.backend.services import llm
+from main.backend.services.analytics import plate_frequency, accuracy_trends
+from main.backend.services.llm_pool import PRIORITY_SCHEDULED
+
+REPORT_RANGES = ("daily", "weekly", "monthly", "yearly")
+# Snapshots kept per range; older versions are pruned when a new one lands
+REPORT_SNAPSHOTS_KEPT = int(os.getenv("REPORT_SNAPSHOTS_KEPT", "30"))
+# Ask the model for a short write-up of each scheduled report
+REPORT_NARRATIVES = os.getenv("REPORT_NARRATIVES", "0") == "1"
+
+SUMMARIES = {
+    "daily": llm.generate_daily_summary,
+    "weekly": llm.generate_weekly_summary,
+    "monthly": llm.generate_monthly_summary,
+    "yearly": llm.generate_yearly_summary,
+}
+
+
+def build_report(session: Session, range: str,
+                 start: Optional[datetime] = None,
+                 end: Optional[datetime] = None,
+                 top_n: Optional[int] = None) -> dict:
+    """Everything /analytics/report returns with rich=true, computed now."""
+    return {
+        "summary": SUMMARIES[range](),
+        **llm.generate_report_stats(range),
+        "trends": llm.generate_trend_summary(range),
+        "plate_frequency": plate_frequency(session, start, end, top_n),
+        "accuracy_trends": accuracy_trends(session, start, end),
+    }
+
+
+def generate_narrative(range: str) -> str:
+    # Runs behind interactive questions on the shared executor
+    return llm.executor.generate(
+        llm.executor.model_for("summary"),
+        llm.summary_prompt(range),
+        priority=PRIORITY_SCHEDULED,
+    )
+
+
+def store_snapshot(session: Session, range: str, data: dict, narrative: str = None) -> ReportSnapshot:
+    latest = session.exec(
+        select(func.max(ReportSnapshot.version)).where(ReportSnapshot.range == range)
+    ).one()
+    snapshot = ReportSnapshot(range=range, version=(latest or 0) + 1, data=data, narrative=narrative)
+    session.add(snapshot)
+
+    session.exec(delete(ReportSnapshot).where(
+        ReportSnapshot.range == range,
+        ReportSnapshot.version <= snapshot.version - REPORT_SNAPSHOTS_KEPT,
+    ))
+    session.commit()
+    session.refresh(snapshot)
+    return snapshot
+
+
+def latest_snapshot(session: Session, range: str) -> Optional[ReportSnapshot]:
+    return session.exec(
+        select(ReportSnapshot)
+        .where(ReportSnapshot.range == range)
+        .order_by(ReportSnapshot.version.desc())
+        .limit(1)
+    ).first()
+
+
+def refresh_snapshot(session: Session, range: str, narrative: bool = False) -> ReportSnapshot:
+    data = build_report(session, range)
+    text = generate_narrative(range) if narrative else None
+    return store_snapshot(session, range, data, text)
+
+
+def snapshot_response(snapshot: ReportSnapshot, rich: bool) -> dict:
+    response = dict(snapshot.data) if rich else {"summary": snapshot.data["summary"]}
+    response["generated_at"] = snapshot.generated_at.isoformat()
+    response["version"] = snapshot.version
+    if snapshot.narrative:
+        response["narrative"] = snapshot.narrative
+    return response
+
+
+@celery_app.task
+def refresh_reports(ranges=REPORT_RANGES, narrative: bool = REPORT_NARRATIVES):
+    with new_session() as session:
+        return {
+            range: refresh_snapshot(session, range, narrative=narrative).version
+            for range in ranges
+        }
@@ -0,0 +1,226 @@
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select, delete, func
+
+from main.backend.celery_worker import celery_app
+from main.backend.db import new_session
+from main.backend.models import DetectionRecord, PlateInfo, DetectionRollup, PlateRollup
+
+ROLLUP_PERIODS = ("hour", "day")
+ROLLUP_TOP_PLATES = int(os.getenv("ROLLUP_TOP_PLATES", "5"))
+# The periodic task rebuilds this many recent days to pick up deletes and
+# anything written around the ingest path
+ROLLUP_REFRESH_DAYS = int(os.getenv("ROLLUP_REFRESH_DAYS", "2"))
+
+
+def bucket_start(ts: datetime, period: str) -> datetime:
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    if period == "day":
+        ts = ts.replace(hour=0)
+    return ts
+
+
+def _increments(detections):
+    """Fold ``(timestamp, [(plate_string, confidence), ...])`` pairs into rollup rows."""
+    stats = defaultdict(lambda: [0, 0, 0.0])
+    plates = defaultdict(int)
+    for ts, detected in detections:
+        for period in ROLLUP_PERIODS:
+            bucket = bucket_start(ts, period)
+            row = stats[(period, bucket)]
+            row[0] += 1
+            for plate_string, confidence in detected:
+                row[1] += 1
+                row[2] += confidence or 0.0
+                plates[(period, bucket, plate_string)] += 1
+
+    stat_rows = [
+        {"period": p, "bucket": b, "detection_count": d, "plate_count": n, "confidence_sum": c}
+        for (p, b), (d, n, c) in stats.items()
+    ]
+    plate_rows = [
+        {"period": p, "bucket": b, "plate_string": s, "count": n}
+        for (p, b, s), n in plates.items()
+    ]
+    return stat_rows, plate_rows
+
+
+def _upsert(session: Session, model, rows: list, counters: tuple):
+    # Add to the counters of existing buckets; ON CONFLICT keeps concurrent
+    # writers from losing each other's increments
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[c.name for c in model.__table__.primary_key],
+        set_={c: model.__table__.c[c] + stmt.excluded[c] for c in counters},
+    )
+    session.execute(stmt, rows)
+
+
+def apply_rollups(session: Session, detections):
+    """Add new detections to the rollups; the caller commits."""
+    stat_rows, plate_rows = _increments(detections)
+    if stat_rows:
+        _upsert(session, DetectionRollup, stat_rows, ("detection_count", "plate_count", "confidence_sum"))
+    if plate_rows:
+        _upsert(session, PlateRollup, plate_rows, ("count",))
+
+
+def rebuild_rollups(session: Session, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Recompute rollups for whole days in [start, end) from the raw tables.
+
+    The caller commits. Used by the migration backfill, the periodic refresh
+    and after deletes.
+    """
+    if start is not None:
+        start = bucket_start(start, "day")
+    if end is not None and end != bucket_start(end, "day"):
+        end = bucket_start(end, "day") + timedelta(days=1)
+
+    for model in (DetectionRollup, PlateRollup):
+        stmt = delete(model)
+        if start is not None:
+            stmt = stmt.where(model.bucket >= start)
+        if end is not None:
+            stmt = stmt.where(model.bucket < end)
+        session.execute(stmt)
+
+    query = (
+        select(DetectionRecord.id, DetectionRecord.timestamp, PlateInfo.plate_string, PlateInfo.plate_confidence)
+        .outerjoin(PlateInfo, PlateInfo.detection_id == DetectionRecord.id)
+        .order_by(DetectionRecord.id)
+    )
+    if start is not None:
+        query = query.where(DetectionRecord.timestamp >= start)
+    if end is not None:
+        query = query.where(DetectionRecord.timestamp < end)
+
+    detections = []
+    last_id = None
+    for detection_id, ts, plate_string, confidence in session.execute(query).yield_per(1000):
+        if detection_id != last_id:
+            detections.append((ts, []))
+            last_id = detection_id
+        if plate_string is not None:
+            detections[-1][1].append((plate_string, confidence))
+
+        if len(detections) > 1000:
+            # Keep the last detection open; its plates may continue
+            apply_rollups(session, detections[:-1])
+            detections = detections[-1:]
+    apply_rollups(session, detections)
+
+
+PERIOD_STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+
+def _split_range(start: datetime, end: Optional[datetime], period: str):
+    """Split [start, end) into whole buckets [first, last) and the partial edges.
+
+    ``last`` is None for an open range. The edges are the parts of a bucket
+    that the range only partly covers; the rollups can't answer those.
+    """
+    first = bucket_start(start, period)
+    if first < start:
+        first += PERIOD_STEPS[period]
+    last = None if end is None else bucket_start(end, period)
+    if last is not None and last < first:
+        # Inside a single bucket
+        return first, first, [(start, end)] if start < end else []
+
+    edges = []
+    if start < first:
+        edges.append((start, first))
+    if last is not None and last < end:
+        edges.append((last, end))
+    return first, last, edges
+
+
+def _raw_stats(session: Session, start: datetime, end: datetime) -> dict:
+    detections = session.exec(
+        select(func.count(DetectionRecord.id))
+        .where(DetectionRecord.timestamp >= start, DetectionRecord.timestamp < end)
+    ).one()
+    plates, confidence_sum = session.exec(
+        select(func.count(PlateInfo.id), func.sum(PlateInfo.plate_confidence))
+        .join(DetectionRecord, PlateInfo.detection_id == DetectionRecord.id)
+        .where(DetectionRecord.timestamp >= start, DetectionRecord.timestamp < end)
+    ).one()
+    return {"detections": detections, "plates": plates, "confidence_sum": confidence_sum or 0.0}
+
+
+def period_stats(session: Session, start: datetime, end: Optional[datetime] = None, period: str = "day") -> list:
+    """Per-bucket totals for [start, end).
+
+    Whole buckets come from the rollups. A bucket the range cuts through is
+    counted from the raw tables for just the covered part, and is labelled
+    with its bucket start.
+    """
+    first, last, edges = _split_range(start, end, period)
+    query = select(DetectionRollup).where(
+        DetectionRollup.period == period,
+        DetectionRollup.bucket >= first,
+    )
+    if last is not None:
+        query = query.where(DetectionRollup.bucket < last)
+    rows = [
+        {
+            "bucket": row.bucket,
+            "detections": row.detection_count,
+            "plates": row.plate_count,
+            "confidence_sum": row.confidence_sum,
+        }
+        for row in session.exec(query.order_by(DetectionRollup.bucket)).all()
+    ]
+    for edge_start, edge_end in edges:
+        raw = _raw_stats(session, edge_start, edge_end)
+        if raw["detections"]:
+            rows.append({"bucket": bucket_start(edge_start, period), **raw})
+    return [
+        {
+            "bucket": row["bucket"],
+            "detections": row["detections"],
+            "plates": row["plates"],
+            "avg_confidence": round(row["confidence_sum"] / row["plates"], 4) if row["plates"] else None,
+        }
+        for row in sorted(rows, key=lambda row: row["bucket"])
+    ]
+
+
+def top_plates(session: Session, start: datetime, end: Optional[datetime] = None,
+               period: str = "day", n: int = ROLLUP_TOP_PLATES) -> list:
+    """Most seen plates in [start, end), with partial buckets counted from the raw tables."""
+    first, last, edges = _split_range(start, end, period)
+    rolled = select(PlateRollup.plate_string.label("plate"), PlateRollup.count.label("count")).where(
+        PlateRollup.period == period,
+        PlateRollup.bucket >= first,
+    )
+    if last is not None:
+        rolled = rolled.where(PlateRollup.bucket < last)
+    counts = [rolled]
+    for edge_start, edge_end in edges:
+        counts.append(
+            select(PlateInfo.plate_string.label("plate"), func.count().label("count"))
+            .join(DetectionRecord, PlateInfo.detection_id == DetectionRecord.id)
+            .where(DetectionRecord.timestamp >= edge_start, DetectionRecord.timestamp < edge_end)
+            .group_by(PlateInfo.plate_string)
+        )
+    combined = union_all(*counts).subquery()
+    total = func.sum(combined.c.count).label("total")
+    query = select(combined.c.plate, total).group_by(combined.c.plate).order_by(total.desc(), combined.c.plate).limit(n)
+    return [{"plate": plate, "count": count} for plate, count in session.exec(query).all()]
+
+
+@celery_app.task
+def refresh_rollups(days: int = ROLLUP_REFRESH_DAYS):
+    start = datetime.utcnow() - timedelta(days=days)
+    with new_session() as session:
+        rebuild_rollups(session, start)
+        session.commit()
+
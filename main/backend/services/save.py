@@ -1,16 +1,12 @@
-from sqlmodel import Session
-from main.backend.models import DetectionRecord, PlateInfo, CharacterBox
+from sqlalchemy import update
+from sqlmodel import Session, insert
+from main.backend.models import DetectionRecord, PlateInfo, CharacterBox, PlateTrigram
+from main.backend.services.plate_index import normalize_plate, trigram_rows
+from main.backend.services.rollups import apply_rollups
+from main.backend.services.render import detection_url, plate_url
 from datetime import datetime
 
-def save_detection_to_db(session: Session,
-    filename: str,
-    result: dict,
-    user_id: int = None,
-    model_version: str = None,
-    confidence_threshold: float = None,
-):
-    
-    ts = result.get("timestamp")
+def _parse_timestamp(ts):
     if ts:
         try:
             # Allow string timestamps
@@ -20,43 +16,138 @@ def save_detection_to_db(session: Session,
             ts = datetime.utcnow()
     else:
         ts = datetime.utcnow()
-    
-    detection = DetectionRecord(
-        filename=filename,
-        timestamp=ts,
-        annotated_image=result["annotated_image_path"],
+    return ts
+
+def save_detections_bulk(session: Session,
+    entries: list,
+    user_id: int = None,
+    model_version: str = None,
+    confidence_threshold: float = None,
+) -> list:
+    """Persist many detection results in one transaction.
+
+    ``entries`` is a list of ``(filename, result)`` pairs; each table is
+    written with a single executemany ``INSERT ... RETURNING``. Returns the
+    new ``DetectionRecord`` ids in input order. The plate index and the
+    hourly/daily rollups are updated in the same transaction.
+
+    Results detected without artifacts (no ``annotated_image_path`` or
+    ``plate_crop_path``) get ``/render/`` URLs instead, which are also
+    written back into the result dicts.
+    """
+    if not entries:
+        return []
+
+    timestamps = [_parse_timestamp(result.get("timestamp")) for _, result in entries]
+    detection_ids = session.execute(
+        insert(DetectionRecord).returning(DetectionRecord.id, sort_by_parameter_order=True),
+        [
+            {
+                "filename": filename,
+                "timestamp": ts,
+                "annotated_image": result["annotated_image_path"] or "",
+                "user_id": user_id,
+                "model_version": model_version,
+                "confidence_threshold": confidence_threshold,
+                "content_hash": result.get("content_hash"),
+            }
+            for ts, (filename, result) in zip(timestamps, entries)
+        ],
+    ).scalars().all()
+
+    lazy_images = []
+    for detection_id, (_, result) in zip(detection_ids, entries):
+        if not result["annotated_image_path"]:
+            result["annotated_image"] = result["annotated_image_path"] = detection_url(detection_id)
+            lazy_images.append({"id": detection_id, "annotated_image": result["annotated_image"]})
+    if lazy_images:
+        session.execute(update(DetectionRecord), lazy_images)
+
+    plate_rows = []
+    plate_chars = []
+    plate_dicts = []
+    for detection_id, (_, result) in zip(detection_ids, entries):
+        for plate in result["detections"]:
+            plate_conf = plate.get("plate_confidence")
+            if plate_conf is None:
+                plate_conf = 0.0
+            plate_string = plate.get("plate_string") or "UNKNOWN"
+            plate_rows.append({
+                "detection_id": detection_id,
+                "plate_crop_path": plate["plate_crop_path"] or "",
+                "annotated_crop_path": plate["annotated_crop_path"],
+                "plate_string": plate_string,
+                "plate_key": normalize_plate(plate_string),
+                "plate_confidence": plate_conf,
+                **dict(zip(("x1", "y1", "x2", "y2"), plate.get("plate_box") or (None,) * 4)),
+            })
+            plate_chars.append(plate.get("characters", []))
+            plate_dicts.append(plate)
+
+    if plate_rows:
+        plate_ids = session.execute(
+            insert(PlateInfo).returning(PlateInfo.id, sort_by_parameter_order=True),
+            plate_rows,
+        ).scalars().all()
+
+        lazy_crops = []
+        for plate_id, plate in zip(plate_ids, plate_dicts):
+            if not plate["plate_crop_path"]:
+                plate["plate_crop_path"] = plate_url(plate_id, "crop")
+                plate["annotated_crop_path"] = plate_url(plate_id, "annotated")
+                lazy_crops.append({
+                    "id": plate_id,
+                    "plate_crop_path": plate["plate_crop_path"],
+                    "annotated_crop_path": plate["annotated_crop_path"],
+                })
+        if lazy_crops:
+            session.execute(update(PlateInfo), lazy_crops)
+
+        char_rows = [
+            {
+                "detection_id": plate_row["detection_id"],
+                "plate_id": plate_id,
+                "x1": char["box"][0],
+                "y1": char["box"][1],
+                "x2": char["box"][2],
+                "y2": char["box"][3],
+                "class_id": char["class_id"],
+                "confidence": char["confidence"],
+            }
+            for plate_id, plate_row, chars in zip(plate_ids, plate_rows, plate_chars)
+            for char in chars
+        ]
+        if char_rows:
+            session.execute(insert(CharacterBox), char_rows)
+
+        gram_rows = [
+            row
+            for plate_id, plate_row in zip(plate_ids, plate_rows)
+            for row in trigram_rows(plate_id, plate_row["plate_key"])
+        ]
+        if gram_rows:
+            session.execute(insert(PlateTrigram), gram_rows)
+
+    apply_rollups(session, [
+        (ts, [(p.get("plate_string") or "UNKNOWN", p.get("plate_confidence") or 0.0) for p in result["detections"]])
+        for ts, (_, result) in zip(timestamps, entries)
+    ])
+
+    session.commit()
+    return list(detection_ids)
+
+def save_detection_to_db(session: Session,
+    filename: str,
+    result: dict,
+    user_id: int = None,
+    model_version: str = None,
+    confidence_threshold: float = None,
+):
+    detection_id, = save_detections_bulk(
+        session,
+        [(filename, result)],
         user_id=user_id,
         model_version=model_version,
         confidence_threshold=confidence_threshold,
     )
-    session.add(detection)
-    session.commit()
-    session.refresh(detection)
-
-    for plate in result["detections"]:
-        plate_conf = plate.get("plate_confidence")
-        if plate_conf is None:
-            plate_conf = 0.0
-        plate_record = PlateInfo(
-            detection_id=detection.id,
-            plate_crop_path=plate["plate_crop_path"],
-            annotated_crop_path=plate["annotated_crop_path"],
-            plate_string=plate.get("plate_string") or "UNKNOWN",
-            plate_confidence=plate_conf
-        )
-        session.add(plate_record)
-
-        for char in plate.get("characters", []):
-            char_record = CharacterBox(
-                detection_id=detection.id,
-                x1=char["box"][0],
-                y1=char["box"][1],
-                x2=char["box"][2],
-                y2=char["box"][3],
-                class_id=char["class_id"],
-                confidence=char["confidence"]
-            )
-            session.add(char_record)
-
-    session.commit()
-    return detection
+    return session.get(DetectionRecord, detection_id)
@@ -0,0 +1,114 @@
+import itertools
+from collections import Counter
+
+
+def iou(a, b) -> float:
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+class PlateTrack:
+    def __init__(self, track_id: int, box):
+        self.id = track_id
+        self.box = box
+        self.hits = 1
+        self.missed = 0
+        self.readings = Counter()
+        self.detection = None
+        self.emitted_string = None
+
+    def observe(self, detection: dict):
+        if detection["plate_string"] != "UNKNOWN":
+            self.readings[detection["plate_string"]] += 1
+        best = self.best_string
+        if best is None or detection["plate_string"] == best:
+            self.detection = detection
+
+    @property
+    def best_string(self):
+        if not self.readings:
+            return None
+        return self.readings.most_common(1)[0][0]
+
+
+class PlateTracker:
+    """IoU association of plate boxes across sequential frames.
+
+    Once a track has read the same plate string ``min_agreement`` times and
+    that string makes up at least ``min_share`` of its readings, it is
+    converged: later frames reuse its result and skip the character model.
+    Tracks unmatched for more than ``max_missed`` frames are dropped.
+    """
+
+    def __init__(self, iou_thresh=0.3, max_missed=10, min_agreement=3, min_share=0.6):
+        self.iou_thresh = iou_thresh
+        self.max_missed = max_missed
+        self.min_agreement = min_agreement
+        self.min_share = min_share
+        self.tracks = []
+        self.ocr_skipped = 0
+        self._ids = itertools.count(1)
+
+    def converged(self, track: PlateTrack) -> bool:
+        best = track.best_string
+        if best is None or track.detection is None:
+            return False
+        count = track.readings[best]
+        return count >= self.min_agreement and count / sum(track.readings.values()) >= self.min_share
+
+    def update(self, boxes) -> list:
+        """Associate one frame's plate boxes with tracks; returns a track per box."""
+        pairs = sorted(
+            (
+                (iou(track.box, box), t, b)
+                for t, track in enumerate(self.tracks)
+                for b, box in enumerate(boxes)
+            ),
+            reverse=True,
+        )
+
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for overlap, t, b in pairs:
+            if overlap < self.iou_thresh:
+                break
+            if t in used_tracks or assigned[b] is not None:
+                continue
+            track = self.tracks[t]
+            track.box = boxes[b]
+            track.hits += 1
+            track.missed = 0
+            assigned[b] = track
+            used_tracks.add(t)
+
+        for t, track in enumerate(self.tracks):
+            if t not in used_tracks:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                assigned[b] = PlateTrack(next(self._ids), box)
+                self.tracks.append(assigned[b])
+
+        return assigned
+
+    def mark_emitted(self, track: PlateTrack, plate_string: str) -> bool:
+        # Worth persisting: a track's first sighting, then once more if it
+        # converges on a different string than the one first stored
+        first = track.emitted_string is None
+        settled = (
+            plate_string != track.emitted_string
+            and plate_string == track.best_string
+            and self.converged(track)
+        )
+        if first or settled:
+            track.emitted_string = plate_string
+            return True
+        return False
@@ -0,0 +1,260 @@
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from main.backend.db import new_session
+from main.backend.services.yolo import detect_batch, write_artifacts
+from main.backend.services.save import save_detections_bulk
+from main.backend.services.tracking import PlateTracker
+
+VIDEO_QUEUE_SIZE = int(os.getenv("VIDEO_QUEUE_SIZE", "32"))
+VIDEO_BATCH_SIZE = int(os.getenv("VIDEO_BATCH_SIZE", "8"))
+VIDEO_PERSIST_CHUNK = int(os.getenv("VIDEO_PERSIST_CHUNK", "16"))
+# Also save sampled frames with no plates on them (an empty road, mostly)
+VIDEO_PERSIST_EMPTY = os.getenv("VIDEO_PERSIST_EMPTY", "0") == "1"
+
+_END = object()
+
+
+class FrameSampler:
+    """Picks which decoded frames go to detection.
+
+    Frames are sampled every ``stride`` frames. When consecutive samples look
+    the same (mean absolute difference of a small grayscale thumbnail below
+    ``motion_thresh``) the stride doubles up to ``max_stride``; any motion
+    resets it to ``base_stride``. ``back_off`` lets the pipeline widen the
+    stride when the detector falls behind.
+    """
+
+    def __init__(self, base_stride=5, max_stride=60, motion_thresh=3.0):
+        self.base_stride = base_stride
+        self.max_stride = max_stride
+        self.motion_thresh = motion_thresh
+        self.stride = base_stride
+        self.static_skips = 0
+        self._last_index = None
+        self._last_thumb = None
+
+    def should_sample(self, index: int, frame) -> bool:
+        if self._last_index is not None and index - self._last_index < self.stride:
+            return False
+
+        thumb = cv2.cvtColor(cv2.resize(frame, (64, 36)), cv2.COLOR_BGR2GRAY)
+        if self._last_thumb is not None:
+            motion = float(np.mean(cv2.absdiff(thumb, self._last_thumb)))
+            if motion >= self.motion_thresh:
+                self.stride = self.base_stride
+            elif index - self._last_index < self.max_stride:
+                self.stride = min(self.stride * 2, self.max_stride)
+                self.static_skips += 1
+                return False
+
+        self._last_index = index
+        self._last_thumb = thumb
+        return True
+
+    def back_off(self):
+        self.stride = min(self.stride * 2, self.max_stride)
+
+
+class VideoPipeline:
+    """Decode -> sample -> bounded queue -> batched detection -> chunked persistence.
+
+    A decoder thread feeds sampled frames into a queue of ``queue_size``.
+    With ``drop_when_full`` (live sources) frames that don't fit are dropped
+    and counted; otherwise the decoder blocks until the detector catches up.
+    ``run()`` is a generator yielding one result per processed frame.
+
+    With a ``tracker`` (the default) plates seen on consecutive frames share
+    a track: converged tracks skip the character model, and only new plate
+    readings are persisted. Frames without plates are only persisted with
+    ``persist_empty``. Crops and annotated images are only written for
+    persisted frames; the others stream out without image URLs.
+    """
+
+    def __init__(self, source: str,
+                 user_id: int = None,
+                 sampler: FrameSampler = None,
+                 tracker: PlateTracker = None,
+                 track: bool = True,
+                 queue_size: int = VIDEO_QUEUE_SIZE,
+                 batch_size: int = VIDEO_BATCH_SIZE,
+                 persist_chunk: int = VIDEO_PERSIST_CHUNK,
+                 drop_when_full: bool = True,
+                 persist: bool = True,
+                 persist_empty: bool = VIDEO_PERSIST_EMPTY,
+                 model_version: str = None,
+                 plate_conf_thresh=0.5,
+                 char_conf_thresh=0.5):
+        self.source = str(source)
+        self.user_id = user_id
+        self.sampler = sampler or FrameSampler()
+        self.tracker = tracker or (PlateTracker() if track else None)
+        self.batch_size = max(batch_size, 1)
+        self.persist_chunk = max(persist_chunk, 1)
+        self.drop_when_full = drop_when_full
+        self.persist = persist
+        self.persist_empty = persist_empty
+        self.model_version = model_version
+        self.plate_conf_thresh = plate_conf_thresh
+        self.char_conf_thresh = char_conf_thresh
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._pending = []
+        self.started_at = datetime.utcnow()
+        self.stats = {
+            "frames_decoded": 0,
+            "frames_sampled": 0,
+            "frames_skipped": 0,
+            "frames_dropped": 0,
+            "frames_processed": 0,
+            "records_saved": 0,
+            "empty_frames_skipped": 0,
+            "ocr_skipped": 0,
+            "plates_deduplicated": 0,
+        }
+
+    def stop(self):
+        self._stop.set()
+
+    def _decode(self):
+        cap = cv2.VideoCapture(self.source)
+        try:
+            index = 0
+            while not self._stop.is_set():
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                self.stats["frames_decoded"] += 1
+                pos_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+
+                if not self.sampler.should_sample(index, frame):
+                    self.stats["frames_skipped"] += 1
+                else:
+                    self.stats["frames_sampled"] += 1
+                    self._enqueue((index, pos_ms, frame))
+                index += 1
+        finally:
+            cap.release()
+            self._enqueue(_END, force=True)
+
+    def _enqueue(self, item, force=False):
+        if self.drop_when_full and not force:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.stats["frames_dropped"] += 1
+                self.sampler.back_off()
+            return
+
+        while not self._stop.is_set() or force:
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if force and self._stop.is_set():
+                    # Consumer is gone; make room for the end marker
+                    try:
+                        self._queue.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _END:
+            return [], True
+
+        batch = [item]
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _queue_for_persist(self, index, pos_ms, frame, result):
+        if not self.persist:
+            return
+        if not result["detections"] and not self.persist_empty:
+            self.stats["empty_frames_skipped"] += 1
+            return
+        if self.tracker is not None:
+            # Only plates that are new for their track; frames with none are skipped
+            new = [d for d in result["detections"] if d.get("is_new", True)]
+            self.stats["plates_deduplicated"] += len(result["detections"]) - len(new)
+            if result["detections"] and not new:
+                return
+        else:
+            new = result["detections"]
+
+        # Frames have no stored original to render from later, so saved ones get files
+        write_artifacts(frame, result)
+        result = dict(result, detections=new)
+        result["annotated_image_path"] = result["annotated_image"]
+        result["timestamp"] = (self.started_at + timedelta(milliseconds=pos_ms)).isoformat()
+        self._pending.append((index, result))
+
+    def _flush(self):
+        if not self._pending or not self.persist:
+            self._pending = []
+            return
+
+        name = Path(self.source).name
+        with new_session() as session:
+            save_detections_bulk(
+                session,
+                [(f"{name}#frame{index}", result) for index, result in self._pending],
+                user_id=self.user_id,
+                model_version=self.model_version,
+                confidence_threshold=self.plate_conf_thresh,
+            )
+        self.stats["records_saved"] += len(self._pending)
+        self._pending = []
+
+    def run(self):
+        decoder = threading.Thread(target=self._decode, name="video-decode", daemon=True)
+        decoder.start()
+        try:
+            finished = False
+            while not finished:
+                batch, finished = self._next_batch()
+                if not batch:
+                    continue
+
+                results = detect_batch(
+                    [frame for _, _, frame in batch],
+                    self.plate_conf_thresh,
+                    self.char_conf_thresh,
+                    tracker=self.tracker,
+                    artifacts=False,
+                )
+                if self.tracker is not None:
+                    self.stats["ocr_skipped"] = self.tracker.ocr_skipped
+                for (index, pos_ms, frame), result in zip(batch, results):
+                    self.stats["frames_processed"] += 1
+                    self._queue_for_persist(index, pos_ms, frame, result)
+
+                    yield {
+                        "index": index,
+                        "frame": index,
+                        "timestamp_ms": pos_ms,
+                        "annotated_image": result["annotated_image"],
+                        "detections": result["detections"],
+                    }
+
+                if len(self._pending) >= self.persist_chunk:
+                    self._flush()
+
+            self._flush()
+        finally:
+            self.stop()
+            decoder.join()
@@ -1,18 +1,65 @@
-from ultralytics import YOLO
+import copy
 import cv2
+import numpy as np
 import os
 import uuid
 from pathlib import Path
+from main.backend.services.registry import registry, LazyModel
+from main.backend.services.detection_cache import DetectionCache, image_hash, make_tier
+from main.backend.services.artifacts import ArtifactWriter, draw_characters, draw_plates
 
-plate_model = YOLO("/Users/rajirajeev/Documents/Karthika/NUS/Y2/internship/LLM Integration/traffic-intelligence-hub/models/License Plate Detection v4/runs/detect/train/weights/best.pt")
-char_model = YOLO("/Users/rajirajeev/Documents/Karthika/NUS/Y2/internship/LLM Integration/traffic-intelligence-hub/models/License Plate Characters v5/weights.pt") 
+# Weights are loaded by the registry on first call, not at import time
+plate_model = LazyModel(registry, "plate")
+char_model = LazyModel(registry, "char")
 
 BASE_DIR   = Path(__file__).resolve().parent.parent   
 RESULTS_DIR = BASE_DIR / "runs" / "results"
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
+
+# Crops and annotated images are encoded and written here, off the detection path
+artifact_writer = ArtifactWriter()
+
+
+def artifact_paths(result) -> list:
+    """Files under RESULTS_DIR that a result's /static/results/ paths point at."""
+    paths = [result["annotated_image"]] + [
+        p for d in result["detections"] for p in (d["plate_crop_path"], d["annotated_crop_path"])
+    ]
+    return [RESULTS_DIR / os.path.basename(p) if p else None for p in paths]
+
+
+def static_file(url: str):
+    """Local file a stored ``/static/...`` URL is served from, or None for anything else."""
+    if not url or not url.startswith("/static/"):
+        return None
+    runs_dir = RESULTS_DIR.parent
+    path = (runs_dir / url[len("/static/"):]).resolve()
+    return path if path.is_relative_to(runs_dir.resolve()) else None
+
+
+def _artifacts_exist(result) -> bool:
+    paths = artifact_paths(result)
+    # Detected with artifacts=False: nothing on disk to go missing
+    if all(p is None for p in paths):
+        return True
+    return all(p is not None and (p.exists() or artifact_writer.is_pending(p)) for p in paths)
+
+
+def wait_for_artifacts(results, timeout: float = None) -> bool:
+    """Block until the artifacts of ``results`` are written, e.g. before serving their URLs."""
+    return artifact_writer.wait(
+        [p for result in results for p in artifact_paths(result) if p is not None], timeout
+    )
+
+# Keyed on content + model version + thresholds + artifacts; /models/cache shows its stats
+detection_cache = DetectionCache(tier=make_tier(), is_valid=_artifacts_exist)
+
 char_map = "0123456789ABCDEFGHJKLMNOPQRSTUVWXYZ"
 
+# Max plate crops per character-model forward pass
+CHAR_BATCH_SIZE = int(os.getenv("CHAR_BATCH_SIZE", "32"))
+
 def group_and_sort_characters(chars, row_thresh=0.15):
     if not chars:
         return []
@@ -42,13 +89,9 @@ def group_and_sort_characters(chars, row_thresh=0.15):
     return [c for row in rows for c in row]
 
 
-def detect_plates_and_characters(image_path: str,
-                                  plate_conf_thresh=0.5,
-                                  char_conf_thresh=0.5):
-    result_id = uuid.uuid4().hex[:8]
-    plate_results = plate_model(image_path)[0]
+def _collect_plate_crops(plate_results, result_id, plate_conf_thresh):
     orig_image = plate_results.orig_img
-    detections = []
+    plates = []
 
     for i, (box, conf, cls) in enumerate(zip(
             plate_results.boxes.xyxy,
@@ -65,74 +108,245 @@ def detect_plates_and_characters(image_path: str,
         if crop.size == 0:
             continue
 
-        # Save original crop for debugging
-        crop_filename = f"plate_{result_id}_{i}.jpg"
-        crop_path = RESULTS_DIR / crop_filename
-        cv2.imwrite(str(crop_path), crop)
+        plates.append({
+            "index": i,
+            "plate_box": [x1, y1, x2, y2],
+            "plate_confidence": plate_confidence,
+            "crop": crop,
+            # Resize crop for character detection
+            "crop_resized": cv2.resize(crop, (640, 640)),
+        })
 
-        # Resize crop for character detection
-        crop_resized = cv2.resize(crop, (640, 640))
+    return plates
 
-        # Run char detection
-        char_results = char_model(
-            crop_resized,
+
+def _run_char_model(crops, char_conf_thresh):
+    # One forward pass per CHAR_BATCH_SIZE crops instead of one per plate
+    char_results = []
+    for start in range(0, len(crops), CHAR_BATCH_SIZE):
+        char_results.extend(char_model(
+            crops[start:start + CHAR_BATCH_SIZE],
             conf=char_conf_thresh,
             iou=0.5,
             max_det=50
-        )[0]
+        ))
+    return char_results
 
-        chars = []
-        for j, cbox in enumerate(char_results.boxes.xyxy):
-            cx1, cy1, cx2, cy2 = map(int, cbox.tolist())
-            class_id = int(char_results.boxes.cls[j])
-            char_conf = float(char_results.boxes.conf[j])
 
-            if char_conf < char_conf_thresh:
-                continue
+def _extract_characters(char_results, char_conf_thresh):
+    chars = []
+    for j, cbox in enumerate(char_results.boxes.xyxy):
+        cx1, cy1, cx2, cy2 = map(int, cbox.tolist())
+        class_id = int(char_results.boxes.cls[j])
+        char_conf = float(char_results.boxes.conf[j])
 
-            chars.append({
-                "box": [cx1, cy1, cx2, cy2],
-                "class_id": class_id,
-                "confidence": char_conf
-            })
+        if char_conf < char_conf_thresh:
+            continue
 
-        # Group and sort characters
-        sorted_chars = group_and_sort_characters(chars, row_thresh=0.15)
+        chars.append({
+            "box": [cx1, cy1, cx2, cy2],
+            "class_id": class_id,
+            "confidence": char_conf
+        })
 
-        plate_string = (
-            "".join([char_map[c["class_id"]] for c in sorted_chars])
-            if sorted_chars else None
-        )
+    # Group and sort characters
+    return group_and_sort_characters(chars, row_thresh=0.15)
 
-        # Annotate characters on the resized crop
-        for char in sorted_chars:
-            cx1, cy1, cx2, cy2 = char["box"]
-            label = char_map[char["class_id"]]
-            cv2.rectangle(crop_resized, (cx1, cy1), (cx2, cy2), (0, 255, 0), 1)
-            cv2.putText(crop_resized, label, (cx1, cy1 - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 0, 0), 1)
-
-        # Save annotated character crop
-        annotated_crop_filename = f"plate_annotated_{result_id}_{i}.jpg"
-        annotated_crop_path = RESULTS_DIR / annotated_crop_filename
-        cv2.imwrite(str(annotated_crop_path), crop_resized)
-
-        # Store detection
-        detections.append({
-            "plate_box": [x1, y1, x2, y2],
-            "plate_crop_path": f"/static/results/{crop_filename}",
-            "annotated_crop_path": f"/static/results/{annotated_crop_filename}",
-            "plate_string": plate_string or "UNKNOWN",
-            "plate_confidence": plate_confidence,
-            "characters": sorted_chars
+
+def _build_plate_detection(plate, char_results, result_id, char_conf_thresh, artifacts=True):
+    sorted_chars = _extract_characters(char_results, char_conf_thresh)
+
+    plate_string = (
+        "".join([char_map[c["class_id"]] for c in sorted_chars])
+        if sorted_chars else None
+    )
+
+    detection = {
+        "plate_box": plate["plate_box"],
+        "plate_crop_path": None,
+        "annotated_crop_path": None,
+        "plate_string": plate_string or "UNKNOWN",
+        "plate_confidence": plate["plate_confidence"],
+        "characters": sorted_chars
+    }
+    if not artifacts:
+        return detection
+
+    # Original crop, for debugging
+    crop_filename = f"plate_{result_id}_{plate['index']}.jpg"
+    artifact_writer.submit(RESULTS_DIR / crop_filename, plate["crop"])
+
+    # Annotate characters on the resized crop
+    crop_resized = draw_characters(
+        plate["crop_resized"], [(c["box"], char_map[c["class_id"]]) for c in sorted_chars]
+    )
+
+    annotated_crop_filename = f"plate_annotated_{result_id}_{plate['index']}.jpg"
+    artifact_writer.submit(RESULTS_DIR / annotated_crop_filename, crop_resized)
+
+    detection["plate_crop_path"] = f"/static/results/{crop_filename}"
+    detection["annotated_crop_path"] = f"/static/results/{annotated_crop_filename}"
+    return detection
+
+
+def _as_image(image):
+    # Encoded bytes are decoded here; paths and BGR arrays go to YOLO as they are
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        frame = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Could not decode image bytes")
+        return frame
+    return image
+
+
+def detect_batch(image_paths,
+                 plate_conf_thresh=0.5,
+                 char_conf_thresh=0.5,
+                 tracker=None,
+                 content_hashes=None,
+                 artifacts=True):
+    """Run the two-stage pipeline over many images (paths, decoded BGR frames
+    or encoded image bytes).
+
+    The plate model sees all images in one call, and every plate crop that
+    passes ``plate_conf_thresh`` (across all images) goes through the
+    character model in batches of ``CHAR_BATCH_SIZE``.
+
+    With a ``PlateTracker`` the images are treated as sequential frames:
+    plates on a converged track reuse the track's reading instead of running
+    the character model, and each detection gets ``track_id``/``is_new``.
+
+    Without one, results come from ``detection_cache`` when the same content
+    was detected before with the same models and thresholds, and the cached
+    artifacts are returned instead of new ones. ``content_hashes`` saves
+    hashing images the caller already hashed.
+
+    Crops and annotated images are handed to ``artifact_writer`` and are
+    usually still being written when this returns (``wait_for_artifacts``).
+    With ``artifacts=False`` nothing is rendered or written and the artifact
+    paths are None; those results are cached under their own keys.
+    """
+    image_paths = list(image_paths)
+    if not image_paths:
+        return []
+    # Tracked frames depend on the frames before them
+    if tracker is not None or not detection_cache.enabled:
+        return _detect_uncached(image_paths, plate_conf_thresh, char_conf_thresh, tracker, artifacts)
+
+    model_version = registry.model_version()
+    hashes = content_hashes or [image_hash(image) for image in image_paths]
+    keys = [
+        detection_cache.key(h, model_version, plate_conf_thresh, char_conf_thresh, artifacts) if h else None
+        for h in hashes
+    ]
+    results = [detection_cache.get(key) if key else None for key in keys]
+
+    # Misses, with repeats of the same content in this batch detected once
+    pending = {}
+    for i, (key, result) in enumerate(zip(keys, results)):
+        if result is None:
+            pending.setdefault(key or i, i)
+    if pending:
+        detected = _detect_uncached([image_paths[i] for i in pending.values()], plate_conf_thresh, char_conf_thresh,
+                                    artifacts=artifacts)
+        fresh = dict(zip(pending, detected))
+        for key, result in fresh.items():
+            if isinstance(key, str):
+                detection_cache.set(key, result)
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                first = pending[key or i]
+                results[i] = fresh[key or i] if first == i else copy.deepcopy(fresh[key or i])
+    return results
+
+
+def _detect_uncached(image_paths, plate_conf_thresh, char_conf_thresh, tracker=None, artifacts=True):
+    frames = []
+    for plate_results in plate_model([_as_image(image) for image in image_paths]):
+        result_id = uuid.uuid4().hex[:8]
+        plates = _collect_plate_crops(plate_results, result_id, plate_conf_thresh)
+        if tracker is not None:
+            tracks = tracker.update([p["plate_box"] for p in plates])
+            for plate, track in zip(plates, tracks):
+                plate["track"] = track
+                plate["reuse"] = tracker.converged(track)
+        frames.append((plate_results, result_id, plates))
+
+    crops = [p["crop_resized"] for _, _, plates in frames for p in plates if not p.get("reuse")]
+    char_results = iter(_run_char_model(crops, char_conf_thresh))
+
+    results = []
+    for plate_results, result_id, plates in frames:
+        detections = []
+        for plate in plates:
+            track = plate.get("track")
+            if plate.get("reuse"):
+                tracker.ocr_skipped += 1
+                detection = dict(
+                    track.detection,
+                    plate_box=plate["plate_box"],
+                    plate_confidence=plate["plate_confidence"],
+                )
+            else:
+                detection = _build_plate_detection(plate, next(char_results), result_id, char_conf_thresh, artifacts)
+                if track is not None:
+                    track.observe(detection)
+
+            if track is not None:
+                detection["track_id"] = track.id
+                detection["is_new"] = tracker.mark_emitted(track, detection["plate_string"])
+            detections.append(detection)
+
+        annotated_image = None
+        if artifacts:
+            # Full image with plate boxes, rendered on the writer thread
+            annotated_filename = f"annotated_{result_id}.jpg"
+            artifact_writer.submit(RESULTS_DIR / annotated_filename, plate_results.plot)
+            annotated_image = f"/static/results/{annotated_filename}"
+
+        results.append({
+            "annotated_image": annotated_image,
+            "detections": detections
         })
 
-    # Save annotated full image with plate detections
+    return results
+
+
+def write_artifacts(image, result):
+    """Write crops and the annotated image for a result detected with ``artifacts=False``.
+
+    Drawn from ``image`` (a BGR array) and the stored boxes; fills in the
+    result's artifact paths. For callers that only keep some results, e.g.
+    the video pipeline, which saves a fraction of its frames.
+    """
+    result_id = uuid.uuid4().hex[:8]
+    for index, detection in enumerate(result["detections"]):
+        x1, y1, x2, y2 = detection["plate_box"]
+        crop = image[y1:y2, x1:x2]
+        characters = [(c["box"], char_map[c["class_id"]]) for c in detection.get("characters", [])]
+
+        crop_filename = f"plate_{result_id}_{index}.jpg"
+        annotated_crop_filename = f"plate_annotated_{result_id}_{index}.jpg"
+        artifact_writer.submit(RESULTS_DIR / crop_filename, crop)
+        artifact_writer.submit(
+            RESULTS_DIR / annotated_crop_filename,
+            lambda crop=crop, characters=characters: draw_characters(cv2.resize(crop, (640, 640)), characters),
+        )
+        detection["plate_crop_path"] = f"/static/results/{crop_filename}"
+        detection["annotated_crop_path"] = f"/static/results/{annotated_crop_filename}"
+
+    plates = [
+        (d["plate_box"], f"{d['plate_string']} {d['plate_confidence']:.2f}") for d in result["detections"]
+    ]
     annotated_filename = f"annotated_{result_id}.jpg"
-    annotated_path = RESULTS_DIR / annotated_filename
-    plate_results.save(filename=str(annotated_path))
+    artifact_writer.submit(RESULTS_DIR / annotated_filename, lambda: draw_plates(image, plates))
+    result["annotated_image"] = f"/static/results/{annotated_filename}"
+    return result
+
 
-    return {
-        "annotated_image": f"/static/results/{annotated_filename}",
-        "detections": detections
-    }
\ No newline at end of file
+def detect_plates_and_characters(image,
+                                  plate_conf_thresh=0.5,
+                                  char_conf_thresh=0.5,
+                                  artifacts=True):
+    """One image: a path, a BGR array or encoded bytes."""
+    return detect_batch([image], plate_conf_thresh, char_conf_thresh, artifacts=artifacts)[0]
@@ -2,23 +2,42 @@ import { useState, useEffect, useCallback } from "react";
 
 export type ReportRange = "daily" | "weekly" | "monthly" | "yearly";
 
+export type ReportOverview = {
+  detections: number;
+  plates: number;
+  avg_confidence: number | null;
+  top_plates: { plate: string; count: number }[];
+};
+
+export type ReportPeriod = {
+  period: string;
+  detections: number;
+  plates: number;
+  avg_confidence: number | null;
+};
+
 export function useReports(
   range: ReportRange = "daily",
   rich: boolean = false,
   baseUrl: string = "http://192.168.50.143:8000"
 ) {
   const [report, setReport] = useState<string>("");
+  const [overview, setOverview] = useState<ReportOverview | null>(null);
+  const [periods, setPeriods] = useState<ReportPeriod[]>([]);
   const [trends, setTrends] = useState<any | null>(null);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
 
-  const fetchReport = useCallback(async (r: ReportRange = range, richFlag: boolean = rich) => {
+  // refresh=true rebuilds the server-side snapshot instead of serving the stored one
+  const fetchReport = useCallback(async (r: ReportRange = range, richFlag: boolean = rich, refresh: boolean = false) => {
     try {
       setLoading(true);
-      const res = await fetch(`${baseUrl}/analytics/report?range=${r}&rich=${richFlag}`);
+      const res = await fetch(`${baseUrl}/analytics/report?range=${r}&rich=${richFlag}&refresh=${refresh}`);
       if (!res.ok) throw new Error(`Failed with ${res.status}`);
       const data = await res.json();
       setReport(data.summary);
+      setOverview(data.overview || null);
+      setPeriods(data.periods || []);
       setTrends(data.trends || null);
     } catch (err: any) {
       console.error("Failed to fetch report:", err);
@@ -32,27 +51,16 @@ export function useReports(
     fetchReport(range, rich);
   }, [range, rich, fetchReport]);
 
-  const getStructuredReport = () => {
-    return report
-      .split('\n')
-      .filter(Boolean)
-      .map((line) => {
-        const [left, right] = line.split(' -> ');
-        const [date, filename] = left.split(' - ');
-        const plates = right?.split(',').map((p) => p.trim()) || [];
-        return { date, filename, plates };
-      });
-  };
+  const getStructuredReport = () => ({ overview, periods });
 
   const exportCSV = () => {
-    const structured = getStructuredReport();
-
     const csvRows = [
-      ['Date', 'Filename', 'Detected Plates'],
-      ...structured.map(({ date, filename, plates }) => [
-        date,
-        filename,
-        plates.join(' ')
+      ['Period', 'Detections', 'Plates', 'Average Confidence'],
+      ...periods.map(({ period, detections, plates, avg_confidence }) => [
+        period,
+        detections,
+        plates,
+        avg_confidence ?? ''
       ])
     ];
 
@@ -70,6 +78,8 @@ export function useReports(
 
   return {
     report,
+    overview,
+    periods,
     trends,
     loading,
     error,
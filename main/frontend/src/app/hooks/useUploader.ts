@@ -17,7 +17,7 @@ export function useUploader(baseUrl: string = "http://192.168.50.143:8000") {
     setHistory: (data: any[]) => void,
     setResult: (data: any) => void,
     refreshAnalytics: () => void, 
-    refreshReports: () => void 
+    refreshReports: () => Promise<void> 
   ) => {
     if (!files.length) return;
     const fd = new FormData();
@@ -47,9 +47,9 @@ export function useUploader(baseUrl: string = "http://192.168.50.143:8000") {
           if (match) fetchFullResult(match.id);
         }
 
-        // Refresh analytics and reports
+        // Rebuild the report snapshot first so analytics reads the new one
+        await refreshReports();
         refreshAnalytics();
-        refreshReports();
 
         setIsSaved(true);
       } else {
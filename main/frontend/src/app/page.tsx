@@ -123,7 +123,7 @@ return (
               )}
             </div>
             <button
-              onClick={() => uploadFiles(token, isAuthenticated, fetchFiltered, setPlateFrequency, setAccuracyTrends, history, fetchFullResult, setIsSaved, setHistory, setResult, refreshAnalytics, refreshReports)}
+              onClick={() => uploadFiles(token, isAuthenticated, fetchFiltered, setPlateFrequency, setAccuracyTrends, history, fetchFullResult, setIsSaved, setHistory, setResult, refreshAnalytics, () => refreshReports(reportRange, true, true))}
               className="bg-gray-200 dark:bg-gray-700 hover:bg-gray-300 dark:hover:bg-gray-600 text-gray-900 dark:text-gray-100 px-4 py-2 rounded-lg font-semibold text-sm transition-colors duration-200"
             >
               Upload Image(s)
@@ -328,14 +328,14 @@ return (
               <p className="text-gray-400 text-sm">Loading...</p>
             ) : (
               (() => {
-                const structuredReport = getStructuredReport();
+                const { overview, periods } = getStructuredReport();
 
                 return (
                   <div className="overflow-x-auto">
                     <div className="flex items-center justify-between mb-2">
                       <p className="text-gray-200 text-sm">
-                        <strong>{structuredReport.length}</strong> uploaded file(s), <strong>
-                          {structuredReport.reduce((acc, r) => acc + r.plates.length, 0)}
+                        <strong>{overview?.detections ?? 0}</strong> detection(s), <strong>
+                          {overview?.plates ?? 0}
                         </strong> total plates detected.
                       </p>
                       <button
@@ -345,25 +345,32 @@ return (
                         ⬇ Export as CSV
                       </button>
                     </div>
+                    {overview && overview.top_plates.length > 0 && (
+                      <div className="flex flex-wrap gap-2 mb-2">
+                        {overview.top_plates.map(({ plate, count }) => (
+                          <span key={plate} className="bg-blue-600 text-white px-2 py-0.5 rounded-full text-xs">
+                            {plate} ({count})
+                          </span>
+                        ))}
+                      </div>
+                    )}
                     <table className="w-full text-sm text-left text-gray-300 mt-2">
                       <thead className="text-xs uppercase text-gray-400 border-b border-gray-700">
                         <tr>
-                          <th className="py-2">Date</th>
-                          <th className="py-2">Filename</th>
-                          <th className="py-2">Detected Plates</th>
+                          <th className="py-2">Period</th>
+                          <th className="py-2">Detections</th>
+                          <th className="py-2">Plates</th>
+                          <th className="py-2">Avg Confidence</th>
                         </tr>
                       </thead>
                       <tbody>
-                        {structuredReport.map((entry, idx) => (
-                          <tr key={idx} className="border-b border-gray-800 hover:bg-slate-800 transition">
-                            <td className="py-2">{entry.date}</td>
-                            <td className="py-2">{entry.filename}</td>
-                            <td className="py-2 flex flex-wrap gap-2">
-                              {entry.plates.map((plate, i) => (
-                                <span key={i} className="bg-blue-600 text-white px-2 py-0.5 rounded-full text-xs">
-                                  {plate}
-                                </span>
-                              ))}
+                        {periods.map((entry) => (
+                          <tr key={entry.period} className="border-b border-gray-800 hover:bg-slate-800 transition">
+                            <td className="py-2">{entry.period}</td>
+                            <td className="py-2">{entry.detections}</td>
+                            <td className="py-2">{entry.plates}</td>
+                            <td className="py-2">
+                              {entry.avg_confidence !== null ? `${(entry.avg_confidence * 100).toFixed(2)}%` : 'N/A'}
                             </td>
                           </tr>
                         ))}
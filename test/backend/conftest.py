@@ -1,6 +1,7 @@
 # test/backend/conftest.py
 import os
 import pytest
+from datetime import datetime
 
 from fastapi.testclient import TestClient
 from sqlalchemy.pool import StaticPool
@@ -10,6 +11,7 @@ import main.backend.auth.utils as auth_utils
 import main.backend.auth.routes as auth_routes
 from main.backend.db import get_session
 from main.backend.main import app
+from main.backend.services.save import save_detection_to_db
 
 # 1) Shared in-memory DB
 TEST_DB_URL = "sqlite:///:memory:"
@@ -104,8 +106,47 @@ def mock_yolo(monkeypatch):
         "main.backend.services.yolo.detect_plates_and_characters",
         fake_detect
     )
+    # batched entry point used by the upload route
+    def fake_detect_batch(paths, **kwargs):
+        return [fake_detect(path) for path in paths]
+
     # patch the already-imported name in the route module
     monkeypatch.setattr(
-        "main.backend.routes.detection.detect_plates_and_characters",
-        fake_detect
+        "main.backend.routes.detection.detect_batch",
+        fake_detect_batch
     )
+
+# 8) A private, empty database for services that open their own sessions
+@pytest.fixture
+def fresh_engine(monkeypatch):
+    import main.backend.db
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(main.backend.db, "engine", engine)
+    return engine
+
+# 9) Save a detection with the given (plate, confidence) pairs into fresh_engine
+@pytest.fixture
+def save_plates(fresh_engine):
+    def save(filename, plates=(), timestamp=None):
+        with Session(fresh_engine) as session:
+            return save_detection_to_db(session, filename, {
+                "annotated_image_path": "runs/results/a.jpg",
+                "timestamp": (timestamp or datetime.utcnow()).isoformat(),
+                "detections": [
+                    {
+                        "plate_crop_path": "c.jpg",
+                        "annotated_crop_path": "a.jpg",
+                        "plate_string": plate,
+                        "plate_confidence": conf,
+                        "characters": [],
+                    }
+                    for plate, conf in plates
+                ],
+            })
+    return save
+
@@ -1,4 +1,5 @@
 import io
+import json
 import os
 import uuid
 import zipfile
@@ -9,9 +10,15 @@ from pathlib import Path
 from sqlmodel import Session, select
 from fastapi.testclient import TestClient
 
-from main.backend.db import engine
+import cv2
+import numpy as np
+
 from main.backend.auth.utils import create_access_token
 from main.backend.models import User, DetectionRecord
+from main.backend.services.yolo import RESULTS_DIR
+
+# Uploads are sniffed and decoded, so they need to be real images
+FAKE_JPEG = cv2.imencode(".jpg", np.zeros((8, 8, 3), np.uint8))[1].tobytes()
 
 # point at the literal "runs/results" directory, to match the existing download endpoint
 results_dir = Path("runs") / "results"
@@ -38,7 +45,7 @@ def create_user(session: Session) -> User:
 
 
 def upload_image(client: TestClient, filename="test.jpg", headers=None):
-    fake_image = io.BytesIO(b"fake image data")
+    fake_image = io.BytesIO(FAKE_JPEG)
     files = [("files", (filename, fake_image, "image/jpeg"))]
     return client.post("/upload", files=files, headers=headers or {})
 
@@ -52,8 +59,8 @@ def test_upload(client, override_get_session):
     assert data["saved"] is False
 
 
-def test_history(client, override_get_session):
-    with Session(engine) as sess:
+def test_history(client, override_get_session, test_engine):
+    with Session(test_engine) as sess:
         create_user(sess)
 
     token = create_access_token(
@@ -68,8 +75,8 @@ def test_history(client, override_get_session):
     assert len(res.json()) >= 1
 
 
-def test_search(client, override_get_session):
-    with Session(engine) as sess:
+def test_search(client, override_get_session, test_engine):
+    with Session(test_engine) as sess:
         create_user(sess)
 
     token = create_access_token(
@@ -84,8 +91,8 @@ def test_search(client, override_get_session):
     assert res.json()["total"] >= 1
 
 
-def test_result(client, override_get_session):
-    with Session(engine) as sess:
+def test_result(client, override_get_session, test_engine):
+    with Session(test_engine) as sess:
         create_user(sess)
 
     token = create_access_token(
@@ -95,7 +102,7 @@ def test_result(client, override_get_session):
     headers = {"Authorization": f"Bearer {token}"}
 
     upload_image(client, "detailed.jpg", headers=headers)
-    with Session(engine) as sess:
+    with Session(test_engine) as sess:
         record = sess.exec(
             select(DetectionRecord).where(DetectionRecord.filename == "detailed.jpg")
         ).first()
@@ -105,9 +112,39 @@ def test_result(client, override_get_session):
     assert res.json()["filename"] == "detailed.jpg"
 
 
-def test_download(client, override_get_session):
+def test_result_groups_characters_per_plate(client, override_get_session, test_engine):
+    from main.backend.services.save import save_detection_to_db
+
+    result = {
+        "annotated_image_path": "/static/results/fake.jpg",
+        "detections": [
+            {
+                "plate_crop_path": "/static/results/crop.jpg",
+                "annotated_crop_path": "/static/results/crop.jpg",
+                "plate_string": plate_string,
+                "plate_confidence": 0.9,
+                "characters": [
+                    {"box": [i, 0, i + 5, 10], "class_id": i, "confidence": 0.9}
+                    for i in range(n_chars)
+                ],
+            }
+            for plate_string, n_chars in [("AB", 2), ("CDE", 3), ("UNKNOWN", 0)]
+        ],
+    }
+    with Session(test_engine) as sess:
+        record = save_detection_to_db(sess, "multi_plate.jpg", result)
+        record_id = record.id
+
+    res = client.get(f"/result/{record_id}")
+    assert res.status_code == 200
+    detections = res.json()["detections"]
+    assert [d["plate_string"] for d in detections] == ["AB", "CDE", "UNKNOWN"]
+    assert [len(d["characters"]) for d in detections] == [2, 3, 0]
+
+
+def test_download(client, override_get_session, test_engine):
     # 1. create user
-    with Session(engine) as sess:
+    with Session(test_engine) as sess:
         create_user(sess)
 
     # 2. get auth headers
@@ -122,7 +159,7 @@ def test_download(client, override_get_session):
     upload_image(client, unique_filename, headers=headers)
 
     # 4. ensure record exists
-    with Session(engine) as sess:
+    with Session(test_engine) as sess:
         record = sess.exec(
             select(DetectionRecord).where(DetectionRecord.filename == unique_filename)
         ).first()
@@ -139,8 +176,8 @@ def test_download(client, override_get_session):
     assert res.content == b"fake image content"
 
 
-def test_download_all(client, override_get_session):
-    with Session(engine) as sess:
+def test_download_all(client, override_get_session, test_engine):
+    with Session(test_engine) as sess:
         create_user(sess)
 
     token = create_access_token(
@@ -152,17 +189,19 @@ def test_download_all(client, override_get_session):
     upload_image(client, "multi1.jpg", headers=headers)
     upload_image(client, "multi2.jpg", headers=headers)
 
-    with Session(engine) as sess:
+    with Session(test_engine) as sess:
         records = sess.exec(select(DetectionRecord)).all()
         for r in records:
-            # write each annotated and crop into runs/results
+            # write each annotated and crop where /static/results/ is served from
             ann = Path(r.annotated_image).name
             crop = Path(r.annotated_image).name  # assume same folder
-            (results_dir / ann).parent.mkdir(parents=True, exist_ok=True)
-            (results_dir / ann).write_bytes(b"fake image content")
-            (results_dir / crop).write_bytes(b"fake image content")
+            (RESULTS_DIR / ann).parent.mkdir(parents=True, exist_ok=True)
+            (RESULTS_DIR / ann).write_bytes(b"fake image content")
+            (RESULTS_DIR / crop).write_bytes(b"fake image content")
 
     res = client.get("/download-all", headers=headers)
+    for r in records:
+        (RESULTS_DIR / Path(r.annotated_image).name).unlink(missing_ok=True)
     assert res.status_code == 200
     zp = io.BytesIO(res.content)
     with zipfile.ZipFile(zp) as z:
@@ -170,8 +209,8 @@ def test_download_all(client, override_get_session):
 
 
 @patch("main.backend.routes.detection.run_llm_task")
-def test_ask(mock_llm_task, client, override_get_session):
-    with Session(engine) as sess:
+def test_ask(mock_llm_task, client, override_get_session, test_engine):
+    with Session(test_engine) as sess:
         create_user(sess)
 
     mock_res = MagicMock()
@@ -191,3 +230,364 @@ def test_ask(mock_llm_task, client, override_get_session):
     )
     assert res.status_code == 200
     assert res.json()["task_id"] == "mock_task_123"
+    # only the question and a scope go through the broker, not the records
+    args, kwargs = mock_llm_task.apply_async.call_args
+    assert kwargs == {"args": ["What are the most frequent plates?"], "kwargs": {"scope": {}}}
+
+
+@patch("main.backend.routes.detection.run_llm_task")
+def test_ask_sends_scope(mock_llm_task, client, override_get_session):
+    mock_llm_task.apply_async.return_value = MagicMock(id="scoped")
+
+    res = client.post("/ask", json={
+        "question": "Which cameras saw it?",
+        "start": "2024-01-01T00:00:00",
+        "plate_query": "ABC",
+        "max_id": 50,
+    })
+    assert res.json()["task_id"] == "scoped"
+    assert mock_llm_task.apply_async.call_args.kwargs["kwargs"] == {
+        "scope": {"start": "2024-01-01T00:00:00", "max_id": 50, "plate_query": "ABC"},
+    }
+
+    assert client.post("/ask", json={"question": "q", "start": "yesterday"}).status_code == 400
+    assert client.post("/ask", json={}).status_code == 400
+
+
+def test_upload_multiple_files_keeps_order(client, override_get_session):
+    files = [
+        ("files", (f"order_{i}.jpg", io.BytesIO(FAKE_JPEG), "image/jpeg"))
+        for i in range(6)
+    ]
+    res = client.post("/upload", files=files)
+    assert res.status_code == 200
+    assert [r["filename"] for r in res.json()] == [f"order_{i}.jpg" for i in range(6)]
+
+
+def test_upload_async_poll_and_stream(override_get_session):
+    app = __import__("main.backend.main", fromlist=["app"]).app
+    with TestClient(app) as c:
+        files = [
+            ("files", ("job1.jpg", io.BytesIO(FAKE_JPEG), "image/jpeg")),
+            ("files", ("job2.jpg", io.BytesIO(FAKE_JPEG), "image/jpeg")),
+        ]
+        res = c.post("/upload/async", files=files)
+        assert res.status_code == 200
+        job_id = res.json()["job_id"]
+
+        lines = [json.loads(line) for line in c.get(f"/upload/stream/{job_id}").text.splitlines()]
+        assert sorted(line["filename"] for line in lines[:-1]) == ["job1.jpg", "job2.jpg"]
+        assert lines[-1] == {"status": "done", "error": None, "stats": None}
+
+        polled = c.get(f"/upload/result/{job_id}").json()
+        assert polled["status"] == "done"
+        assert polled["completed"] == 2
+        assert [r["filename"] for r in polled["results"]] == ["job1.jpg", "job2.jpg"]
+
+
+def test_upload_result_unknown_job(client):
+    assert client.get("/upload/result/nope").status_code == 404
+
+
+def test_upload_video_streams_frames(override_get_session, tmp_path):
+    import cv2
+    import numpy as np
+
+    video_path = tmp_path / "clip.avi"
+    writer = cv2.VideoWriter(str(video_path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for i in range(12):
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        frame[:, i * 4:i * 4 + 8] = 255
+        writer.write(frame)
+    writer.release()
+
+    def fake_detect_batch(frames, *args, **kwargs):
+        return [{"annotated_image": "/static/results/fake.jpg", "detections": []} for _ in frames]
+
+    app = __import__("main.backend.main", fromlist=["app"]).app
+    with patch("main.backend.services.video.detect_batch", side_effect=fake_detect_batch), TestClient(app) as c:
+        res = c.post("/upload/video", files={"file": ("clip.avi", video_path.read_bytes(), "video/x-msvideo")})
+        assert res.status_code == 200
+        job_id = res.json()["job_id"]
+
+        lines = [json.loads(line) for line in c.get(f"/upload/stream/{job_id}").text.splitlines()]
+        final = lines[-1]
+        assert final["status"] == "done"
+        assert final["stats"]["frames_decoded"] == 12
+        assert final["stats"]["frames_processed"] == len(lines) - 1 > 0
+
+
+def _save_plain(sess, filename, timestamp, plate_string):
+    from main.backend.services.save import save_detection_to_db
+
+    save_detection_to_db(sess, filename, {
+        "annotated_image_path": "/static/results/fake.jpg",
+        "timestamp": timestamp.isoformat(),
+        "detections": [{
+            "plate_crop_path": "/static/results/crop.jpg",
+            "annotated_crop_path": "/static/results/crop.jpg",
+            "plate_string": plate_string,
+            "plate_confidence": 0.9,
+            "characters": [],
+        }],
+    })
+
+
+def test_search_keyset_pagination(client, override_get_session, test_engine):
+    from datetime import datetime
+
+    base = datetime(2020, 1, 1)
+    with Session(test_engine) as sess:
+        for i in range(7):
+            # pairs share a timestamp so the id tie-breaker matters
+            _save_plain(sess, f"keyset_{i}.jpg", base + timedelta(minutes=i // 2), f"KS{i}")
+
+    seen, cursor = [], None
+    while True:
+        params = {"filename_query": "keyset_", "limit": 3, "include_total": "false"}
+        if cursor:
+            params["cursor"] = cursor
+        data = client.get("/search", params=params).json()
+        assert data["total"] is None
+        seen += [r["filename"] for r in data["results"]]
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == [f"keyset_{i}.jpg" for i in (6, 5, 4, 3, 2, 1, 0)]
+
+
+def test_search_offset_plate_filter_and_count(client, override_get_session, test_engine):
+    from datetime import datetime
+
+    with Session(test_engine) as sess:
+        for i in range(5):
+            _save_plain(sess, f"platefilter_{i}.jpg", datetime(2021, 1, 1, i), "ZZQ9" if i % 2 else "OTHER")
+
+    data = client.get("/search", params={
+        "plate_query": "ZZQ", "filename_query": "platefilter_", "order": "asc", "limit": 1, "offset": 1,
+    }).json()
+    assert data["total"] == 2
+    assert [r["filename"] for r in data["results"]] == ["platefilter_3.jpg"]
+    assert data["next_cursor"] is None
+
+
+def test_search_rejects_bad_cursor(client, override_get_session):
+    assert client.get("/search", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_plate_search_modes(client, override_get_session, test_engine):
+    from datetime import datetime
+
+    with Session(test_engine) as sess:
+        _save_plain(sess, "fuzzy_a.jpg", datetime(2022, 1, 1), "QWE8012")
+        _save_plain(sess, "fuzzy_b.jpg", datetime(2022, 1, 2), "RTY4455")
+
+    data = client.get("/plates/search", params={"q": "qwe-bo1"}).json()
+    assert [p["plate_string"] for p in data] == ["QWE8012"]
+
+    data = client.get("/plates/search", params={"q": "QWE8013", "mode": "fuzzy"}).json()
+    assert [p["plate_string"] for p in data] == ["QWE8012"]
+
+    data = client.get("/search", params={"plate_query": "RTY4456", "plate_mode": "fuzzy"}).json()
+    assert [r["filename"] for r in data["results"]] == ["fuzzy_b.jpg"]
+
+    assert client.get("/plates/search", params={"q": "QWE", "mode": "regex"}).status_code == 400
+
+
+def test_plate_frequency_top_n(client, override_get_session, test_engine):
+    from datetime import datetime
+
+    with Session(test_engine) as sess:
+        for i in range(3):
+            _save_plain(sess, f"freq_{i}.jpg", datetime(2023, 6, 1, i), "FRQ1" if i else "FRQ2")
+
+    data = client.get("/plate-frequency", params={"top_n": 1, "start": "2023-06-01T00:00:00", "end": "2023-06-02T00:00:00"}).json()
+    assert data == [{"plate": "FRQ1", "count": 2}]
+
+    trends = client.get("/detection-accuracy-trends", params={"start": "2023-06-01", "end": "2023-06-02"}).json()
+    assert trends == [{"date": "2023-06-01", "avg_confidence": 0.9}]
+
+
+def test_download_all_streams_filtered_files(client, override_get_session, test_engine, tmp_path, monkeypatch):
+    from datetime import datetime
+    from main.backend.services import yolo
+    from main.backend.services.save import save_detection_to_db
+
+    # Written artifacts are stored as the /static/results/ URLs detection returns
+    monkeypatch.setattr(yolo, "RESULTS_DIR", tmp_path / "results")
+    yolo.RESULTS_DIR.mkdir()
+
+    def save(filename, plate):
+        (yolo.RESULTS_DIR / f"ann_{filename}").write_bytes(b"annotated")
+        (yolo.RESULTS_DIR / f"crop_{filename}").write_bytes(b"crop")
+        with Session(test_engine) as sess:
+            save_detection_to_db(sess, filename, {
+                "annotated_image_path": f"/static/results/ann_{filename}",
+                "timestamp": datetime(2021, 3, 1).isoformat(),
+                "detections": [{
+                    "plate_crop_path": f"/static/results/crop_{filename}",
+                    "annotated_crop_path": f"/static/results/crop_{filename}",
+                    "plate_string": plate,
+                    "plate_confidence": 0.9,
+                    "characters": [],
+                }],
+            })
+
+    save("Export_One.jpg", "EXP111")
+    save("export_two.jpg", "EXP222")
+    save("other.jpg", "EXP111")
+
+    res = client.get("/download-all", params={"filename_query": "EXPORT", "plate_query": "EXP111"})
+    assert res.status_code == 200
+    assert res.headers["content-disposition"].startswith("attachment; filename=\"all_results_")
+    with zipfile.ZipFile(io.BytesIO(res.content)) as z:
+        assert sorted(z.namelist()) == ["ann_Export_One.jpg", "crop_Export_One.jpg"]
+        assert z.read("crop_Export_One.jpg") == b"crop"
+
+    assert client.get("/download-all", params={"filename_query": "nothing-matches"}).status_code == 404
+
+
+def test_upload_limits(client, monkeypatch, tmp_path):
+    from main.backend.services import ingest
+
+    monkeypatch.setattr(ingest, "UPLOAD_DIR", str(tmp_path))
+    res = client.post("/upload", files=[("files", ("notes.jpg", io.BytesIO(b"plain text"), "image/jpeg"))])
+    assert res.status_code == 415
+
+    monkeypatch.setattr(ingest, "UPLOAD_MAX_BYTES", 10)
+    res = client.post("/upload", files=[("files", ("big.jpg", io.BytesIO(FAKE_JPEG), "image/jpeg"))])
+    assert res.status_code == 413
+
+
+def test_upload_duplicate_skips_detection(client, override_get_session, test_engine, monkeypatch, tmp_path):
+    from main.backend.services import ingest
+
+    with Session(test_engine) as sess:
+        create_user(sess)
+    token = create_access_token(data={"sub": "test@example.com"}, expires_delta=timedelta(hours=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    monkeypatch.setattr(ingest, "UPLOAD_DIR", str(tmp_path))
+
+    frame = np.full((8, 8, 3), 7, np.uint8)
+    image = cv2.imencode(".png", frame)[1].tobytes()
+    calls = []
+
+    def fake_detect_batch(frames, **kwargs):
+        calls.append(frames)
+        return [{
+            "annotated_image": "/static/results/dup.jpg",
+            "detections": [{
+                "plate_string": "DUP123",
+                "plate_confidence": 0.9,
+                "plate_crop_path": "/static/results/dup_crop.jpg",
+                "annotated_crop_path": "/static/results/dup_crop.jpg",
+                "characters": [],
+            }],
+        } for _ in frames]
+
+    monkeypatch.setattr("main.backend.routes.detection.detect_batch", fake_detect_batch)
+
+    files = [("files", (f"retry{i}.png", io.BytesIO(image), "image/png")) for i in range(2)]
+    first = client.post("/upload", files=files, headers=headers).json()
+    # Same content twice in one upload is detected once, from the decoded bytes
+    assert len(calls) == 1 and len(calls[0]) == 1
+    assert np.array_equal(calls[0][0], frame)
+
+    again = client.post("/upload", files=[("files", ("retry2.png", io.BytesIO(image), "image/png"))],
+                        headers=headers).json()
+    assert len(calls) == 1
+    assert [r["detections"][0]["plate_string"] for r in first + again] == ["DUP123"] * 3
+
+    with Session(test_engine) as sess:
+        records = sess.exec(select(DetectionRecord).where(DetectionRecord.filename.like("retry%"))).all()
+        assert len(records) == 3
+        assert len({r.content_hash for r in records}) == 1
+
+
+def test_models_cache_stats(client):
+    stats = client.get("/models/cache").json()
+    assert {"hits", "misses", "hit_rate", "entries", "max_entries"} <= set(stats)
+
+
+def test_saved_uploads_render_on_request(client, override_get_session, test_engine, monkeypatch, tmp_path):
+    from main.backend.services import ingest, render
+
+    with Session(test_engine) as sess:
+        create_user(sess)
+    token = create_access_token(data={"sub": "test@example.com"}, expires_delta=timedelta(hours=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    monkeypatch.setattr(ingest, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(render, "render_cache", render.RenderCache())
+
+    def fake_detect_batch(frames, artifacts=True, **kwargs):
+        assert artifacts is False
+        return [{
+            "annotated_image": None,
+            "detections": [{
+                "plate_box": [2, 2, 12, 8],
+                "plate_string": "LAZY42",
+                "plate_confidence": 0.9,
+                "plate_crop_path": None,
+                "annotated_crop_path": None,
+                "characters": [],
+            }],
+        } for _ in frames]
+
+    monkeypatch.setattr("main.backend.routes.detection.detect_batch", fake_detect_batch)
+
+    image = cv2.imencode(".png", np.full((16, 16, 3), 90, np.uint8))[1].tobytes()
+    item, = client.post("/upload", files=[("files", ("lazy_render.png", io.BytesIO(image), "image/png"))],
+                        headers=headers).json()
+    assert item["annotated_image"].startswith("/render/detections/")
+    crop_url = item["detections"][0]["plate_crop_path"]
+    assert crop_url.startswith("/render/plates/")
+
+    res = client.get(item["annotated_image"])
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "image/jpeg"
+    etag = res.headers["etag"]
+    assert client.get(item["annotated_image"], headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(item["annotated_image"],
+                      headers={"If-Modified-Since": res.headers["last-modified"]}).status_code == 304
+
+    crop = cv2.imdecode(np.frombuffer(client.get(crop_url).content, np.uint8), cv2.IMREAD_COLOR)
+    assert crop.shape == (6, 10, 3)
+    assert client.get(crop_url.replace("crop.jpg", "other.jpg")).status_code == 404
+
+    archive = client.get("/download-all", params={"filename_query": "lazy_render"})
+    with zipfile.ZipFile(io.BytesIO(archive.content)) as z:
+        names = z.namelist()
+    assert len(names) == 2
+    assert any(name.startswith("annotated_") for name in names)
+
+
+def test_detection_job_finishes_after_every_chunk(override_get_session, monkeypatch):
+    import asyncio
+    import time
+    from main.backend.routes import detection
+    from main.backend.services.ingest import StoredUpload
+    from main.backend.services.jobs import DetectionJob
+
+    def flaky_detect_batch(frames, content_hashes, **kwargs):
+        if content_hashes == ["bad"]:
+            raise RuntimeError("model failed")
+        time.sleep(0.2)
+        return [{"annotated_image": "/static/results/fake.jpg", "detections": []}]
+
+    monkeypatch.setattr(detection, "detect_batch", flaky_detect_batch)
+    monkeypatch.setattr(detection, "DETECTION_CHUNK_SIZE", 1)
+    entries = [
+        (i, f"{name}.jpg", StoredUpload(f"{name}.jpg", "", name, len(FAKE_JPEG), bytearray(FAKE_JPEG)))
+        for i, name in enumerate(["bad", "slow"])
+    ]
+
+    job = DetectionJob(len(entries))
+    finished_with = []
+    finish = job.finish
+    monkeypatch.setattr(job, "finish", lambda error=None: (finished_with.append(job.completed), finish(error)))
+    asyncio.run(detection._run_detection_job(job, entries, None))
+
+    assert job.status == "failed" and job.error == "model failed"
+    # The slow chunk's result was in before the job was marked finished
+    assert finished_with == [1]
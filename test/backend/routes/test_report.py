@@ -0,0 +1,41 @@
+from datetime import datetime
+from sqlmodel import Session, delete
+from main.backend.models import ReportSnapshot
+from main.backend.services import reports
+
+
+def test_report_serves_latest_snapshot(client, test_engine):
+    with Session(test_engine) as session:
+        session.exec(delete(ReportSnapshot))
+        reports.store_snapshot(session, "monthly", {
+            "summary": "precomputed", "trends": {"top_plates": [], "daily_counts": []},
+            "plate_frequency": [], "accuracy_trends": [],
+        })
+
+    data = client.get("/analytics/report", params={"range": "monthly"}).json()
+    assert data["summary"] == "precomputed"
+    assert data["version"] == 1
+    assert datetime.fromisoformat(data["generated_at"])
+    assert "trends" not in data
+
+    rich = client.get("/analytics/report", params={"range": "monthly", "rich": True}).json()
+    assert rich["trends"] == {"top_plates": [], "daily_counts": []}
+
+
+def test_report_refresh_builds_new_version(client, test_engine):
+    with Session(test_engine) as session:
+        session.exec(delete(ReportSnapshot))
+        session.commit()
+
+    first = client.get("/analytics/report", params={"range": "yearly", "rich": True}).json()
+    assert first["version"] == 1
+    assert set(first) >= {"summary", "overview", "periods", "trends", "plate_frequency", "accuracy_trends"}
+
+    assert client.get("/analytics/report", params={"range": "yearly"}).json()["version"] == 1
+    assert client.get("/analytics/report", params={"range": "yearly", "refresh": True}).json()["version"] == 2
+
+
+def test_report_custom_window_is_live(client):
+    data = client.get("/analytics/report", params={"range": "daily", "rich": True, "top_n": 1}).json()
+    assert "version" not in data
+    assert len(data["plate_frequency"]) <= 1
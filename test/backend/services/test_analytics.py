@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import pytest
+from sqlmodel import SQLModel, Session, create_engine
+
+from main.backend.services.analytics import accuracy_trends, plate_frequency
+from main.backend.services.save import save_detections_bulk
+
+test_engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+
+def result(timestamp, plates):
+    return {
+        "annotated_image_path": "runs/results/a.jpg",
+        "timestamp": timestamp.isoformat(),
+        "detections": [
+            {
+                "plate_crop_path": "c.jpg",
+                "annotated_crop_path": "a.jpg",
+                "plate_string": plate,
+                "plate_confidence": conf,
+                "characters": [],
+            }
+            for plate, conf in plates
+        ],
+    }
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    SQLModel.metadata.create_all(test_engine)
+    with Session(test_engine) as session:
+        save_detections_bulk(session, [
+            ("1.jpg", result(datetime(2024, 1, 1, 9), [("AAA1", 0.8), ("BBB2", 0.6)])),
+            ("2.jpg", result(datetime(2024, 1, 1, 18), [("AAA1", 1.0)])),
+            ("3.jpg", result(datetime(2024, 1, 3, 12), [("AAA1", 0.5), ("CCC3", 0.7)])),
+        ])
+    yield
+    SQLModel.metadata.drop_all(test_engine)
+
+@pytest.fixture
+def session():
+    with Session(test_engine) as s:
+        yield s
+
+def test_plate_frequency(session):
+    assert plate_frequency(session) == [
+        {"plate": "AAA1", "count": 3},
+        {"plate": "BBB2", "count": 1},
+        {"plate": "CCC3", "count": 1},
+    ]
+
+def test_plate_frequency_range_and_top_n(session):
+    assert plate_frequency(session, start=datetime(2024, 1, 2)) == [
+        {"plate": "AAA1", "count": 1},
+        {"plate": "CCC3", "count": 1},
+    ]
+    assert plate_frequency(session, end=datetime(2024, 1, 2), top_n=1) == [{"plate": "AAA1", "count": 2}]
+
+def test_accuracy_trends_group_by_day(session):
+    assert accuracy_trends(session) == [
+        {"date": "2024-01-01", "avg_confidence": 0.8},
+        {"date": "2024-01-03", "avg_confidence": 0.6},
+    ]
+    assert accuracy_trends(session, start=datetime(2024, 1, 2)) == [
+        {"date": "2024-01-03", "avg_confidence": 0.6},
+    ]
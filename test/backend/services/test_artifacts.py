@@ -0,0 +1,42 @@
+import threading
+
+import cv2
+import numpy as np
+
+from main.backend.services.artifacts import ArtifactWriter
+
+
+def test_async_writes_and_wait(tmp_path):
+    writer = ArtifactWriter(mode="async", quality=50)
+    gate = threading.Event()
+    frame = np.full((32, 32, 3), 128, np.uint8)
+
+    def render():
+        gate.wait(5)
+        return frame
+
+    slow = tmp_path / "slow.jpg"
+    writer.submit(slow, render)
+    assert writer.is_pending(slow)
+    assert not writer.wait([slow], timeout=0.05)
+
+    gate.set()
+    assert writer.wait([slow], timeout=5)
+    assert not writer.is_pending(slow)
+    assert cv2.imread(str(slow)).shape == (32, 32, 3)
+    assert writer.stats == {"written": 1, "failed": 0}
+
+
+def test_quality_is_applied(tmp_path):
+    frame = np.random.default_rng(0).integers(0, 255, (64, 64, 3), dtype=np.uint8)
+    for quality in (20, 95):
+        ArtifactWriter(mode="sync", quality=quality).submit(tmp_path / f"q{quality}.jpg", frame)
+    assert (tmp_path / "q20.jpg").stat().st_size < (tmp_path / "q95.jpg").stat().st_size
+
+
+def test_failed_writes_are_counted(tmp_path):
+    writer = ArtifactWriter(mode="async")
+    writer.submit(tmp_path / "missing_dir" / "x.jpg", np.zeros((4, 4, 3), np.uint8))
+    writer.submit(tmp_path / "y.jpg", lambda: 1 / 0)
+    assert writer.wait(timeout=5)
+    assert writer.stats["failed"] == 2
@@ -0,0 +1,107 @@
+import numpy as np
+import redis
+
+from main.backend.services.detection_cache import DetectionCache, DiskTier, image_hash
+
+
+def result(name):
+    return {"annotated_image": f"/static/results/{name}.jpg", "detections": []}
+
+
+class DictTier:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+
+class DownTier:
+    def get(self, key):
+        raise redis.ConnectionError("down")
+
+    def set(self, key, value):
+        raise redis.ConnectionError("down")
+
+
+def test_key_covers_content_model_and_thresholds():
+    key = DetectionCache.key("abc", "v1", 0.5, 0.5)
+    assert key == DetectionCache.key("abc", "v1", 0.5, 0.5)
+    assert key != DetectionCache.key("abd", "v1", 0.5, 0.5)
+    assert key != DetectionCache.key("abc", "v2", 0.5, 0.5)
+    assert key != DetectionCache.key("abc", "v1", 0.6, 0.5)
+    assert key != DetectionCache.key("abc", "v1", 0.5, 0.6)
+    assert key != DetectionCache.key("abc", "v1", 0.5, 0.5, artifacts=False)
+
+
+def test_lru_eviction_and_stats():
+    cache = DetectionCache(max_entries=2)
+    cache.set("a", result("a"))
+    cache.set("b", result("b"))
+    assert cache.get("a") == result("a")
+    cache.set("c", result("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["entries"] == 2
+    assert stats["hit_rate"] == round(2 / 3, 4)
+
+
+def test_results_are_copied():
+    cache = DetectionCache()
+    cache.set("a", result("a"))
+    cache.get("a")["annotated_image"] = "changed"
+    assert cache.get("a") == result("a")
+
+
+def test_tier_fills_memory():
+    tier = DictTier()
+    DetectionCache(tier=tier).set("a", result("a"))
+
+    fresh = DetectionCache(tier=tier)
+    assert fresh.get("a") == result("a")
+    assert fresh.get("a") == result("a")
+    stats = fresh.stats()
+    assert (stats["tier_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_tier_errors_are_misses():
+    cache = DetectionCache(tier=DownTier())
+    cache.set("a", result("a"))
+    cache.clear()
+    assert cache.get("a") is None
+    assert cache.stats()["tier_errors"] == 2
+
+
+def test_stale_results_are_dropped():
+    valid = {"a": True}
+    cache = DetectionCache(is_valid=lambda r: valid["a"])
+    cache.set("a", result("a"))
+    valid["a"] = False
+    assert cache.get("a") is None
+    assert cache.stats()["stale"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_disk_tier(tmp_path):
+    tier = DiskTier(str(tmp_path))
+    tier.set("k", result("k"))
+    assert tier.get("k") == result("k")
+    assert tier.get("missing") is None
+
+
+def test_image_hash(tmp_path):
+    frame = np.zeros((4, 4, 3), np.uint8)
+    assert image_hash(frame) == image_hash(frame.copy())
+    assert image_hash(frame) != image_hash(np.zeros((2, 8, 3), np.uint8))
+
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"abc")
+    assert image_hash(str(path)) == image_hash(b"abc")
+    assert image_hash(str(tmp_path / "missing.jpg")) is None
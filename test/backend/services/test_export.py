@@ -0,0 +1,37 @@
+import io
+import zipfile
+
+from main.backend.services.export import stream_zip, zip_entries
+
+
+def test_stream_zip_stores_entries_in_chunks(tmp_path):
+    a = tmp_path / "a.jpg"
+    b = tmp_path / "b.jpg"
+    a.write_bytes(b"x" * 2500)
+    b.write_bytes(b"y" * 10)
+
+    chunks = list(stream_zip(zip_entries([str(a), str(b)]), chunk_size=1000))
+    # Bytes come out as each file is read, not once at the end
+    assert sum(1 for c in chunks if c) > 3
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.namelist() == ["a.jpg", "b.jpg"]
+        assert all(i.compress_type == zipfile.ZIP_STORED for i in zf.infolist())
+        assert zf.read("a.jpg") == b"x" * 2500
+        assert zf.testzip() is None
+
+
+def test_zip_entries_skips_missing_and_duplicates(tmp_path):
+    a = tmp_path / "a.jpg"
+    a.write_bytes(b"1")
+    other = tmp_path / "sub"
+    other.mkdir()
+    (other / "a.jpg").write_bytes(b"2")
+
+    entries = list(zip_entries([None, str(a), str(tmp_path / "gone.jpg"), str(other / "a.jpg")]))
+    assert entries == [(str(a), "a.jpg")]
+
+
+def test_stream_zip_empty():
+    with zipfile.ZipFile(io.BytesIO(b"".join(stream_zip([])))) as zf:
+        assert zf.namelist() == []
@@ -0,0 +1,102 @@
+import asyncio
+import io
+import os
+
+import cv2
+import numpy as np
+import pytest
+from fastapi import UploadFile
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine
+
+from main.backend.services import ingest
+from main.backend.services.save import save_detection_to_db
+
+JPEG = cv2.imencode(".jpg", np.zeros((8, 8, 3), np.uint8))[1].tobytes()
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def store(data: bytes, filename="a.jpg", kind="image", content_type=None):
+    upload = UploadFile(io.BytesIO(data), filename=filename,
+                        headers={"content-type": content_type} if content_type else None)
+    return asyncio.run(ingest.store_upload(upload, kind))
+
+
+def test_store_upload_is_content_addressed(upload_dir, monkeypatch):
+    monkeypatch.setattr(ingest, "UPLOAD_CHUNK_SIZE", 100)
+
+    first = store(JPEG, "cam1.jpg")
+    assert os.path.basename(first.path) == first.content_hash + ".jpg"
+    assert bytes(first.data) == JPEG
+    assert first.size == len(JPEG)
+    assert not first.duplicate
+
+    again = store(JPEG, "cam1-retry.jpg")
+    assert again.duplicate
+    assert again.path == first.path
+    assert sorted(os.listdir(upload_dir)) == [os.path.basename(first.path)]
+
+
+def test_store_upload_rejects_bad_uploads(upload_dir, monkeypatch):
+    with pytest.raises(ingest.UploadRejected) as e:
+        store(b"not an image")
+    assert e.value.status_code == 415
+
+    with pytest.raises(ingest.UploadRejected) as e:
+        store(b"")
+    assert e.value.status_code == 400
+
+    monkeypatch.setattr(ingest, "UPLOAD_MAX_BYTES", len(JPEG) - 1)
+    monkeypatch.setattr(ingest, "UPLOAD_CHUNK_SIZE", 64)
+    with pytest.raises(ingest.UploadRejected) as e:
+        store(JPEG)
+    assert e.value.status_code == 413
+
+    # Partial files are removed
+    assert os.listdir(upload_dir) == []
+
+
+def test_store_upload_video(upload_dir):
+    video = store(b"\x00" * 32, "clip.avi", kind="video", content_type="video/x-msvideo")
+    assert video.path.endswith(".avi")
+    assert video.data is None
+
+    with pytest.raises(ingest.UploadRejected):
+        store(b"\x00" * 32, "notes.txt", kind="video", content_type="text/plain")
+
+
+def test_sniff_image():
+    assert ingest.sniff_image(JPEG) == ".jpg"
+    assert ingest.sniff_image(cv2.imencode(".png", np.zeros((2, 2), np.uint8))[1].tobytes()) == ".png"
+    assert ingest.sniff_image(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == ".webp"
+    assert ingest.sniff_image(b"GIF89a") is None
+
+
+def test_previous_result_matches_hash_and_model():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        save_detection_to_db(session, "a.jpg", {
+            "annotated_image_path": "/static/results/annotated_x.jpg",
+            "content_hash": "abc",
+            "detections": [{
+                "plate_crop_path": "c.jpg",
+                "annotated_crop_path": "a.jpg",
+                "plate_string": "AB1",
+                "plate_confidence": 0.8,
+                "characters": [{"box": [1, 2, 3, 4], "class_id": 10, "confidence": 0.9}],
+            }],
+        }, model_version="v1")
+
+        result = ingest.previous_result(session, "abc", "v1")
+        assert result["annotated_image"] == "/static/results/annotated_x.jpg"
+        assert result["detections"][0]["plate_string"] == "AB1"
+        assert result["detections"][0]["characters"] == [{"box": [1, 2, 3, 4], "class_id": 10, "confidence": 0.9}]
+
+        assert ingest.previous_result(session, "abc", "v2") is None
+        assert ingest.previous_result(session, "other", "v1") is None
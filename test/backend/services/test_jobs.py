@@ -0,0 +1,29 @@
+from main.backend.services.jobs import DetectionJob, chunked
+
+
+def test_chunked():
+    assert chunked([1, 2, 3, 4, 5], 2) == [[1, 2], [3, 4], [5]]
+    assert chunked([1, 2], 0) == [[1], [2]]
+
+
+def test_job_keeps_only_newest_results():
+    job = DetectionJob(total=None, max_results=3)
+    for i in range(5):
+        job.add_result({"index": i})
+
+    assert [r["index"] for r in job.results] == [2, 3, 4]
+    assert job.dropped == 2
+    data = job.to_dict()
+    assert data["completed"] == 5
+    assert data["dropped"] == 2
+
+
+def test_job_without_limit_keeps_everything():
+    job = DetectionJob(total=2)
+    job.add_result({"index": 1})
+    job.add_result({"index": 0})
+    job.finish()
+
+    data = job.to_dict()
+    assert [r["index"] for r in data["results"]] == [0, 1]
+    assert data["status"] == "done" and data["dropped"] == 0
@@ -0,0 +1,145 @@
+import pytest
+import redis
+
+from main.backend.services import llm
+from main.backend.services.llm_cache import LLMCache
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for the cache and the stream list."""
+
+    def __init__(self):
+        self.data = {}
+        self.zsets = {}
+
+    def get(self, key):
+        value = self.data.get(key)
+        return value.encode() if isinstance(value, str) else value
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def expire(self, key, ttl):
+        pass
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(values)
+
+    def xadd(self, key, fields):
+        entries = self.data.setdefault(key, [])
+        entries.append((f"{len(entries) + 1}-0", fields))
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zremrangebyscore(self, key, low, high):
+        zset = self.zsets.get(key, {})
+        for member in [m for m, score in zset.items() if low <= score <= high]:
+            del zset[member]
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def zpopmin(self, key, count):
+        zset = self.zsets.get(key, {})
+        popped = sorted(zset.items(), key=lambda kv: kv[1])[:count]
+        for member, _ in popped:
+            del zset[member]
+        return [(member.encode(), score) for member, score in popped]
+
+
+class DownRedis:
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise redis.ConnectionError("down")
+        return fail
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(llm, "r", client)
+    monkeypatch.setattr(llm, "llm_cache", LLMCache(client))
+    return client
+
+
+def test_cache_evicts_least_recently_used():
+    cache = LLMCache(FakeRedis(), max_entries=2)
+    cache.set("a", ["A"])
+    cache.set("b", ["B"])
+    assert cache.get("a") == ["A"]
+    cache.set("c", ["C"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == ["A"]
+    assert cache.get("c") == ["C"]
+
+
+def test_cache_treats_redis_errors_as_misses():
+    cache = LLMCache(DownRedis())
+    cache.set("a", ["A"])
+    assert cache.get("a") is None
+
+
+def test_replay_uses_stream_format():
+    client = FakeRedis()
+    LLMCache(client).replay("t1", ["Hel", "lo"])
+    assert client.data["llm_stream:t1"] == ["Hel", "lo", "[[END]]"]
+    assert client.data["llm_result:t1"] == "Hello"
+    assert [fields for _, fields in client.data["llm_events:t1"]] == [
+        {"chunk": "Hel"}, {"chunk": "lo"}, {"end": "1"},
+    ]
+
+
+def test_cache_key_normalizes_question_and_tracks_data(save_plates):
+    key = llm.cache_key("Weekly summary?")
+    assert llm.cache_key("  weekly   SUMMARY ") == key
+    assert llm.cache_key("Monthly summary") != key
+
+    save_plates("cache.jpg")
+    assert llm.cache_key("weekly summary") != key
+
+
+def test_cache_key_hashes_developer_metadata():
+    assert llm.cache_key("why?", {"filename": "a.jpg"}) == llm.cache_key("Why", {"filename": "a.jpg"})
+    assert llm.cache_key("why?", {"filename": "a.jpg"}) != llm.cache_key("why?", {"filename": "b.jpg"})
+
+
+def test_answers_are_cached_and_replayed(save_plates, fake_redis, monkeypatch):
+    calls = []
+    def fake_chat(model, messages, stream):
+        calls.append(messages)
+        return iter([{"message": {"content": "All "}}, {"message": {"content": "quiet."}}])
+    monkeypatch.setattr(llm.client, "chat", fake_chat)
+
+    assert llm.replay_cached_answer("weekly summary") is None
+    result = llm.run_llm_task.apply(args=["weekly summary"], task_id="live1").get()
+    assert result == "All quiet."
+    assert fake_redis.data["llm_stream:live1"] == ["All ", "quiet.", "[[END]]"]
+
+    task_id = llm.replay_cached_answer("Weekly summary?")
+    assert task_id.startswith("cached-")
+    assert fake_redis.data[f"llm_stream:{task_id}"] == ["All ", "quiet.", "[[END]]"]
+    assert len(calls) == 1
+
+    # New data, new answer
+    save_plates("cache.jpg")
+    assert llm.replay_cached_answer("weekly summary") is None
+
+
+def test_failed_generation_ends_the_stream(fresh_engine, fake_redis, monkeypatch):
+    def broken_chat(model, messages, stream):
+        yield {"message": {"content": "Par"}}
+        raise RuntimeError("ollama went away")
+    monkeypatch.setattr(llm.client, "chat", broken_chat)
+
+    with pytest.raises(RuntimeError):
+        llm.run_llm_task.apply(args=["weekly summary"], task_id="dead1").get()
+
+    assert fake_redis.data["llm_stream:dead1"] == ["Par", "[[END]]"]
+    assert fake_redis.data["llm_events:dead1"][-1][1] == {"error": "ollama went away"}
+    assert llm.replay_cached_answer("weekly summary") is None
@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from ollama import Client
+
+from main.backend.services.llm_pool import (
+    LLMExecutor, PrioritySemaphore, PRIORITY_INTERACTIVE, PRIORITY_SCHEDULED, parse_mapping,
+)
+
+
+class FakeOllama:
+    """Local /api/chat that streams the prompt back word by word."""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake.lock:
+                    fake.requests.append(body)
+                    fake.active += 1
+                    fake.max_active = max(fake.max_active, fake.active)
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.end_headers()
+                    words = body["messages"][-1]["content"].split()
+                    for word in words:
+                        time.sleep(fake.delay)
+                        self._line({"model": body["model"], "done": False,
+                                    "message": {"role": "assistant", "content": word + " "}})
+                    self._line({"model": body["model"], "done": True,
+                                "message": {"role": "assistant", "content": ""}})
+                finally:
+                    with fake.lock:
+                        fake.active -= 1
+
+            def _line(self, data):
+                self.wfile.write((json.dumps(data) + "\n").encode())
+                self.wfile.flush()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def ollama():
+    server = FakeOllama()
+    yield server
+    server.close()
+
+
+def run_all(calls):
+    results = [None] * len(calls)
+    def run(i, call):
+        results[i] = call()
+    threads = [threading.Thread(target=run, args=(i, c)) for i, c in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results
+
+
+def test_parse_mapping():
+    assert parse_mapping("summary=llama3:8b, developer = codellama") == {
+        "summary": "llama3:8b", "developer": "codellama",
+    }
+    assert parse_mapping("") == {}
+
+
+def test_generate_streams_chunks(ollama):
+    executor = LLMExecutor(Client(host=ollama.url), default_model="fake")
+    seen = []
+    assert executor.generate("fake", "one two three", on_chunk=seen.append) == "one two three "
+    assert seen == ["one ", "two ", "three ", ""]
+    assert ollama.requests[0]["model"] == "fake"
+
+
+def test_identical_prompts_are_coalesced(ollama):
+    executor = LLMExecutor(Client(host=ollama.url), default_model="fake")
+    streams = [[] for _ in range(4)]
+    results = run_all([
+        (lambda s=s: executor.generate("fake", "a b c d e f", on_chunk=s.append))
+        for s in streams
+    ])
+
+    assert results == ["a b c d e f "] * 4
+    assert all("".join(s) == "a b c d e f " for s in streams)
+    assert len(ollama.requests) == 1
+    assert executor.stats == {"generations": 1, "coalesced": 3}
+
+    # once finished, the same prompt runs again
+    executor.generate("fake", "a b c d e f")
+    assert len(ollama.requests) == 2
+
+
+def test_concurrency_is_bounded_per_model(ollama):
+    executor = LLMExecutor(Client(host=ollama.url), concurrency=2, model_concurrency={"slow": 1})
+    run_all([(lambda i=i: executor.generate("fake", f"p{i} x y z")) for i in range(5)])
+    assert ollama.max_active <= 2
+    assert len(ollama.requests) == 5
+
+    ollama.max_active = 0
+    run_all([(lambda i=i: executor.generate("slow", f"q{i} x y")) for i in range(3)])
+    assert ollama.max_active == 1
+
+
+def test_model_selection():
+    executor = LLMExecutor(None, default_model="gemma:2b", models={"summary": "llama3:8b"})
+    assert executor.model_for("summary") == "llama3:8b"
+    assert executor.model_for("analytics") == "gemma:2b"
+
+
+def test_errors_reach_every_follower():
+    started = threading.Event()
+    release = threading.Event()
+
+    class BrokenClient:
+        def chat(self, model, messages, stream):
+            started.set()
+            release.wait(5)
+            yield {"message": {"content": "par"}}
+            raise ConnectionError("ollama went away")
+
+    executor = LLMExecutor(BrokenClient())
+    errors = []
+    def call():
+        try:
+            executor.generate("m", "p")
+        except ConnectionError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    threads[0].start()
+    started.wait(5)
+    threads[1].start()
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(errors) == 2
+
+
+def test_priority_semaphore_serves_interactive_first():
+    sem = PrioritySemaphore(1)
+    sem.acquire()
+    order = []
+
+    def waiter(name, priority):
+        with sem.slot(priority):
+            order.append(name)
+
+    threads = []
+    for name, priority in [("report1", PRIORITY_SCHEDULED), ("report2", PRIORITY_SCHEDULED),
+                           ("question", PRIORITY_INTERACTIVE)]:
+        t = threading.Thread(target=waiter, args=(name, priority))
+        t.start()
+        threads.append(t)
+        time.sleep(0.02)
+
+    sem.release()
+    for t in threads:
+        t.join(5)
+    assert order == ["question", "report1", "report2"]
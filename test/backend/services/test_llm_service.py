@@ -1,13 +1,9 @@
-import pytest
-from unittest.mock import patch, MagicMock
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlmodel import Session, select
 from main.backend.services import llm
-from main.backend.models import DetectionRecord, PlateInfo
-
-def mock_exec_results(items):
-    m = MagicMock()
-    m.all.return_value = items
-    return m
+from main.backend.services.prompt import estimate_tokens
+from main.backend.models import DetectionRecord
 
 
 def test_build_prompt_with_metadata():
@@ -32,70 +28,142 @@ def test_build_prompt_no_metadata():
     assert "Hello?" in prompt
 
 
-@patch("main.backend.services.llm.Session")
-def test_generate_context_from_db(mock_session_class):
+def test_generate_daily_summary(save_plates):
+    save_plates("daily.jpg", [("DAILY123", 0.91)])
+
+    summary = llm.generate_daily_summary()
+    assert "daily.jpg" in summary
+    assert "DAILY123" in summary
+    assert "Total: 1 detections, 1 plates, average confidence 0.91" in summary
+
+
+def test_generate_summaries_read_rollups(save_plates):
     now = datetime.utcnow()
-    record = DetectionRecord(id=1, filename="test.jpg", timestamp=now)
-    plate = PlateInfo(detection_id=1, plate_string="ABC123", plate_confidence=0.95)
+    save_plates("recent.jpg", [("AAA111", 0.8), ("BBB222", 0.6)], now - timedelta(days=3))
+    save_plates("old.jpg", [("AAA111", 0.9)], now - timedelta(days=100))
+
+    weekly = llm.generate_weekly_summary()
+    assert "Total: 1 detections, 2 plates, average confidence 0.70" in weekly
+    assert "AAA111 (1)" in weekly
+
+    yearly = llm.generate_yearly_summary()
+    assert "Total: 2 detections, 3 plates" in yearly
+    assert "AAA111 (2)" in yearly
 
-    # Mock for session.exec().all()
-    mock_results = MagicMock()
-    mock_results.all.return_value = [record]
+    assert llm.generate_daily_summary().startswith("No detections for this period.")
 
-    mock_plates = MagicMock()
-    mock_plates.all.return_value = [plate]
 
-    mock_session = MagicMock()
-    mock_session.exec.side_effect = [mock_results, mock_plates]
-    mock_session_class.return_value.__enter__.return_value = mock_session
+def test_generate_trend_summary(save_plates):
+    now = datetime.utcnow()
+    save_plates("trend.jpg", [("ABC123", 0.9), ("ABC123", 0.92), ("XYZ789", 0.85)], now)
+    save_plates("older.jpg", [("XYZ789", 0.85)], now - timedelta(days=2))
+
+    summary = llm.generate_trend_summary("weekly")
+    assert summary["top_plates"][0] == {"plate": "ABC123", "count": 2}
+    assert [d["count"] for d in summary["daily_counts"]] == [1, 3]
+    assert all("date" in d and "count" in d for d in summary["daily_counts"])
+
+
+def test_generate_context_from_db(save_plates):
+    save_plates("test.jpg", [("ABC123", 0.95)])
 
     result = llm.generate_context_from_db("test question")
     assert "test.jpg" in result
-    assert "ABC123" in result
+    assert "ABC123 (0.95)" in result
 
 
+def test_detection_logs_do_not_query_per_record(fresh_engine, save_plates):
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
 
+    def run_builders():
+        statements.clear()
+        event.listen(fresh_engine, "before_cursor_execute", count)
+        try:
+            context = llm.generate_context_from_db("q")
+            with Session(fresh_engine) as session:
+                log = llm._summarize_records(session, select(DetectionRecord))
+        finally:
+            event.remove(fresh_engine, "before_cursor_execute", count)
+        return context, log, len(statements)
 
-@patch("main.backend.services.llm.Session")
-def test_generate_daily_summary(mock_session_class):
-    now = datetime.utcnow()
-    record = DetectionRecord(id=1, filename="daily.jpg", timestamp=now)
-    plate = PlateInfo(detection_id=1, plate_string="DAILY123", plate_confidence=0.91)
+    def save_records(n, offset):
+        for i in range(offset, offset + n):
+            save_plates(f"n{i}.jpg", [(f"N{i}", 0.9), ("SAME", 0.8)])
 
-    mock_results = MagicMock()
-    mock_results.all.return_value = [record]
+    save_records(2, 0)
+    _, _, few = run_builders()
+    save_records(20, 2)
+    context, log, many = run_builders()
 
-    mock_plates = MagicMock()
-    mock_plates.all.return_value = [plate]
+    assert "N21 (0.90)" in context
+    assert log.count("SAME") == 22
+    assert many == few
 
-    mock_session = MagicMock()
-    mock_session.exec.side_effect = [mock_results, mock_plates]
-    mock_session_class.return_value.__enter__.return_value = mock_session
 
-    summary = llm.generate_daily_summary()
-    assert "daily.jpg" in summary
-    assert "DAILY123" in summary
+def test_contexts_fit_the_token_budget(save_plates):
+    now = datetime.utcnow()
+    for day in range(60):
+        save_plates(f"d{day}.jpg", [(f"P{day:03d}", 0.9)], now - timedelta(days=day, minutes=1))
+    for i in range(200):
+        save_plates(f"today{i}.jpg", [("TODAY1", 0.7)], now)
 
+    yearly = llm.build_summary_context("yearly", budget=150)
+    assert estimate_tokens(yearly) <= 150
+    assert "Total: 260 detections" in yearly
+    assert "merged into" in yearly
 
-@patch("main.backend.services.llm.Session")
-def test_generate_trend_summary(mock_session_class):
-    now = datetime.utcnow()
-    record = DetectionRecord(id=1, filename="trend.jpg", timestamp=now)
-    plates = [
-        PlateInfo(detection_id=1, plate_string="ABC123", plate_confidence=0.9),
-        PlateInfo(detection_id=1, plate_string="ABC123", plate_confidence=0.92),
-        PlateInfo(detection_id=1, plate_string="XYZ789", plate_confidence=0.85),
-    ]
-
-    mock_session = MagicMock()
-    mock_session.exec.side_effect = [
-        mock_exec_results([record]),
-        mock_exec_results(plates),
-    ]
-    mock_session_class.return_value.__enter__.return_value = mock_session
+    daily = llm.build_summary_context("daily", budget=400)
+    assert estimate_tokens(daily) <= 400
+    assert "of 201 lines shown" in daily or "of 200 lines shown" in daily
 
-    summary = llm.generate_trend_summary("weekly")
-    assert summary["top_plates"][0]["plate"] == "ABC123"
-    assert summary["top_plates"][0]["count"] == 2
-    assert any("date" in d and "count" in d for d in summary["daily_counts"])
+    context = llm.generate_context_from_db("q", budget=400)
+    assert estimate_tokens(context) <= 400
+    assert "Detections log:" in context
+    assert "lines shown, evenly sampled" in context
 
+
+def test_context_follows_scope(save_plates):
+    now = datetime.utcnow()
+    save_plates("gate.jpg", [("SCOPE1", 0.9)], now - timedelta(days=30))
+    save_plates("lane.jpg", [("OTHER2", 0.5)], now - timedelta(days=1))
+
+    # default scope is the last week
+    context = llm.generate_context_from_db("q")
+    assert "lane.jpg" in context and "gate.jpg" not in context
+
+    scope = llm.make_scope(start=now - timedelta(days=60), plate_query="scope1")
+    context = llm.generate_context_from_db("q", scope=scope)
+    assert "gate.jpg" in context and "lane.jpg" not in context
+    assert "Total: 1 detections, 1 plates, average confidence 0.90" in context
+    assert "SCOPE1 (1)" in context
+
+    context = llm.generate_context_from_db("q", scope=llm.make_scope(start=now - timedelta(days=60)))
+    assert "Total: 2 detections" in context
+
+    assert llm.cache_key("q", scope=scope) != llm.cache_key("q")
+
+
+def test_sample_is_picked_in_sql(fresh_engine, save_plates):
+    start = datetime(2024, 1, 1)
+    for i in range(10):
+        save_plates(f"s{i}.jpg", [(f"S{i}", 0.9)], start + timedelta(minutes=i))
+
+    loaded = []
+    def count(target, context):
+        loaded.append(target)
+
+    event.listen(DetectionRecord, "load", count)
+    try:
+        with Session(fresh_engine) as session:
+            lines, total = llm._sample_records(
+                session, select(DetectionRecord), (DetectionRecord.timestamp, DetectionRecord.id),
+                3, lambda record: record.filename,
+            )
+    finally:
+        event.remove(DetectionRecord, "load", count)
+    assert total == 10
+    assert lines == ["s0.jpg", "s4.jpg", "s8.jpg"]
+    # Only the sampled rows are loaded
+    assert len(loaded) == 3
@@ -0,0 +1,84 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from main.backend.main import app
+from main.backend.routes import llm as llm_routes
+from main.backend.services.llm_stream import events_key, sse_event, sse_events
+
+
+class FakeAsyncRedis:
+    """XREAD over an in-memory stream; blocks by sleeping when nothing is new."""
+
+    def __init__(self, entries=None):
+        self.entries = {}
+        for task_id, fields_list in (entries or {}).items():
+            self.entries[events_key(task_id)] = [
+                (f"{i}-0", fields) for i, fields in enumerate(fields_list, 1)
+            ]
+
+    async def xread(self, streams, block=None, count=None):
+        (key, last_id), = streams.items()
+        last = tuple(int(p) for p in last_id.split("-"))
+        new = [
+            (entry_id, fields) for entry_id, fields in self.entries.get(key, [])
+            if tuple(int(p) for p in entry_id.split("-")) > last
+        ][:count]
+        if not new:
+            await asyncio.sleep(block / 1000)
+            return []
+        return [[key, new]]
+
+
+def collect(client, task_id, **kwargs):
+    async def run():
+        return [event async for event in sse_events(client, task_id, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_sse_event_framing():
+    assert sse_event("hi", event="chunk", event_id="1-0") == "id: 1-0\nevent: chunk\ndata: hi\n\n"
+    assert sse_event("a\nb") == "data: a\ndata: b\n\n"
+
+
+def test_streams_chunks_until_end():
+    client = FakeAsyncRedis({"t": [{"chunk": "Hel"}, {"chunk": "lo\nthere"}, {"end": "1"}]})
+    assert collect(client, "t") == [
+        "id: 1-0\nevent: chunk\ndata: Hel\n\n",
+        "id: 2-0\nevent: chunk\ndata: lo\ndata: there\n\n",
+        "id: 3-0\nevent: end\ndata: \n\n",
+    ]
+
+
+def test_resumes_after_last_id():
+    client = FakeAsyncRedis({"t": [{"chunk": "a"}, {"chunk": "b"}, {"end": "1"}]})
+    events = collect(client, "t", last_id="1-0")
+    assert events[0] == "id: 2-0\nevent: chunk\ndata: b\n\n"
+    assert len(events) == 2
+
+
+def test_producer_error_ends_stream():
+    client = FakeAsyncRedis({"t": [{"chunk": "a"}, {"error": "model crashed"}]})
+    assert collect(client, "t")[-1] == "id: 2-0\nevent: error\ndata: model crashed\n\n"
+
+
+def test_heartbeats_then_timeout():
+    events = collect(FakeAsyncRedis(), "t", heartbeat=0.01, idle_timeout=0.03)
+    assert events == [": keep-alive\n\n", ": keep-alive\n\n", "event: timeout\ndata: no output\n\n"]
+
+
+def test_dead_task_ends_stream():
+    async def is_dead():
+        return True
+    events = collect(FakeAsyncRedis(), "t", heartbeat=0.01, is_dead=is_dead)
+    assert events == ["event: error\ndata: task failed\n\n"]
+
+
+def test_stream_endpoint(monkeypatch):
+    client = FakeAsyncRedis({"t1": [{"chunk": "a"}, {"chunk": "b"}, {"end": "1"}]})
+    monkeypatch.setattr(llm_routes, "aredis", client)
+
+    res = TestClient(app).get("/llm/stream/t1", headers={"Last-Event-ID": "1-0"})
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/event-stream")
+    assert res.text == "id: 2-0\nevent: chunk\ndata: b\n\nid: 3-0\nevent: end\ndata: \n\n"
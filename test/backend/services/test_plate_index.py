@@ -0,0 +1,87 @@
+import pytest
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from main.backend.models import PlateTrigram
+from main.backend.services.plate_index import (
+    edit_distance, fuzzy_distance_bound, normalize_plate, plate_trigrams, search_plates,
+)
+from main.backend.services.save import save_detections_bulk
+
+test_engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+
+PLATES = ["SGX1234A", "SGB8800Z", "ABC123", "XYZ999", "UNKNOWN", "KM7", "HJKMNPR"]
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    SQLModel.metadata.create_all(test_engine)
+    with Session(test_engine) as session:
+        save_detections_bulk(session, [
+            (f"{plate}.jpg", {
+                "annotated_image_path": f"runs/results/{plate}.jpg",
+                "detections": [{
+                    "plate_crop_path": "c.jpg",
+                    "annotated_crop_path": "a.jpg",
+                    "plate_string": plate,
+                    "plate_confidence": 0.9,
+                    "characters": [],
+                }],
+            })
+            for plate in PLATES
+        ])
+    yield
+    SQLModel.metadata.drop_all(test_engine)
+
+@pytest.fixture
+def session():
+    with Session(test_engine) as s:
+        yield s
+
+def strings(plates):
+    return sorted(p.plate_string for p in plates)
+
+def test_normalize_folds_case_punctuation_and_confusables():
+    assert normalize_plate("sgx-1234 a") == "56X1234A"
+    assert normalize_plate("0O8B") == normalize_plate("O0B8") == "0088"
+
+def test_plate_trigrams_are_anchored():
+    assert plate_trigrams("AB1") == {"^AB", "AB1", "B1$"}
+
+def test_edit_distance():
+    assert edit_distance("ABC123", "ABC123") == 0
+    assert edit_distance("ABC123", "ABC12") == 1
+    assert edit_distance("ABC123", "A8C124") == 2
+
+def test_index_is_written_on_save(session):
+    grams = session.exec(select(PlateTrigram.trigram).where(PlateTrigram.plate_id == 3)).all()
+    assert set(grams) == plate_trigrams("A8C123")
+
+def test_substring_search(session):
+    assert strings(search_plates(session, "1234")) == ["SGX1234A"]
+    assert strings(search_plates(session, "x12")) == ["SGX1234A"]
+
+def test_substring_search_matches_confusables(session):
+    assert strings(search_plates(session, "SGB88OO")) == ["SGB8800Z"]
+    assert strings(search_plates(session, "A8C")) == ["ABC123"]
+
+def test_short_query_falls_back_to_scan(session):
+    assert strings(search_plates(session, "99")) == ["XYZ999"]
+
+def test_prefix_search(session):
+    assert strings(search_plates(session, "SG", mode="prefix")) == ["SGB8800Z", "SGX1234A"]
+    assert search_plates(session, "123", mode="prefix") == []
+
+def test_fuzzy_search(session):
+    assert strings(search_plates(session, "ABC124", mode="fuzzy")) == ["ABC123"]
+    assert strings(search_plates(session, "XYZ99", mode="fuzzy")) == ["XYZ999"]
+    assert search_plates(session, "ABD456", mode="fuzzy") == []
+    assert strings(search_plates(session, "SGX12Y4B", mode="fuzzy", max_distance=2)) == ["SGX1234A"]
+
+def test_fuzzy_distance_is_capped_to_the_index_bound(session):
+    # Past the cap a match could share no trigram with the query, so the
+    # index couldn't narrow the candidates
+    assert fuzzy_distance_bound("KM7", 1) == 0
+    assert fuzzy_distance_bound("ABC123", 3) == 1
+    assert fuzzy_distance_bound("HJKMNPR", 3) == 2
+    assert search_plates(session, "KX7", mode="fuzzy") == []
+    assert search_plates(session, "ABD124", mode="fuzzy", max_distance=2) == []
+    assert strings(search_plates(session, "HXKMNXR", mode="fuzzy", max_distance=3)) == ["HJKMNPR"]
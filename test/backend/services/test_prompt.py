@@ -0,0 +1,48 @@
+from main.backend.services.prompt import (
+    ContextBuilder, estimate_tokens, lines_tokens, sample_evenly,
+)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_sample_evenly_spans_the_input():
+    items = list(range(100))
+    assert sample_evenly(items, 4) == [0, 25, 50, 75]
+    assert sample_evenly(items, 200) == items
+    assert sample_evenly(items, 0) == []
+
+
+def test_builder_keeps_sections_that_fit():
+    builder = ContextBuilder(budget=100)
+    assert builder.add("Overview", ["Total: 3 detections"]) == 1
+    assert builder.truncated == []
+    assert builder.render() == "Overview:\nTotal: 3 detections"
+
+
+def test_builder_samples_sections_over_budget():
+    builder = ContextBuilder(budget=200)
+    builder.add("Overview", ["Total: 1000 detections"])
+    lines = [f"2024-01-01 line {i:04d}" for i in range(1000)]
+    kept = builder.add("Detections", lines)
+
+    assert 0 < kept < 1000
+    assert builder.used <= builder.budget
+    assert builder.truncated == [{"section": "Detections", "kept": kept, "total": 1000}]
+    text = builder.render()
+    assert "line 0000" in text
+    assert f"Detections: {kept} of 1000 lines shown" in text
+    assert estimate_tokens(text) <= builder.budget
+
+
+def test_builder_reports_presampled_totals_and_notes():
+    builder = ContextBuilder(budget=500)
+    builder.add("Per day", ["a", "b"], note="merged into 7-day buckets")
+    builder.add("Detections", ["x"], total=50)
+    text = builder.render()
+    assert "Per day: merged into 7-day buckets" in text
+    assert "Detections: 1 of 50 lines shown" in text
+    assert lines_tokens(["x"]) == 2
@@ -0,0 +1,68 @@
+import sys
+import threading
+from unittest.mock import patch, MagicMock
+from main.backend.services.registry import ModelRegistry, LazyModel
+
+SPECS = {
+    "plate": ("/weights/plate.pt", "plate-test"),
+    "char": ("/weights/char.pt", "char-test"),
+}
+
+
+def test_registry_loads_lazily_and_caches():
+    fake_yolo = MagicMock()
+    registry = ModelRegistry(SPECS)
+
+    with patch.dict(sys.modules, {"ultralytics": MagicMock(YOLO=fake_yolo)}):
+        assert not registry.health()["plate"]["loaded"]
+        first = registry.get("plate")
+        second = registry.get("plate")
+
+    assert first is second
+    fake_yolo.assert_called_once_with("/weights/plate.pt")
+    assert registry.health()["plate"]["loaded"]
+    assert not registry.health()["char"]["loaded"]
+
+
+def test_registry_warm_up_and_unload():
+    fake_yolo = MagicMock()
+    registry = ModelRegistry(SPECS)
+
+    with patch.dict(sys.modules, {"ultralytics": MagicMock(YOLO=fake_yolo)}):
+        registry.warm_up()
+    assert fake_yolo.call_count == 2
+    assert all(h["loaded"] for h in registry.health().values())
+
+    registry.unload()
+    assert not any(h["loaded"] for h in registry.health().values())
+
+
+def test_registry_model_version():
+    registry = ModelRegistry(SPECS)
+    assert registry.version("char") == "char-test"
+    assert registry.model_version() == "plate-test+char-test"
+
+
+def test_lazy_model_forwards_calls():
+    registry = MagicMock()
+    model = LazyModel(registry, "plate")
+
+    model("img.jpg", conf=0.5)
+
+    registry.get.assert_called_with("plate")
+    registry.get.return_value.assert_called_once_with("img.jpg", conf=0.5)
+
+
+def test_registry_uses_one_instance_per_thread():
+    fake_yolo = MagicMock(side_effect=lambda path: object())
+    registry = ModelRegistry(SPECS)
+    seen = []
+
+    with patch.dict(sys.modules, {"ultralytics": MagicMock(YOLO=fake_yolo)}):
+        seen.append(registry.get("char"))
+        worker = threading.Thread(target=lambda: seen.append(registry.get("char")))
+        worker.start()
+        worker.join()
+
+    assert seen[0] is not seen[1]
+    assert registry.health()["char"]["instances"] == 2
@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+import pytest
+from sqlmodel import Session, select
+
+from main.backend.models import DetectionRecord, PlateInfo
+from main.backend.services import ingest, render
+from main.backend.services.save import save_detections_bulk
+
+
+@pytest.fixture
+def stored(fresh_engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(render, "render_cache", render.RenderCache())
+    engine = fresh_engine
+
+    image = np.zeros((120, 200, 3), np.uint8)
+    image[20:60, 40:140] = 255
+    cv2.imwrite(str(tmp_path / "abc.png"), image)
+
+    with Session(engine) as session:
+        record_id, = save_detections_bulk(session, [("cam.png", {
+            "annotated_image_path": None,
+            "content_hash": "abc",
+            "detections": [{
+                "plate_box": [40, 20, 140, 60],
+                "plate_crop_path": None,
+                "annotated_crop_path": None,
+                "plate_string": "AB1",
+                "plate_confidence": 0.9,
+                "characters": [{"box": [10, 10, 60, 90], "class_id": 10, "confidence": 0.9}],
+            }],
+        })])
+        plate_id = session.exec(select(PlateInfo.id)).one()
+    return engine, record_id, plate_id
+
+
+def decode(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def test_renders_from_original_and_boxes(stored):
+    engine, record_id, plate_id = stored
+    with Session(engine) as session:
+        annotated = decode(render.detection_render(session, record_id).encode())
+        crop = decode(render.plate_render(session, plate_id, "crop").encode())
+        annotated_crop = decode(render.plate_render(session, plate_id, "annotated").encode())
+
+    assert annotated.shape == (120, 200, 3)
+    # The plate box is drawn just outside the white region
+    assert annotated[20, 90].tolist() != [255, 255, 255]
+    assert crop.shape == (40, 100, 3)
+    assert annotated_crop.shape == (640, 640, 3)
+
+
+def test_etag_follows_stored_boxes_and_cache(stored):
+    engine, record_id, plate_id = stored
+    with Session(engine) as session:
+        first = render.detection_render(session, record_id)
+        first.encode()
+        first.encode()
+        assert render.render_cache.stats == {"hits": 1, "misses": 1}
+
+        plate = session.get(PlateInfo, plate_id)
+        plate.plate_string = "AB2"
+        session.commit()
+        assert render.detection_render(session, record_id).etag != first.etag
+        assert render.plate_render(session, plate_id, "crop").etag == render.plate_render(session, plate_id, "crop").etag
+
+
+def test_renders_from_loaded_rows(stored):
+    engine, record_id, plate_id = stored
+    with Session(engine) as session:
+        record = session.get(DetectionRecord, record_id)
+        plate = session.get(PlateInfo, plate_id)
+        expected = (render.detection_render(session, record_id).etag,
+                    render.plate_render(session, plate_id, "crop").etag)
+
+    # No session needed once the rows are loaded
+    assert render.record_render(record, [plate]).etag == expected[0]
+    crop = render.crop_render(record, plate)
+    assert crop.etag == expected[1]
+    assert decode(crop.encode()).shape == (40, 100, 3)
+
+
+def test_missing_original_or_record(stored, tmp_path):
+    engine, record_id, plate_id = stored
+    (tmp_path / "abc.png").unlink()
+    with Session(engine) as session:
+        with pytest.raises(LookupError):
+            render.detection_render(session, record_id)
+        with pytest.raises(LookupError):
+            render.plate_render(session, 999, "crop")
+
+
+def test_render_cache_is_bounded_by_bytes():
+    cache = render.RenderCache(max_bytes=10)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache.get("a")
+    cache.set("c", b"123")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.size <= 10
+    cache.set("huge", b"x" * 11)
+    assert cache.get("huge") is None
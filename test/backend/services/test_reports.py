@@ -0,0 +1,67 @@
+from datetime import datetime
+from sqlmodel import Session, select
+from main.backend.models import ReportSnapshot
+from main.backend.services import reports
+
+
+def test_refresh_snapshot_stores_report(fresh_engine, save_plates):
+    save_plates("snap.jpg", [("SNAP1", 0.9)])
+
+    with Session(fresh_engine) as session:
+        snapshot = reports.refresh_snapshot(session, "daily")
+
+    assert snapshot.version == 1
+    assert "SNAP1" in snapshot.data["summary"]
+    assert snapshot.data["plate_frequency"] == [{"plate": "SNAP1", "count": 1}]
+    assert snapshot.data["trends"]["top_plates"] == [{"plate": "SNAP1", "count": 1}]
+    assert snapshot.data["overview"] == {
+        "detections": 1, "plates": 1, "avg_confidence": 0.9,
+        "top_plates": [{"plate": "SNAP1", "count": 1}],
+    }
+    assert [p["plates"] for p in snapshot.data["periods"]] == [1]
+    assert snapshot.narrative is None
+
+
+def test_snapshots_are_versioned_and_pruned(fresh_engine, monkeypatch):
+    monkeypatch.setattr(reports, "REPORT_SNAPSHOTS_KEPT", 2)
+
+    with Session(fresh_engine) as session:
+        for _ in range(3):
+            reports.store_snapshot(session, "weekly", {"summary": "s"})
+        reports.store_snapshot(session, "monthly", {"summary": "m"})
+
+        versions = session.exec(
+            select(ReportSnapshot.version).where(ReportSnapshot.range == "weekly")
+        ).all()
+        assert sorted(versions) == [2, 3]
+        assert reports.latest_snapshot(session, "weekly").version == 3
+        assert reports.latest_snapshot(session, "monthly").version == 1
+        assert reports.latest_snapshot(session, "yearly") is None
+
+
+def test_snapshot_response():
+    snapshot = ReportSnapshot(
+        range="daily", version=4, generated_at=datetime(2024, 1, 2, 3, 4),
+        data={"summary": "s", "trends": {}}, narrative="All quiet.",
+    )
+    assert reports.snapshot_response(snapshot, rich=False) == {
+        "summary": "s", "generated_at": "2024-01-02T03:04:00", "version": 4, "narrative": "All quiet.",
+    }
+    assert reports.snapshot_response(snapshot, rich=True)["trends"] == {}
+
+
+def test_refresh_reports_task_with_narrative(fresh_engine, monkeypatch):
+    prompts = []
+
+    def fake_generate(model, prompt, on_chunk=None, priority=None):
+        prompts.append((prompt, priority))
+        return "Quiet week."
+
+    monkeypatch.setattr(reports.llm.executor, "generate", fake_generate)
+
+    assert reports.refresh_reports(["weekly", "yearly"], narrative=True) == {"weekly": 1, "yearly": 1}
+    assert prompts[0][0].startswith("Summarize the weekly summary")
+    assert prompts[0][1] == reports.PRIORITY_SCHEDULED
+
+    with Session(fresh_engine) as session:
+        assert reports.latest_snapshot(session, "weekly").narrative == "Quiet week."
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from main.backend.models import DetectionRecord, DetectionRollup
+from main.backend.services.rollups import (
+    bucket_start, period_stats, rebuild_rollups, top_plates,
+)
+from main.backend.services.save import save_detections_bulk
+
+test_engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+
+DAY = datetime(2024, 3, 1)
+
+def result(hour, plates):
+    return {
+        "annotated_image_path": "runs/results/a.jpg",
+        "timestamp": (DAY + timedelta(hours=hour, minutes=30)).isoformat(),
+        "detections": [
+            {
+                "plate_crop_path": "c.jpg",
+                "annotated_crop_path": "a.jpg",
+                "plate_string": plate,
+                "plate_confidence": conf,
+                "characters": [],
+            }
+            for plate, conf in plates
+        ],
+    }
+
+@pytest.fixture(autouse=True)
+def session():
+    SQLModel.metadata.create_all(test_engine)
+    with Session(test_engine) as s:
+        save_detections_bulk(s, [
+            ("a.jpg", result(9, [("AAA1", 0.8), ("BBB2", 0.6)])),
+            ("b.jpg", result(9, [("AAA1", 1.0)])),
+            ("c.jpg", result(30, [])),
+        ])
+        yield s
+    SQLModel.metadata.drop_all(test_engine)
+
+def snapshot(session):
+    return sorted(
+        (r.period, r.bucket, r.detection_count, r.plate_count, round(r.confidence_sum, 4))
+        for r in session.exec(select(DetectionRollup)).all()
+    )
+
+def test_bucket_start():
+    ts = datetime(2024, 3, 1, 9, 45, 12)
+    assert bucket_start(ts, "hour") == datetime(2024, 3, 1, 9)
+    assert bucket_start(ts, "day") == datetime(2024, 3, 1)
+
+def test_ingest_updates_rollups(session):
+    assert period_stats(session, DAY) == [
+        {"bucket": DAY, "detections": 2, "plates": 3, "avg_confidence": 0.8},
+        {"bucket": DAY + timedelta(days=1), "detections": 1, "plates": 0, "avg_confidence": None},
+    ]
+    hourly = period_stats(session, DAY, DAY + timedelta(days=1), period="hour")
+    assert [(s["bucket"].hour, s["detections"]) for s in hourly] == [(9, 2)]
+
+def test_ingest_adds_to_existing_buckets(session):
+    save_detections_bulk(session, [("d.jpg", result(10, [("BBB2", 0.4)]))])
+    assert period_stats(session, DAY, DAY + timedelta(days=1))[0]["detections"] == 3
+    assert top_plates(session, DAY) == [{"plate": "AAA1", "count": 2}, {"plate": "BBB2", "count": 2}]
+    assert top_plates(session, DAY, n=1) == [{"plate": "AAA1", "count": 2}]
+
+def test_rebuild_matches_incremental(session):
+    before = snapshot(session)
+    rebuild_rollups(session)
+    session.commit()
+    assert snapshot(session) == before
+
+def test_rebuild_range_after_delete(session):
+    record = session.exec(select(DetectionRecord).where(DetectionRecord.filename == "c.jpg")).one()
+    session.delete(record)
+    session.flush()
+    rebuild_rollups(session, DAY + timedelta(days=1), DAY + timedelta(days=2))
+    session.commit()
+    assert [s["bucket"] for s in period_stats(session, DAY)] == [DAY]
+
+def test_partial_buckets_are_clipped(session):
+    # Both records on the first day are at 09:30
+    start = DAY + timedelta(hours=9, minutes=45)
+    assert period_stats(session, start) == [
+        {"bucket": DAY + timedelta(days=1), "detections": 1, "plates": 0, "avg_confidence": None},
+    ]
+    assert top_plates(session, start) == []
+
+    # The cut-through first day counts its covered part from the raw tables
+    start = DAY + timedelta(hours=9)
+    assert period_stats(session, start)[0] == {"bucket": DAY, "detections": 2, "plates": 3, "avg_confidence": 0.8}
+    assert top_plates(session, start, n=1) == [{"plate": "AAA1", "count": 2}]
+
+    # Both edges inside one hour bucket
+    hourly = period_stats(session, start + timedelta(minutes=10), start + timedelta(minutes=40), period="hour")
+    assert hourly == [{"bucket": start, "detections": 2, "plates": 3, "avg_confidence": 0.8}]
+    assert period_stats(session, DAY, start + timedelta(minutes=20), period="hour") == []
+
@@ -3,7 +3,7 @@ from sqlmodel import SQLModel, Session, create_engine, select
 from datetime import datetime
 
 from main.backend.models import DetectionRecord, PlateInfo, CharacterBox
-from main.backend.services.save import save_detection_to_db  
+from main.backend.services.save import save_detection_to_db, save_detections_bulk
 
 # SQLite in-memory test engine
 test_engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
@@ -89,3 +89,92 @@ def test_save_detection_no_characters(session):
 
     chars = session.exec(select(CharacterBox).where(CharacterBox.detection_id == detection.id)).all()
     assert len(chars) == 0
+
+def test_save_detections_bulk(session):
+    def result(plate_string, n_chars):
+        return {
+            "annotated_image_path": f"runs/results/{plate_string}.jpg",
+            "detections": [
+                {
+                    "plate_crop_path": "runs/results/crop.jpg",
+                    "annotated_crop_path": "runs/results/annotated_crop.jpg",
+                    "plate_string": plate_string,
+                    "plate_confidence": 0.9,
+                    "characters": [
+                        {"box": [i, 0, i + 5, 10], "class_id": i, "confidence": 0.9}
+                        for i in range(n_chars)
+                    ]
+                }
+            ]
+        }
+
+    ids = save_detections_bulk(
+        session,
+        [("bulk1.jpg", result("BULK1", 3)), ("bulk2.jpg", result("BULK2", 2))],
+        user_id=7,
+    )
+
+    assert len(ids) == 2
+    records = [session.get(DetectionRecord, i) for i in ids]
+    assert [r.filename for r in records] == ["bulk1.jpg", "bulk2.jpg"]
+    assert all(r.user_id == 7 for r in records)
+
+    plates = session.exec(select(PlateInfo).where(PlateInfo.detection_id == ids[1])).all()
+    assert [p.plate_string for p in plates] == ["BULK2"]
+    chars = session.exec(select(CharacterBox).where(CharacterBox.detection_id == ids[0])).all()
+    assert len(chars) == 3
+
+def test_save_detections_bulk_empty(session):
+    assert save_detections_bulk(session, []) == []
+
+def test_save_links_characters_to_their_plate(session):
+    result = {
+        "annotated_image_path": "runs/results/annotated.jpg",
+        "detections": [
+            {
+                "plate_crop_path": "runs/results/crop1.jpg",
+                "annotated_crop_path": "runs/results/annotated_crop1.jpg",
+                "plate_string": plate_string,
+                "plate_confidence": 0.9,
+                "characters": [
+                    {"box": [i, 0, i + 5, 10], "class_id": i, "confidence": 0.9}
+                    for i in range(len(plate_string))
+                ]
+            }
+            for plate_string in ["AB", "CDE"]
+        ]
+    }
+
+    detection = save_detection_to_db(session, "two_plates.jpg", result)
+
+    plates = session.exec(
+        select(PlateInfo).where(PlateInfo.detection_id == detection.id).order_by(PlateInfo.id)
+    ).all()
+    assert [len(p.characters) for p in plates] == [2, 3]
+    assert all(c.detection_id == detection.id for p in plates for c in p.characters)
+
+
+def test_save_without_artifacts_points_at_render_urls(session):
+    result = {
+        "annotated_image_path": None,
+        "annotated_image": None,
+        "detections": [{
+            "plate_box": [1, 2, 30, 40],
+            "plate_crop_path": None,
+            "annotated_crop_path": None,
+            "plate_string": "LAZY1",
+            "plate_confidence": 0.8,
+            "characters": [],
+        }],
+    }
+    detection_id, = save_detections_bulk(session, [("lazy.jpg", result)])
+
+    record = session.get(DetectionRecord, detection_id)
+    plate = session.exec(select(PlateInfo).where(PlateInfo.detection_id == detection_id)).one()
+    assert record.annotated_image == f"/render/detections/{detection_id}/annotated.jpg"
+    assert plate.plate_crop_path == f"/render/plates/{plate.id}/crop.jpg"
+    assert plate.annotated_crop_path == f"/render/plates/{plate.id}/annotated.jpg"
+    assert (plate.x1, plate.y1, plate.x2, plate.y2) == (1, 2, 30, 40)
+    # Written back for the caller's response
+    assert result["annotated_image"] == record.annotated_image
+    assert result["detections"][0]["plate_crop_path"] == plate.plate_crop_path
@@ -0,0 +1,57 @@
+from main.backend.services.tracking import PlateTracker, iou
+
+
+def reading(plate_string):
+    return {"plate_string": plate_string, "plate_confidence": 0.9, "characters": []}
+
+
+def test_iou():
+    assert iou([0, 0, 10, 10], [0, 0, 10, 10]) == 1.0
+    assert iou([0, 0, 10, 10], [20, 20, 30, 30]) == 0.0
+    assert round(iou([0, 0, 10, 10], [5, 0, 15, 10]), 3) == 0.333
+
+
+def test_update_associates_overlapping_boxes():
+    tracker = PlateTracker(iou_thresh=0.3)
+    first = tracker.update([[0, 0, 10, 10], [100, 100, 120, 110]])
+    second = tracker.update([[101, 100, 121, 110], [1, 0, 11, 10]])
+
+    assert second[0] is first[1]
+    assert second[1] is first[0]
+    assert first[0].hits == 2
+
+
+def test_unmatched_tracks_expire():
+    tracker = PlateTracker(max_missed=1)
+    tracker.update([[0, 0, 10, 10]])
+    tracker.update([])
+    assert len(tracker.tracks) == 1
+    tracker.update([])
+    assert tracker.tracks == []
+
+
+def test_converges_after_agreeing_readings():
+    tracker = PlateTracker(min_agreement=3, min_share=0.6)
+    track = tracker.update([[0, 0, 10, 10]])[0]
+
+    for plate_string in ["ABC123", "A8C123", "ABC123"]:
+        track.observe(reading(plate_string))
+        assert not tracker.converged(track)
+
+    track.observe(reading("ABC123"))
+    assert tracker.converged(track)
+    assert track.detection["plate_string"] == "ABC123"
+
+
+def test_mark_emitted_only_first_and_settled_string():
+    tracker = PlateTracker(min_agreement=2, min_share=0.6)
+    track = tracker.update([[0, 0, 10, 10]])[0]
+
+    track.observe(reading("A8C123"))
+    assert tracker.mark_emitted(track, "A8C123")
+    track.observe(reading("ABC123"))
+    assert not tracker.mark_emitted(track, "ABC123")
+    track.observe(reading("ABC123"))
+    track.observe(reading("ABC123"))
+    assert tracker.mark_emitted(track, "ABC123")
+    assert not tracker.mark_emitted(track, "ABC123")
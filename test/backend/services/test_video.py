@@ -0,0 +1,165 @@
+import cv2
+import numpy as np
+from unittest.mock import patch
+
+from main.backend.services.video import FrameSampler, VideoPipeline
+
+
+def write_video(path, n_frames=30, moving=True):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for i in range(n_frames):
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        if moving:
+            frame[:, (i * 2) % 64:(i * 2) % 64 + 8] = 255
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def fake_detect_batch(frames, plate_conf_thresh=0.5, char_conf_thresh=0.5, tracker=None, artifacts=True):
+    return [
+        {"annotated_image": "/static/results/fake.jpg", "detections": []}
+        for _ in frames
+    ]
+
+
+def plate_detect_batch(frames, plate_conf_thresh=0.5, char_conf_thresh=0.5, tracker=None, artifacts=True):
+    return [
+        {"annotated_image": "/static/results/fake.jpg", "detections": [{"plate_string": "ABC123"}]}
+        for _ in frames
+    ]
+
+
+def test_sampler_backs_off_on_static_scene():
+    sampler = FrameSampler(base_stride=1, max_stride=8, motion_thresh=1.0)
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+
+    sampled = [i for i in range(40) if sampler.should_sample(i, frame)]
+
+    # First frame, then only when max_stride forces a refresh
+    assert sampled[0] == 0
+    assert len(sampled) < 10
+    assert sampler.static_skips > 0
+
+
+def test_sampler_resets_on_motion():
+    sampler = FrameSampler(base_stride=2, max_stride=16, motion_thresh=1.0)
+    sampler.stride = 16
+    sampler.should_sample(0, np.zeros((48, 64, 3), dtype=np.uint8))
+    assert sampler.should_sample(16, np.full((48, 64, 3), 255, dtype=np.uint8))
+    assert sampler.stride == 2
+
+
+@patch("main.backend.services.video.save_detections_bulk")
+@patch("main.backend.services.video.detect_batch", side_effect=plate_detect_batch)
+@patch("main.backend.services.video.write_artifacts")
+def test_pipeline_streams_and_persists_in_chunks(mock_write, mock_detect, mock_save, tmp_path):
+    video = write_video(tmp_path / "cam.avi")
+    pipeline = VideoPipeline(
+        video,
+        sampler=FrameSampler(base_stride=3, motion_thresh=0.0),
+        track=False,
+        batch_size=4,
+        persist_chunk=4,
+        drop_when_full=False,
+    )
+
+    results = list(pipeline.run())
+
+    stats = pipeline.stats
+    assert stats["frames_decoded"] == 30
+    assert stats["frames_sampled"] == 10
+    assert stats["frames_skipped"] == 20
+    assert stats["frames_dropped"] == 0
+    assert stats["frames_processed"] == len(results) == 10
+    assert stats["records_saved"] == 10
+    assert mock_write.call_count == 10
+    assert [r["frame"] for r in results] == list(range(0, 30, 3))
+
+    # 10 frames flushed once at least 4 are pending, remainder at the end
+    sizes = [len(c[0][1]) for c in mock_save.call_args_list]
+    assert sum(sizes) == 10
+    assert all(n >= 4 for n in sizes[:-1])
+    assert mock_save.call_args[0][1][-1][0] == "cam.avi#frame27"
+
+
+@patch("main.backend.services.video.save_detections_bulk")
+@patch("main.backend.services.video.detect_batch", side_effect=fake_detect_batch)
+@patch("main.backend.services.video.write_artifacts")
+def test_pipeline_skips_empty_frames(mock_write, mock_detect, mock_save, tmp_path):
+    video = write_video(tmp_path / "cam.avi", n_frames=10)
+    pipeline = VideoPipeline(video, sampler=FrameSampler(base_stride=1, motion_thresh=0.0), drop_when_full=False)
+
+    results = list(pipeline.run())
+
+    assert len(results) == 10
+    assert mock_save.call_count == 0
+    assert pipeline.stats["records_saved"] == 0
+    assert pipeline.stats["empty_frames_skipped"] == 10
+    assert mock_write.call_count == 0
+
+    pipeline = VideoPipeline(video, sampler=FrameSampler(base_stride=1, motion_thresh=0.0),
+                             drop_when_full=False, persist_empty=True)
+    list(pipeline.run())
+    assert pipeline.stats["records_saved"] == 10
+
+
+@patch("main.backend.services.video.detect_batch", side_effect=fake_detect_batch)
+def test_pipeline_drops_frames_under_backpressure(mock_detect, tmp_path):
+    video = write_video(tmp_path / "cam.avi", n_frames=60)
+    pipeline = VideoPipeline(
+        video,
+        sampler=FrameSampler(base_stride=1, max_stride=1, motion_thresh=0.0),
+        queue_size=1,
+        batch_size=1,
+        persist=False,
+    )
+
+    def slow_detect(frames, *args, **kwargs):
+        import time
+        time.sleep(0.01)
+        return fake_detect_batch(frames)
+
+    mock_detect.side_effect = slow_detect
+    results = list(pipeline.run())
+
+    stats = pipeline.stats
+    assert stats["frames_dropped"] > 0
+    assert stats["frames_sampled"] == stats["frames_processed"] + stats["frames_dropped"]
+    assert len(results) == stats["frames_processed"]
+    assert stats["records_saved"] == 0
+
+
+@patch("main.backend.services.video.save_detections_bulk")
+@patch("main.backend.services.video.detect_batch")
+@patch("main.backend.services.video.write_artifacts")
+def test_pipeline_persists_only_new_tracked_plates(mock_write, mock_detect, mock_save, tmp_path):
+    seen = []
+
+    def tracked_detect(frames, *args, tracker=None, artifacts=True):
+        results = []
+        for _ in frames:
+            results.append({
+                "annotated_image": "/static/results/fake.jpg",
+                "detections": [{"plate_string": "ABC123", "track_id": 1, "is_new": not seen}],
+            })
+            seen.append(True)
+        return results
+
+    mock_detect.side_effect = tracked_detect
+    video = write_video(tmp_path / "cam.avi", n_frames=10)
+    pipeline = VideoPipeline(
+        video,
+        sampler=FrameSampler(base_stride=1, motion_thresh=0.0),
+        drop_when_full=False,
+    )
+
+    results = list(pipeline.run())
+
+    assert len(results) == 10
+    assert mock_save.call_count == 1
+    assert len(mock_save.call_args[0][1]) == 1
+    assert pipeline.stats["records_saved"] == 1
+    assert pipeline.stats["plates_deduplicated"] == 9
+    # Only the saved frame gets image files
+    assert mock_write.call_count == 1
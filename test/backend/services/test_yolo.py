@@ -1,7 +1,15 @@
 import pytest
 import numpy as np
 from unittest.mock import patch, MagicMock
-from main.backend.services.yolo import detect_plates_and_characters, group_and_sort_characters
+from main.backend.services import yolo
+from main.backend.services.artifacts import ArtifactWriter
+from main.backend.services.yolo import detect_batch, detect_plates_and_characters, group_and_sort_characters
+
+
+@pytest.fixture(autouse=True)
+def sync_artifacts(monkeypatch):
+    # Writes happen inside the tests, where cv2.imwrite is patched
+    monkeypatch.setattr(yolo, "artifact_writer", ArtifactWriter(mode="sync"))
 
 def test_group_and_sort_characters_single_row():
     chars = [
@@ -54,4 +62,165 @@ def test_detect_plates_and_characters(mock_resize, mock_imwrite, mock_char_model
     assert result["detections"][0]["plate_string"] != "UNKNOWN"
     assert "plate_crop_path" in result["detections"][0]
     assert "annotated_crop_path" in result["detections"][0]
-    assert result["detections"][0]["characters"][0]["class_id"] == 1
\ No newline at end of file
+    assert result["detections"][0]["characters"][0]["class_id"] == 1
+
+def _fake_plate_result(n_plates):
+    fake_image = MagicMock()
+    fake_image.__getitem__.return_value = MagicMock(size=1)
+
+    result = MagicMock()
+    result.orig_img = fake_image
+    boxes = []
+    for _ in range(n_plates):
+        box = MagicMock()
+        box.tolist.return_value = [10, 10, 50, 50]
+        boxes.append(box)
+    result.boxes.xyxy = boxes
+    result.boxes.conf = [0.9] * n_plates
+    result.boxes.cls = [0] * n_plates
+    return result
+
+
+def _fake_char_result(class_id):
+    result = MagicMock()
+    box = MagicMock()
+    box.tolist.return_value = [5, 5, 15, 15]
+    result.boxes.xyxy = [box]
+    result.boxes.cls = [class_id]
+    result.boxes.conf = [0.95]
+    return result
+
+
+@patch("main.backend.services.yolo.plate_model")
+@patch("main.backend.services.yolo.char_model")
+@patch("main.backend.services.yolo.cv2.imwrite")
+@patch("main.backend.services.yolo.cv2.resize")
+def test_detect_batch_runs_char_model_once(mock_resize, mock_imwrite, mock_char_model, mock_plate_model):
+    mock_plate_model.return_value = [_fake_plate_result(2), _fake_plate_result(1)]
+    mock_char_model.return_value = [_fake_char_result(1), _fake_char_result(2), _fake_char_result(3)]
+    mock_resize.return_value = np.zeros((640, 640, 3), dtype=np.uint8)
+
+    results = detect_batch(["a.jpg", "b.jpg"])
+
+    mock_plate_model.assert_called_once_with(["a.jpg", "b.jpg"])
+    mock_char_model.assert_called_once()
+    assert len(mock_char_model.call_args[0][0]) == 3
+
+    assert len(results) == 2
+    assert [d["plate_string"] for d in results[0]["detections"]] == ["1", "2"]
+    assert [d["plate_string"] for d in results[1]["detections"]] == ["3"]
+
+
+def test_detect_batch_empty():
+    assert detect_batch([]) == []
+
+
+@patch("main.backend.services.yolo.plate_model")
+@patch("main.backend.services.yolo.char_model")
+@patch("main.backend.services.yolo.cv2.imwrite")
+@patch("main.backend.services.yolo.cv2.resize")
+def test_detect_batch_with_tracker_skips_converged_plates(mock_resize, mock_imwrite, mock_char_model, mock_plate_model):
+    from main.backend.services.tracking import PlateTracker
+
+    tracker = PlateTracker(min_agreement=2)
+    mock_resize.return_value = np.zeros((640, 640, 3), dtype=np.uint8)
+    mock_char_model.side_effect = lambda crops, **kwargs: [_fake_char_result(7) for _ in crops]
+
+    frames = []
+    for _ in range(4):
+        mock_plate_model.return_value = [_fake_plate_result(1)]
+        frames.append(detect_batch(["frame.jpg"], tracker=tracker)[0])
+
+    # Two readings to converge, then the character model is skipped
+    assert mock_char_model.call_count == 2
+    assert tracker.ocr_skipped == 2
+    assert [f["detections"][0]["plate_string"] for f in frames] == ["7"] * 4
+    assert len({f["detections"][0]["track_id"] for f in frames}) == 1
+    assert [f["detections"][0]["is_new"] for f in frames] == [True, False, False, False]
+
+
+@patch("main.backend.services.yolo.plate_model")
+@patch("main.backend.services.yolo.char_model")
+@patch("main.backend.services.yolo.cv2.imwrite")
+@patch("main.backend.services.yolo.cv2.resize")
+def test_detect_batch_caches_by_content(mock_resize, mock_imwrite, mock_char_model, mock_plate_model, monkeypatch):
+    from main.backend.services import yolo
+    from main.backend.services.detection_cache import DetectionCache
+
+    monkeypatch.setattr(yolo, "detection_cache", DetectionCache(max_entries=8))
+    mock_resize.return_value = np.zeros((640, 640, 3), dtype=np.uint8)
+    mock_plate_model.side_effect = lambda images: [_fake_plate_result(1) for _ in images]
+    mock_char_model.side_effect = lambda crops, **kwargs: [_fake_char_result(4) for _ in crops]
+
+    frame = np.zeros((8, 8, 3), np.uint8)
+    other = np.ones((8, 8, 3), np.uint8)
+    first = detect_batch([frame, frame.copy()])
+    # Same pixels in one batch are detected once
+    assert len(mock_plate_model.call_args[0][0]) == 1
+    assert first[0] == first[1] and first[0] is not first[1]
+
+    again = detect_batch([frame, other])
+    assert len(mock_plate_model.call_args[0][0]) == 1
+    assert mock_plate_model.call_args[0][0][0] is other
+    assert again[0] == first[0]
+
+    # Different thresholds are a different entry
+    detect_batch([frame], plate_conf_thresh=0.6)
+    assert mock_plate_model.call_count == 3
+    assert yolo.detection_cache.stats()["hits"] == 1
+
+    # Box-only results are cached apart from ones with artifacts
+    boxes = detect_batch([frame], artifacts=False)
+    assert mock_plate_model.call_count == 4
+    assert boxes[0]["annotated_image"] is None
+    assert detect_batch([frame], artifacts=False) == boxes
+    assert mock_plate_model.call_count == 4
+    assert yolo.detection_cache.stats()["hits"] == 2
+
+
+@patch("main.backend.services.yolo.plate_model")
+@patch("main.backend.services.yolo.char_model")
+@patch("main.backend.services.yolo.cv2.resize")
+def test_detect_batch_from_bytes_without_artifacts(mock_resize, mock_char_model, mock_plate_model, monkeypatch):
+    import cv2
+
+    writes = []
+    monkeypatch.setattr(yolo.artifact_writer, "submit", lambda path, image: writes.append(path))
+    mock_resize.return_value = np.zeros((640, 640, 3), dtype=np.uint8)
+    mock_plate_model.return_value = [_fake_plate_result(1)]
+    mock_char_model.return_value = [_fake_char_result(5)]
+
+    frame = np.full((16, 16, 3), 200, np.uint8)
+    result = detect_plates_and_characters(cv2.imencode(".png", frame)[1].tobytes(), artifacts=False)
+
+    decoded = mock_plate_model.call_args[0][0][0]
+    assert np.array_equal(decoded, frame)
+    assert result["annotated_image"] is None
+    assert result["detections"][0]["plate_string"] == "5"
+    assert result["detections"][0]["plate_crop_path"] is None
+    assert writes == []
+
+
+def test_write_artifacts_from_boxes(monkeypatch, tmp_path):
+    import cv2
+
+    monkeypatch.setattr(yolo, "RESULTS_DIR", tmp_path)
+    image = np.zeros((60, 80, 3), dtype=np.uint8)
+    result = {
+        "annotated_image": None,
+        "detections": [{
+            "plate_box": [10, 10, 50, 30],
+            "plate_crop_path": None,
+            "annotated_crop_path": None,
+            "plate_string": "AB",
+            "plate_confidence": 0.9,
+            "characters": [{"box": [5, 5, 15, 15], "class_id": 10, "confidence": 0.9}],
+        }],
+    }
+
+    yolo.write_artifacts(image, result)
+
+    paths = [p for p in yolo.artifact_paths(result)]
+    assert all(p is not None and p.exists() for p in paths)
+    assert cv2.imread(str(paths[1])).shape == (20, 40, 3)
+    assert cv2.imread(str(paths[2])).shape == (640, 640, 3)
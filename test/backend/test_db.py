@@ -0,0 +1,18 @@
+from sqlalchemy import text
+
+from main.backend.db import create_db_engine, SQLITE_BUSY_TIMEOUT_MS
+
+
+def test_sqlite_engine_uses_wal_and_busy_timeout(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        # 1 == NORMAL
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == SQLITE_BUSY_TIMEOUT_MS
+
+
+def test_in_memory_sqlite_skips_pragmas():
+    engine = create_db_engine("sqlite:///:memory:")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "memory"
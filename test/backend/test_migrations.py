@@ -0,0 +1,125 @@
+import threading
+
+from sqlalchemy import create_engine, inspect, text
+
+from main.backend.migrations import MIGRATIONS, add_character_plate_id, run_migrations
+
+LEGACY_SCHEMA = [
+    'CREATE TABLE "user" (id INTEGER PRIMARY KEY, email VARCHAR)',
+    "CREATE TABLE detectionrecord (id INTEGER PRIMARY KEY, filename VARCHAR, timestamp DATETIME, "
+    "annotated_image VARCHAR, user_id INTEGER)",
+    "CREATE TABLE plateinfo (id INTEGER PRIMARY KEY, detection_id INTEGER, plate_crop_path VARCHAR, "
+    "annotated_crop_path VARCHAR, plate_string VARCHAR, plate_confidence FLOAT)",
+    "CREATE TABLE characterbox (id INTEGER PRIMARY KEY, detection_id INTEGER, class_id INTEGER, "
+    "confidence FLOAT, x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER)",
+]
+
+
+def legacy_engine():
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        for stmt in LEGACY_SCHEMA:
+            conn.execute(text(stmt))
+        conn.execute(text("INSERT INTO detectionrecord VALUES (1, 'a.jpg', '2024-01-01', 'x', NULL), (2, 'b.jpg', '2024-01-01', 'y', NULL)"))
+        # detection 1: "AB" + "UNKNOWN" + "C"; detection 2: counts don't match
+        conn.execute(text(
+            "INSERT INTO plateinfo VALUES (1, 1, 'c', 'c', 'AB', 0.9), (2, 1, 'c', 'c', 'UNKNOWN', 0.5), "
+            "(3, 1, 'c', 'c', 'C', 0.8), (4, 2, 'c', 'c', 'XYZ', 0.9)"
+        ))
+        conn.execute(text(
+            "INSERT INTO characterbox VALUES (1, 1, 10, 0.9, 0, 0, 1, 1), (2, 1, 11, 0.9, 0, 0, 1, 1), "
+            "(3, 1, 12, 0.9, 0, 0, 1, 1), (4, 2, 33, 0.9, 0, 0, 1, 1)"
+        ))
+    return engine
+
+
+def test_add_character_plate_id_backfills_by_order():
+    engine = legacy_engine()
+    run_migrations(engine)
+
+    assert "plate_id" in {c["name"] for c in inspect(engine).get_columns("characterbox")}
+    with engine.connect() as conn:
+        links = dict(conn.execute(text("SELECT id, plate_id FROM characterbox")).all())
+    assert links == {1: 1, 2: 1, 3: 3, 4: None}
+
+
+def test_add_character_plate_id_is_idempotent():
+    engine = legacy_engine()
+    run_migrations(engine)
+    with engine.begin() as conn:
+        add_character_plate_id(conn)
+        links = dict(conn.execute(text("SELECT id, plate_id FROM characterbox")).all())
+    assert links[3] == 3
+
+
+def test_run_migrations_records_versions_once():
+    engine = legacy_engine()
+    assert run_migrations(engine) == [version for version, _, _ in MIGRATIONS]
+    assert run_migrations(engine) == []
+
+    with engine.connect() as conn:
+        names = conn.execute(text("SELECT name FROM schema_version ORDER BY version")).scalars().all()
+    assert names == [name for _, name, _ in MIGRATIONS]
+
+
+def test_indexes_are_added_to_existing_tables():
+    engine = legacy_engine()
+    run_migrations(engine)
+
+    insp = inspect(engine)
+    assert "ix_detectionrecord_timestamp" in {i["name"] for i in insp.get_indexes("detectionrecord")}
+    assert {"ix_plateinfo_detection_id", "ix_plateinfo_plate_string"} <= {i["name"] for i in insp.get_indexes("plateinfo")}
+    assert "ix_characterbox_plate_id" in {i["name"] for i in insp.get_indexes("characterbox")}
+    assert "ix_user_email" in {i["name"] for i in insp.get_indexes("user")}
+
+
+def test_plate_search_index_is_backfilled():
+    engine = legacy_engine()
+    run_migrations(engine)
+
+    with engine.connect() as conn:
+        keys = dict(conn.execute(text("SELECT id, plate_key FROM plateinfo")).all())
+        grams = conn.execute(text("SELECT trigram FROM platetrigram WHERE plate_id = 4")).scalars().all()
+    assert keys[1] == "A8"
+    assert keys[2] == "UNKN0WN"
+    assert set(grams) == {"^XY", "XY2", "Y2$"}
+
+
+def test_rollups_are_backfilled():
+    engine = legacy_engine()
+    run_migrations(engine)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT detection_count, plate_count FROM detectionrollup WHERE period = 'day'"
+        )).all()
+        top = conn.execute(text(
+            "SELECT plate_string, count FROM platerollup WHERE period = 'day' ORDER BY plate_string"
+        )).all()
+    assert rows == [(2, 4)]
+    assert top[0] == ("AB", 1)
+
+
+def test_concurrent_runs_apply_each_version_once(tmp_path):
+    # Workers starting together each run migrations on their own connection
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    with create_engine(url).begin() as conn:
+        for stmt in LEGACY_SCHEMA:
+            conn.execute(text(stmt))
+
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(run_migrations(create_engine(url, connect_args={"timeout": 30})))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert sorted(v for applied in results for v in applied) == [version for version, _, _ in MIGRATIONS]